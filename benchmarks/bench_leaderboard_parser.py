@@ -0,0 +1,89 @@
+"""Compare the legacy BeautifulSoup + pandas leaderboard parser with the
+event driven parser over the saved leaderboard fixtures.
+
+    uv run benchmarks/bench_leaderboard_parser.py [--repeat N]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from strava.leaderboard import parse_leaderboard  # noqa: E402
+
+FIXTURES = ROOT / "tests" / "fixtures"
+
+
+def legacy_parse_leaderboard(text: str) -> pd.DataFrame:
+    """The parser used by parse_strava_leaderboard before the event driven one."""
+    soup = BeautifulSoup(text, 'html.parser')
+
+    headers = soup.find_all('th')
+    column_names = [header.get_text(strip=True) for header in headers]
+
+    leaderboard_data = []
+    leaderboard_rows = soup.find_all('tr', class_='')
+
+    for row in leaderboard_rows:
+        cols = row.find_all('td')
+        if len(cols) >= len(column_names):
+            athlete_link = cols[1].find('a')
+            effort_link = cols[2].find('a')
+
+            entry = {
+                'rank': cols[0].get_text(strip=True),
+                'athlete_name': athlete_link.get_text(strip=True) if athlete_link else '',
+                'athlete_id': athlete_link['href'].split('/')[-1] if athlete_link else '',
+                'date': effort_link.get_text(strip=True) if effort_link else '',
+                'effort_id': effort_link['href'].split('/')[-1] if effort_link else '',
+                'speed': cols[3].get_text(strip=True).replace(' km/h', ''),
+                'heart_rate': cols[4].get_text(strip=True).replace(' bpm', ''),
+                'power': cols[5].get_text(strip=True).replace(' W', '').replace('-', '')
+            }
+
+            if 'VAM' in column_names:
+                vam_index = column_names.index('VAM')
+                entry['VAM'] = cols[vam_index].get_text(strip=True)
+
+            time_index = len(column_names) - 1
+            entry['time'] = cols[time_index].get_text(strip=True)
+
+            leaderboard_data.append(entry)
+
+    df = pd.DataFrame(leaderboard_data)
+
+    if not df.empty:
+        numeric_columns = ['rank', 'speed', 'heart_rate', 'power']
+        if 'VAM' in df.columns:
+            numeric_columns.append('VAM')
+        for col in numeric_columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    return df
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="Parses per fixture and parser")
+    args = parser.parse_args()
+
+    print(f"{'fixture':<28} {'rows':>5} {'legacy ms':>10} {'new ms':>8} {'speedup':>8}")
+    for path in sorted(FIXTURES.glob("leaderboard_*.html")):
+        text = path.read_text()
+
+        legacy = legacy_parse_leaderboard(text)
+        new = parse_leaderboard(text)
+        assert len(legacy) == len(new), f"{path.name}: {len(legacy)} legacy rows, {len(new)} new rows"
+
+        legacy_time = min(timeit.repeat(lambda: legacy_parse_leaderboard(text), number=1, repeat=args.repeat))
+        new_time = min(timeit.repeat(lambda: parse_leaderboard(text), number=1, repeat=args.repeat))
+        print(f"{path.name:<28} {len(new):>5} {legacy_time * 1000:>10.2f} {new_time * 1000:>8.2f} {legacy_time / new_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
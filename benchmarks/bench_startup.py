@@ -0,0 +1,96 @@
+"""Measure the cold start of the MCP server over stdio: the time from launch
+to the answer of the first tools/list, and the peak RSS of the process.
+
+    uv run benchmarks/bench_startup.py [--repeat N]
+
+MCP hosts spawn the server once per session, so this is latency users feel.
+"""
+import argparse
+import json
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER = ROOT / "src" / "server.py"
+
+INITIALIZE = {
+    "jsonrpc": "2.0",
+    "id": 1,
+    "method": "initialize",
+    "params": {
+        "protocolVersion": "2024-11-05",
+        "capabilities": {},
+        "clientInfo": {"name": "bench_startup", "version": "0"},
+    },
+}
+INITIALIZED = {"jsonrpc": "2.0", "method": "notifications/initialized"}
+LIST_TOOLS = {"jsonrpc": "2.0", "id": 2, "method": "tools/list"}
+
+
+def send(process: subprocess.Popen, message: Dict) -> None:
+    process.stdin.write(json.dumps(message).encode() + b"\n")
+    process.stdin.flush()
+
+
+def wait_for(process: subprocess.Popen, request_id: int) -> Dict:
+    for line in process.stdout:
+        message = json.loads(line)
+        if message.get("id") == request_id:
+            return message
+    raise RuntimeError(f"The server exited before answering request {request_id}")
+
+
+def measure_once() -> Tuple[float, float, int]:
+    """Start the server, list its tools and stop it.
+
+    Returns:
+        The seconds to the initialize answer, the seconds to the tools/list
+        answer and the number of tools listed
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, str(SERVER)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        send(process, INITIALIZE)
+        wait_for(process, 1)
+        initialized = time.perf_counter() - start
+        send(process, INITIALIZED)
+        send(process, LIST_TOOLS)
+        tools = wait_for(process, 2)["result"]["tools"]
+        listed = time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        process.wait(timeout=10)
+    return initialized, listed, len(tools)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Number of cold starts")
+    args = parser.parse_args()
+
+    runs = [measure_once() for _ in range(args.repeat)]
+    # ru_maxrss is the largest child so far, in KiB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024
+
+    print(f"{'runs':<24}{args.repeat}")
+    print(f"{'tools listed':<24}{runs[0][2]}")
+    print(f"{'initialize (median)':<24}{statistics.median(run[0] for run in runs) * 1000:.0f} ms")
+    print(f"{'tools/list (median)':<24}{statistics.median(run[1] for run in runs) * 1000:.0f} ms")
+    print(f"{'tools/list (max)':<24}{max(run[1] for run in runs) * 1000:.0f} ms")
+    print(f"{'peak RSS':<24}{peak_rss / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
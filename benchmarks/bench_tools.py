@@ -0,0 +1,348 @@
+"""Measure the tools end to end against local mock upstreams, without touching
+Strava or Nominatim: cold and warm latency per tool, throughput under
+concurrent sessions, parse time and memory, written to a JSON report.
+
+    uv run benchmarks/bench_tools.py [--sessions 8] [--calls 25] [--latency 80] \
+        [--rate-limited 0.0] [--output report.json] [--compare baseline.json]
+
+The server runs as a subprocess on the streamable HTTP transport with an empty
+cache directory, its upstreams pointed at benchmarks/mock_upstreams.py.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from mcp import ClientSession
+from mcp.client.streamable_http import streamablehttp_client
+
+ROOT = Path(__file__).resolve().parent.parent
+SERVER = ROOT / "src" / "server.py"
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from mock_upstreams import LEADERBOARDS, MockUpstreams, start  # noqa: E402
+
+REPORT_VERSION = 1
+
+# Alpe d'Huez, where the recorded segments are
+LATITUDE, LONGITUDE = 45.0736, 6.0394
+BOX = {"southwest_lat": 45.052859, "southwest_lon": 5.992628, "northeast_lat": 45.101033, "northeast_lon": 6.085844}
+SEGMENT_IDS = [652851, 24847998, 21476037, 17407860, 20977032, 10042913]
+
+
+def igc_track(points: List[Tuple[float, float]], fixes: int) -> str:
+    """An IGC log of `fixes` fixes spread along straight lines between points, one a second."""
+    records = ["AXXXBENCH", "HFDTEDATE:010725,01"]
+    legs = len(points) - 1
+    for fix in range(fixes):
+        position = fix / (fixes - 1) * legs
+        leg = min(int(position), legs - 1)
+        fraction = position - leg
+        (start_lat, start_lon), (end_lat, end_lon) = points[leg], points[leg + 1]
+        latitude = start_lat + (end_lat - start_lat) * fraction
+        longitude = start_lon + (end_lon - start_lon) * fraction
+        time_of_day = 36000 + fix
+        records.append(
+            f"B{time_of_day // 3600:02d}{time_of_day // 60 % 60:02d}{time_of_day % 60:02d}"
+            f"{int(latitude):02d}{round(latitude % 1 * 60000):05d}N{int(longitude):03d}{round(longitude % 1 * 60000):05d}E"
+            f"A{700 + fix // 4:05d}{700 + fix // 4:05d}"
+        )
+    return "\n".join(records) + "\n"
+
+
+# Tool calls each session cycles through, by scenario name
+SCENARIOS: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "geocode": ("get_latitude_and_longitude_tool", {"address": "Alpe d'Huez"}),
+    "reverse_geocode": ("get_addresses_tool", {"coordinates": [[45.0909, 6.0678], [45.0553, 6.0309]]}),
+    "nearby_segments": ("get_nearby_segments_tool", BOX),
+    "exhaustive_segments": ("get_nearby_segments_tool", {**BOX, "exhaustive": True}),
+    "segments_near": ("find_segments_near_tool", {"latitude": LATITUDE, "longitude": LONGITUDE, "radius": 5, "output": "json"}),
+    "segments_near_address": ("find_segments_near_address_tool", {"address": "Alpe d'Huez", "include_attempts": True}),
+    "segments_along_route": ("find_segments_along_route_tool", {"route": [[45.0553, 6.0309], [45.0909, 6.0678]], "width": 1}),
+    "segments_on_track": ("find_segments_on_track_tool", {"content": igc_track([(45.0553, 6.0309), (45.0736, 6.0394), (45.0909, 6.0678)], 3600), "format": "igc"}),
+    "segment_details": ("get_segment_details_tool", {"segment_ids": SEGMENT_IDS}),
+    "climb_attempts": ("get_number_of_climb_attempts_on_the_year_tool", {"segment_id": 652851}),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """Summarise latencies in seconds as milliseconds."""
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": at(0.5),
+        "p95_ms": at(0.95),
+        "p99_ms": at(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def git_revision() -> Dict[str, Any]:
+    def git(*args: str) -> str:
+        return subprocess.run(["git", *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+
+    return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def peak_rss_mib(pid: int) -> Optional[float]:
+    """Peak RSS of a running process, from /proc on Linux."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def start_server(port: int, upstreams_port: int, cache_dir: str) -> subprocess.Popen:
+    upstreams = f"http://127.0.0.1:{upstreams_port}"
+    env = {
+        **os.environ,
+        "STRAVA_API_BASE": f"{upstreams}/api/v3",
+        "STRAVA_WEB_BASE": upstreams,
+        "NOMINATIM_API_BASE": upstreams,
+        "STRAVA_ACCESS_TOKEN": "benchmark",
+        "HIKE_AND_FLY_CACHE_DIR": cache_dir,
+        "GEOCODING_BACKEND": "remote",
+        # The mock upstreams have no usage policy to respect
+        "NOMINATIM_REQUESTS_PER_SECOND": "1000",
+        "LEADERBOARD_REQUESTS_PER_SECOND": "1000",
+        "LOG_LEVEL": "ERROR",
+    }
+    return subprocess.Popen(
+        [sys.executable, str(SERVER), "--transport", "streamable-http", "--port", str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def wait_for_port(port: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            _, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"The server did not listen on port {port} within {timeout} s")
+            await asyncio.sleep(0.05)
+
+
+async def call(session: ClientSession, scenario: str) -> Tuple[float, bool]:
+    """Call the tool of a scenario.
+
+    Returns:
+        The latency in seconds and whether the call succeeded
+    """
+    name, arguments = SCENARIOS[scenario]
+    started = time.perf_counter()
+    try:
+        result = await session.call_tool(name, arguments)
+        ok = not result.isError
+    except Exception:
+        ok = False
+    return time.perf_counter() - started, ok
+
+
+async def run_session(url: str, scenarios: List[str], calls: int, latencies: Dict[str, List[float]], errors: Dict[str, int]) -> None:
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            for index in range(calls):
+                scenario = scenarios[index % len(scenarios)]
+                latency, ok = await call(session, scenario)
+                latencies.setdefault(scenario, []).append(latency)
+                if not ok:
+                    errors[scenario] = errors.get(scenario, 0) + 1
+
+
+async def server_metrics(url: str) -> Dict[str, Any]:
+    async with streamablehttp_client(url) as (read, write, _):
+        async with ClientSession(read, write) as session:
+            await session.initialize()
+            result = await session.call_tool("get_metrics_tool", {})
+            if result.structuredContent:
+                return result.structuredContent.get("result", result.structuredContent)
+            return json.loads(result.content[0].text)
+
+
+def measure_parsing(repeat: int) -> Dict[str, float]:
+    """Best in-process parse times, in milliseconds, of the recorded answers."""
+    from geometry import decode_polyline
+    from strava.leaderboard import parse_leaderboard
+
+    explore = (Path(__file__).resolve().parent / "fixtures" / "strava_explore.json").read_text()
+    polylines = [segment["points"] for segment in json.loads(explore)["segments"]]
+    timings = {
+        "strava_explore_json_ms": min(timeit.repeat(lambda: json.loads(explore), number=1, repeat=repeat)) * 1000,
+        "polylines_ms": min(timeit.repeat(lambda: [decode_polyline(polyline) for polyline in polylines], number=1, repeat=repeat)) * 1000,
+    }
+    for path in sorted(LEADERBOARDS.glob("leaderboard_*.html")):
+        text = path.read_text()
+        timings[f"{path.stem}_ms"] = min(timeit.repeat(lambda: parse_leaderboard(text), number=1, repeat=repeat)) * 1000
+    return timings
+
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    upstreams = MockUpstreams(args.latency / 1000, args.jitter / 1000, args.rate_limited, args.segments, args.seed)
+    runner, upstreams_port = await start(upstreams)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/mcp"
+    scenarios = args.scenarios or list(SCENARIOS)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        process = start_server(port, upstreams_port, cache_dir)
+        try:
+            started = time.perf_counter()
+            await wait_for_port(port)
+            startup = time.perf_counter() - started
+
+            # Cold: every scenario once, against empty caches
+            cold: Dict[str, List[float]] = {}
+            cold_errors: Dict[str, int] = {}
+            await run_session(url, scenarios, len(scenarios), cold, cold_errors)
+
+            # Load: concurrent sessions cycling through the scenarios, each from a different one
+            latencies: Dict[str, List[float]] = {}
+            errors: Dict[str, int] = {}
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                run_session(url, scenarios[index % len(scenarios):] + scenarios[:index % len(scenarios)], args.calls, latencies, errors)
+                for index in range(args.sessions)
+            ))
+            duration = time.perf_counter() - started
+
+            metrics = await server_metrics(url)
+            rss = peak_rss_mib(process.pid)
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
+            await runner.cleanup()
+    if rss is None:
+        # ru_maxrss is the largest child so far, in KiB on Linux and bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+    calls = sum(len(samples) for samples in latencies.values())
+    return {
+        "version": REPORT_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "sessions": args.sessions,
+            "calls_per_session": args.calls,
+            "latency_ms": args.latency,
+            "jitter_ms": args.jitter,
+            "rate_limited": args.rate_limited,
+            "synthetic_segments": args.segments,
+            "seed": args.seed,
+        },
+        "startup_s": startup,
+        "cold": {scenario: {"latency_ms": samples[0] * 1000, "ok": not cold_errors.get(scenario)} for scenario, samples in cold.items()},
+        "load": {
+            "duration_s": duration,
+            "calls": calls,
+            "throughput_per_s": calls / duration if duration else 0.0,
+            "errors": sum(errors.values()),
+            "scenarios": {scenario: {**percentiles(samples), "errors": errors.get(scenario, 0)} for scenario, samples in sorted(latencies.items())},
+        },
+        "parse": measure_parsing(args.repeat),
+        "server": {
+            "peak_rss_mib": rss,
+            "cache_hit_ratios": metrics.get("cache_hit_ratios", {}),
+            "histograms": metrics.get("histograms", {}),
+            "counters": metrics.get("counters", {}),
+        },
+        "upstreams": {"requests": upstreams.requests, "throttled": upstreams.throttled},
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    load = report["load"]
+    print(f"{'startup':<24}{report['startup_s'] * 1000:>10.0f} ms")
+    print(f"{'throughput':<24}{load['throughput_per_s']:>10.1f} calls/s over {report['config']['sessions']} sessions, {load['errors']} errors")
+    print(f"{'peak RSS':<24}{report['server']['peak_rss_mib']:>10.1f} MiB")
+    for lag in report["server"]["histograms"].get("event_loop_lag_seconds", []):
+        print(f"{'event loop lag':<24}{lag['p90'] * 1000:>10.1f} ms p90, {lag['max'] * 1000:.1f} ms max")
+    print()
+    print(f"{'scenario':<24}{'cold ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}{'errors':>8}")
+    for scenario, summary in load["scenarios"].items():
+        cold = report["cold"].get(scenario, {}).get("latency_ms", float("nan"))
+        print(f"{scenario:<24}{cold:>10.1f}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['max_ms']:>10.1f}{summary['errors']:>8}")
+    print()
+    for name, milliseconds in report["parse"].items():
+        print(f"{'parse ' + name:<40}{milliseconds:>8.3f}")
+    for cache, ratio in report["server"]["cache_hit_ratios"].items():
+        print(f"{'hit ratio ' + cache:<40}{ratio:>8.1%}")
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """List the scenarios whose median latency, and the throughput, regressed by more than `tolerance`."""
+    regressions = []
+    for scenario, summary in report["load"]["scenarios"].items():
+        previous = baseline["load"]["scenarios"].get(scenario)
+        if previous and summary["p50_ms"] > previous["p50_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p50 {previous['p50_ms']:.2f} -> {summary['p50_ms']:.2f} ms")
+    if report["load"]["throughput_per_s"] < baseline["load"]["throughput_per_s"] * (1 - tolerance):
+        regressions.append(f"throughput: {baseline['load']['throughput_per_s']:.1f} -> {report['load']['throughput_per_s']:.1f} calls/s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="Concurrent MCP sessions")
+    parser.add_argument("--calls", type=int, default=25, help="Tool calls per session")
+    parser.add_argument("--latency", type=float, default=80.0, help="Mean latency of the mock upstreams, in milliseconds")
+    parser.add_argument("--jitter", type=float, default=20.0, help="Standard deviation of the mock upstream latency, in milliseconds")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="Share of Strava requests answered 429")
+    parser.add_argument("--segments", type=int, default=400, help="Synthetic segments served besides the recorded ones")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic segments and injected faults")
+    parser.add_argument("--repeat", type=int, default=20, help="Repetitions of the in-process parse measurements")
+    parser.add_argument("--scenarios", nargs="*", choices=sorted(SCENARIOS), help="Scenarios to run, all by default")
+    parser.add_argument("--output", type=Path, default=ROOT / "benchmarks" / "report.json", help="JSON report written")
+    parser.add_argument("--compare", type=Path, help="Earlier report to compare against, failing on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Regression allowed by --compare, as a fraction")
+    args = parser.parse_args()
+
+    report = asyncio.run(benchmark(args))
+    args.output.write_text(json.dumps(report, indent=2))
+    print_report(report)
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        regressions = compare(report, json.loads(args.compare.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""Local stand-in for the Strava API, the Strava website and Nominatim, serving
+the recorded fixtures with configurable latency and rate limiting.
+
+    uv run benchmarks/mock_upstreams.py [--port 8900] [--latency 80] [--rate-limited 0.05]
+
+Point the server at it with STRAVA_API_BASE=http://127.0.0.1:8900/api/v3,
+STRAVA_WEB_BASE=http://127.0.0.1:8900 and NOMINATIM_API_BASE=http://127.0.0.1:8900.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+LEADERBOARDS = ROOT / "tests" / "fixtures"
+
+# Most segments Strava's explore endpoint returns for one box
+EXPLORE_LIMIT = 10
+
+# Area the synthetic segments are spread over, around the recorded ones
+SYNTHETIC_AREA = (44.95, 5.90, 45.20, 6.20)
+
+
+def encode_polyline(points: List[Tuple[float, float]]) -> str:
+    """Encode (latitude, longitude) points the way Strava does, at five decimals."""
+    def encode_value(value: int) -> str:
+        value = ~(value << 1) if value < 0 else value << 1
+        chunks = []
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1F)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+        return "".join(chunks)
+
+    encoded = []
+    previous = (0, 0)
+    for latitude, longitude in points:
+        current = (round(latitude * 1e5), round(longitude * 1e5))
+        encoded.append(encode_value(current[0] - previous[0]) + encode_value(current[1] - previous[1]))
+        previous = current
+    return "".join(encoded)
+
+
+def synthetic_segments(count: int, seed: int) -> List[Dict]:
+    """Segments spread over SYNTHETIC_AREA, so that dense areas make the explore endpoint saturate."""
+    generator = random.Random(seed)
+    south, west, north, east = SYNTHETIC_AREA
+    segments = []
+    for index in range(count):
+        start = (generator.uniform(south, north), generator.uniform(west, east))
+        heading = generator.uniform(0, 2 * math.pi)
+        length = generator.uniform(300, 8000)
+        end = (
+            start[0] + length / 111_195 * math.cos(heading),
+            start[1] + length / (111_195 * math.cos(math.radians(start[0]))) * math.sin(heading),
+        )
+        grade = round(generator.uniform(-3, 14), 1)
+        segments.append({
+            "id": 90_000_000 + index,
+            "resource_state": 2,
+            "name": f"Synthetic climb {index}",
+            "climb_category": max(0, min(5, int(grade * length / 8000))),
+            "avg_grade": grade,
+            "start_latlng": [round(start[0], 6), round(start[1], 6)],
+            "end_latlng": [round(end[0], 6), round(end[1], 6)],
+            "elev_difference": round(grade * length / 100, 1),
+            "distance": round(length, 1),
+            "points": encode_polyline([start, end]),
+            "starred": False,
+        })
+    return segments
+
+
+def _normalise(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split()).strip(" ,.;")
+
+
+class MockUpstreams:
+    """Fixtures and fault injection shared by the request handlers."""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, rate_limited: float = 0.0, segments: int = 400, seed: int = 0) -> None:
+        """Load the fixtures.
+
+        Args:
+            latency: Mean added latency of every answer, in seconds
+            jitter: Standard deviation of the added latency, in seconds
+            rate_limited: Share of Strava requests answered 429
+            segments: Number of synthetic segments added to the recorded ones
+            seed: Seed of the synthetic segments, latencies and 429s
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limited = rate_limited
+        self.random = random.Random(seed)
+        self.segments = json.loads((FIXTURES / "strava_explore.json").read_text())["segments"] + synthetic_segments(segments, seed)
+        self.segments_by_id = {segment["id"]: segment for segment in self.segments}
+        self.places = json.loads((FIXTURES / "nominatim_search.json").read_text())
+        self.leaderboards = {
+            int(path.stem.split("_")[1]): path.read_text()
+            for path in sorted(LEADERBOARDS.glob("leaderboard_*.html"))
+        }
+        self.requests: Dict[str, int] = {}
+        self.throttled = 0
+        self.strava_usage = 0
+
+    async def _delay(self) -> None:
+        delay = max(self.random.gauss(self.latency, self.jitter), 0.0) if self.latency else 0.0
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _count(self, route: str) -> None:
+        self.requests[route] = self.requests.get(route, 0) + 1
+
+    def _throttle(self) -> Optional[web.Response]:
+        """Answer 429 to a share of the Strava requests."""
+        self.strava_usage += 1
+        if self.rate_limited and self.random.random() < self.rate_limited:
+            self.throttled += 1
+            return web.Response(status=429, headers=self._rate_headers(exhausted=True), text="Rate Limit Exceeded")
+        return None
+
+    def _rate_headers(self, exhausted: bool = False) -> Dict[str, str]:
+        # Generous limits, so the server's own rate limiter is not what gets measured
+        usage = 100_000 if exhausted else self.strava_usage
+        return {
+            "X-ReadRateLimit-Limit": "100000,1000000",
+            "X-ReadRateLimit-Usage": f"{usage},{usage}",
+        }
+
+    async def explore(self, request: web.Request) -> web.Response:
+        self._count("strava_explore")
+        await self._delay()
+        throttled = self._throttle()
+        if throttled is not None:
+            return throttled
+        south, west, north, east = (float(value) for value in request.query["bounds"].split(","))
+        found = [
+            segment for segment in self.segments
+            if south <= segment["start_latlng"][0] <= north and west <= segment["start_latlng"][1] <= east
+        ]
+        return web.json_response({"segments": found[:EXPLORE_LIMIT]}, headers=self._rate_headers())
+
+    async def segment(self, request: web.Request) -> web.Response:
+        self._count("strava_segment")
+        await self._delay()
+        throttled = self._throttle()
+        if throttled is not None:
+            return throttled
+        segment = self.segments_by_id.get(int(request.match_info["segment_id"]))
+        if segment is None:
+            return web.json_response({"message": "Record Not Found"}, status=404, headers=self._rate_headers())
+        gain = max(segment["elev_difference"], 0.0)
+        return web.json_response({
+            "id": segment["id"],
+            "resource_state": 3,
+            "name": segment["name"],
+            "activity_type": "Ride",
+            "distance": segment["distance"],
+            "average_grade": segment["avg_grade"],
+            "maximum_grade": round(segment["avg_grade"] * 1.6, 1),
+            "elevation_high": round(700 + gain, 1),
+            "elevation_low": 700.0,
+            "total_elevation_gain": gain,
+            "climb_category": segment["climb_category"],
+            "start_latlng": segment["start_latlng"],
+            "end_latlng": segment["end_latlng"],
+            "city": "Huez",
+            "country": "France",
+            "map": {"id": f"s{segment['id']}", "polyline": segment["points"], "resource_state": 3},
+            "effort_count": 1000,
+            "athlete_count": 500,
+        }, headers=self._rate_headers())
+
+    async def leaderboard(self, request: web.Request) -> web.Response:
+        self._count("strava_leaderboard")
+        await self._delay()
+        throttled = self._throttle()
+        if throttled is not None:
+            return throttled
+        segment_id = int(request.match_info["segment_id"])
+        pages = sorted(self.leaderboards)
+        text = self.leaderboards.get(segment_id) or self.leaderboards[pages[segment_id % len(pages)]]
+        return web.Response(text=text, content_type="text/html")
+
+    async def search(self, request: web.Request) -> web.Response:
+        self._count("nominatim_search")
+        await self._delay()
+        return web.json_response(self.places.get(_normalise(request.query.get("q", "")), []))
+
+    async def reverse(self, request: web.Request) -> web.Response:
+        self._count("nominatim_reverse")
+        await self._delay()
+        latitude, longitude = float(request.query["lat"]), float(request.query["lon"])
+        closest = min(
+            (place for answers in self.places.values() for place in answers),
+            key=lambda place: (float(place["lat"]) - latitude) ** 2 + (float(place["lon"]) - longitude) ** 2,
+        )
+        if abs(float(closest["lat"]) - latitude) > 0.02 or abs(float(closest["lon"]) - longitude) > 0.02:
+            return web.json_response({"error": "Unable to geocode"})
+        return web.json_response(closest)
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/api/v3/segments/explore", self.explore)
+        app.router.add_get("/api/v3/segments/{segment_id:\\d+}", self.segment)
+        app.router.add_get("/segments/{segment_id:\\d+}/leaderboard", self.leaderboard)
+        app.router.add_get("/search", self.search)
+        app.router.add_get("/reverse", self.reverse)
+        return app
+
+
+async def start(upstreams: MockUpstreams, host: str = "127.0.0.1", port: int = 0) -> Tuple[web.AppRunner, int]:
+    """Serve the mock upstreams in the running event loop.
+
+    Returns:
+        The runner, to clean up once done, and the port it listens on
+    """
+    runner = web.AppRunner(upstreams.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner, site._server.sockets[0].getsockname()[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added latency, in milliseconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Standard deviation of the added latency, in milliseconds")
+    parser.add_argument("--rate-limited", type=float, default=0.0, help="Share of Strava requests answered 429")
+    parser.add_argument("--segments", type=int, default=400, help="Synthetic segments added to the recorded ones")
+    args = parser.parse_args()
+
+    upstreams = MockUpstreams(args.latency / 1000, args.jitter / 1000, args.rate_limited, args.segments)
+    web.run_app(upstreams.app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Optional, Tuple
+
+from settings import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+
+
+class SqliteStore:
+    """Persistent key/value store with per-entry expiry, backed by SQLite.
+
+    Values are stored as JSON, grouped by namespace so several caches can share
+    one database file.
+    """
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+        self.purge_expired()
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        """Look up a key.
+
+        Returns:
+            None on a miss, otherwise the stored value and its remaining time-to-live
+        """
+        row = self._connection.execute(
+            "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?",
+            (namespace, key),
+        ).fetchone()
+        if row is None:
+            return None
+        remaining = row[1] - time.time()
+        if remaining <= 0:
+            return None
+        return json.loads(row[0]), remaining
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float) -> None:
+        """Store a JSON-serialisable value for `ttl` seconds."""
+        self._connection.execute(
+            "INSERT OR REPLACE INTO entries (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, json.dumps(value), time.time() + ttl),
+        )
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+
+    def purge_expired(self) -> int:
+        """Delete expired entries and return how many were removed."""
+        cursor = self._connection.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        if cursor.rowcount:
+            logger.debug(f"Purged {cursor.rowcount} expired cache entries from {self.path}")
+        return cursor.rowcount
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+_store: Optional[SqliteStore] = None
+
+
+def get_cache_store() -> SqliteStore:
+    """Get the process-wide persistent store, opening it under CACHE_DIR if needed."""
+    global _store
+    if _store is None:
+        _store = SqliteStore(os.path.join(CACHE_DIR, "cache.sqlite3"))
+    return _store
+
+
+def close_cache_store() -> None:
+    """Close the process-wide persistent store."""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,73 @@
+from typing import Any, Callable, Optional, Tuple
+
+from metrics import metrics
+
+from .lru import TTLCache
+from .sqlite import SqliteStore, get_cache_store
+
+
+class TieredCache:
+    """LRU memory cache in front of a persistent SQLite store.
+
+    A value of None is a valid negative entry: it records that the upstream had
+    nothing for the key and is kept for `negative_ttl` seconds instead of `ttl`.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        maxsize: int,
+        ttl: float,
+        negative_ttl: Optional[float] = None,
+        store: Optional[Callable[[], Optional[SqliteStore]]] = get_cache_store,
+    ) -> None:
+        """Create the cache.
+
+        Args:
+            namespace: Namespace of the entries in the persistent store
+            maxsize: Maximum number of entries kept in memory
+            ttl: Time-to-live of an entry, in seconds
+            negative_ttl: Time-to-live of a negative entry, defaults to `ttl`
+            store: Factory returning the persistent store, None for memory only
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.memory = TTLCache(maxsize, ttl)
+        self._store = store
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        """Look up a key in memory, then in the persistent store.
+
+        Returns:
+            hit: Whether a live entry was found
+            value: The cached value, None on a miss or for a negative entry
+        """
+        hit, value = self.memory.get(key)
+        if hit:
+            metrics.increment("cache_lookups_total", cache=self.namespace, result="memory")
+            return True, value
+
+        store = self._store() if self._store else None
+        entry = store.get(self.namespace, key) if store is not None else None
+        if entry is None:
+            metrics.increment("cache_lookups_total", cache=self.namespace, result="miss")
+            return False, None
+        value, remaining = entry
+        self.memory.set(key, value, remaining)
+        metrics.increment("cache_lookups_total", cache=self.namespace, result="store")
+        return True, value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, or a negative entry when value is None."""
+        ttl = self.negative_ttl if value is None else self.ttl
+        self.memory.set(key, value, ttl)
+        store = self._store() if self._store else None
+        if store is not None:
+            store.set(self.namespace, key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        store = self._store() if self._store else None
+        if store is not None:
+            store.delete(self.namespace, key)
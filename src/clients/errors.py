@@ -0,0 +1,45 @@
+from typing import Optional
+
+
+class UpstreamError(Exception):
+    """An upstream service could not answer a request."""
+
+    def __init__(self, upstream: str, message: str) -> None:
+        super().__init__(f"{upstream}: {message}")
+        self.upstream = upstream
+
+
+class RateLimitedError(UpstreamError):
+    """The request would exceed the rate limit of the upstream."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(upstream, f"rate limit reached, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
+
+
+class UpstreamTimeoutError(UpstreamError):
+    """The upstream did not answer in time, even after retrying."""
+
+
+class UpstreamUnavailableError(UpstreamError):
+    """The upstream could not be reached or kept failing, even after retrying."""
+
+    def __init__(self, upstream: str, message: str, status: Optional[int] = None) -> None:
+        super().__init__(upstream, message)
+        self.status = status
+
+
+class UpstreamResponseError(UpstreamError):
+    """The upstream rejected the request, retrying it would not help."""
+
+    def __init__(self, upstream: str, status: int) -> None:
+        super().__init__(upstream, f"request rejected with status {status}")
+        self.status = status
+
+
+class CircuitOpenError(UpstreamError):
+    """The upstream failed repeatedly, requests are refused until it is probed again."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(upstream, f"unavailable after repeated failures, retry in {retry_after:.0f} s")
+        self.retry_after = retry_after
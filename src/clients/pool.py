@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from importlib.util import find_spec
+from typing import Any, Dict, Optional, Set
+
+import httpx
+
+from metrics import metrics, span
+from settings import (
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HTTP_READ_TIMEOUT,
+    HTTP_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 needs `h2`, installed by the httpx[http2] dependency. Without it, as in
+# an install that skipped the extra, clients fall back to HTTP/1.1
+HTTP2_AVAILABLE = find_spec("h2") is not None
+
+
+class ConnectionStats:
+    """Connection counters for one upstream."""
+
+    __slots__ = ("requests", "new_connections")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.new_connections = 0
+
+    @property
+    def reused_connections(self) -> int:
+        return max(self.requests - self.new_connections, 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+        }
+
+
+class HttpPool:
+    """Long-lived HTTP clients, one per upstream, sharing keep-alive connections.
+
+    Upstreams are registered by name with their own connection limits, default
+    headers and cookies. Clients are opened lazily on first use and bound to the
+    running event loop.
+    """
+
+    def __init__(self) -> None:
+        self._configs: Dict[str, Dict[str, Any]] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats: Dict[str, ConnectionStats] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set["asyncio.Task[None]"] = set()
+
+    def register(
+        self,
+        name: str,
+        *,
+        max_connections: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+        max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        headers: Optional[Dict[str, str]] = None,
+        cookies: Optional[Dict[str, str]] = None,
+        http2: bool = True,
+    ) -> None:
+        """Register an upstream.
+
+        Args:
+            name: The name used to look the client up
+            max_connections: Maximum number of open connections to the host
+            max_keepalive_connections: Maximum number of idle connections kept open
+            headers: Default headers sent with every request
+            cookies: Default cookies sent with every request
+            http2: Whether to negotiate HTTP/2 when the server supports it
+        """
+        self._configs[name] = {
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            "headers": headers,
+            "cookies": cookies,
+            "http2": http2 and HTTP2_AVAILABLE,
+        }
+        self._stats.setdefault(name, ConnectionStats())
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        """Get the shared client of an upstream, opening it if needed."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Connections cannot be shared across event loops, those of the previous one are closed
+            stale, self._clients = self._clients, {}
+            self._loop = loop
+            for name, stale_client in stale.items():
+                task = loop.create_task(self._close_stale(name, stale_client))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+        client = self._clients.get(name)
+        if client is None:
+            config = self._configs[name]
+            # A host that does not accept connections is given up on sooner than a slow answer
+            timeout = httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT, read=HTTP_READ_TIMEOUT)
+            client = httpx.AsyncClient(timeout=timeout, **config)
+            self._clients[name] = client
+            logger.debug(f"Opened HTTP client for {name} (http2={config['http2']})")
+        return client
+
+    @staticmethod
+    async def _close_stale(name: str, client: httpx.AsyncClient) -> None:
+        try:
+            await client.aclose()
+        except Exception as e:
+            # Its loop is gone, the sockets left are closed when collected
+            logger.debug(f"Unable to close the stale HTTP client of {name}: {e}")
+
+    async def start(self) -> None:
+        """Open the clients of every registered upstream."""
+        for name in self._configs:
+            self.client(name)
+
+    async def get(self, name: str, url: str, **kwargs: Any) -> httpx.Response:
+        """Send a GET request through the shared client of an upstream, recording its latency and size."""
+        stats = self._stats[name]
+
+        async def trace(event: str, info: Dict[str, Any]) -> None:
+            if event == "connection.connect_tcp.complete":
+                stats.new_connections += 1
+
+        stats.requests += 1
+        with span("upstream", upstream=name):
+            response = await self.client(name).get(url, extensions={"trace": trace}, **kwargs)
+        metrics.increment("upstream_responses_total", upstream=name, status=response.status_code)
+        metrics.increment("upstream_bytes_total", len(response.content), upstream=name)
+        return response
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Connection reuse counters per upstream."""
+        return {name: stats.as_dict() for name, stats in self._stats.items()}
+
+    async def aclose(self) -> None:
+        """Close every open client."""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        logger.info(f"Closed HTTP clients: {self.stats()}")
+
+
+_pool = HttpPool()
+
+
+def get_http_pool() -> HttpPool:
+    """Get the process-wide HTTP pool."""
+    return _pool
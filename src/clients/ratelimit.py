@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from metrics import metrics
+
+from .errors import RateLimitedError
+
+logger = logging.getLogger(__name__)
+
+# Request priorities, lower goes first
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+class TokenBucket:
+    """Token bucket smoothing requests to `rate` per second with bursts of `capacity`."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is available."""
+        self._refill()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def consume(self) -> None:
+        self._refill()
+        self._tokens -= 1
+
+
+class QuotaWindow:
+    """Usage of one fixed quota window, resetting on UTC period boundaries."""
+
+    __slots__ = ("limit", "usage", "period", "_resets_at")
+
+    def __init__(self, limit: int, period: timedelta) -> None:
+        self.limit = limit
+        self.usage = 0
+        self.period = period
+        self._resets_at = self._next_reset(datetime.now(timezone.utc))
+
+    def _next_reset(self, now: datetime) -> datetime:
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        elapsed = (now - midnight) // self.period
+        return midnight + (elapsed + 1) * self.period
+
+    def _roll(self, now: datetime) -> None:
+        if now >= self._resets_at:
+            self.usage = 0
+            self._resets_at = self._next_reset(now)
+
+    def delay(self, now: datetime) -> float:
+        """Seconds until the window accepts another request."""
+        self._roll(now)
+        if self.usage < self.limit:
+            return 0.0
+        return (self._resets_at - now).total_seconds()
+
+    def reserve(self, now: datetime) -> None:
+        self._roll(now)
+        self.usage += 1
+
+    def as_dict(self) -> Dict[str, int]:
+        return {"limit": self.limit, "usage": self.usage}
+
+
+class StravaQuota:
+    """Strava's 15-minute and daily quotas, updated from its rate limit headers.
+
+    Usage is counted locally between responses so that concurrent requests do
+    not all see the same stale headers. The read quota headers are used when
+    present since every request of this server is a read.
+    """
+
+    def __init__(self, short_limit: int, daily_limit: int) -> None:
+        self.short = QuotaWindow(short_limit, timedelta(minutes=15))
+        self.daily = QuotaWindow(daily_limit, timedelta(days=1))
+
+    @staticmethod
+    def _parse(value: Optional[str]) -> Optional[Tuple[int, int]]:
+        if not value:
+            return None
+        try:
+            short, daily = (int(part) for part in value.split(","))
+        except ValueError:
+            return None
+        return short, daily
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Update the windows from the headers of a Strava response."""
+        for prefix in ("X-ReadRateLimit", "X-RateLimit"):
+            limits = self._parse(headers.get(f"{prefix}-Limit"))
+            usage = self._parse(headers.get(f"{prefix}-Usage"))
+            if limits and usage:
+                self.short.limit, self.daily.limit = limits
+                self.short.usage, self.daily.usage = usage
+                return
+
+    def exhaust(self) -> None:
+        """Mark the 15-minute window as used up, e.g. after a 429 without headers."""
+        self.short.usage = max(self.short.usage, self.short.limit)
+
+    def delay(self) -> float:
+        now = datetime.now(timezone.utc)
+        return max(self.short.delay(now), self.daily.delay(now))
+
+    def reserve(self) -> None:
+        now = datetime.now(timezone.utc)
+        self.short.reserve(now)
+        self.daily.reserve(now)
+
+    def as_dict(self) -> Dict[str, Dict[str, int]]:
+        return {"15min": self.short.as_dict(), "daily": self.daily.as_dict()}
+
+
+class RequestScheduler:
+    """Priority queue granting requests to an upstream within its rate limits.
+
+    Waiting requests are served by priority, then in arrival order. The head
+    of the queue waits for both a token of the bucket and room in the quota
+    windows, if any.
+    """
+
+    def __init__(self, name: str, bucket: TokenBucket, quota: Optional[StravaQuota] = None) -> None:
+        self.name = name
+        self.bucket = bucket
+        self.quota = quota
+        self._waiters: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.requests = 0
+        self.rejected = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _bind_loop(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Asyncio primitives cannot be shared across event loops
+            self._condition = asyncio.Condition()
+            self._waiters = []
+            self._loop = loop
+        return self._condition
+
+    def _delay(self) -> float:
+        delay = self.bucket.delay()
+        if self.quota is not None:
+            delay = max(delay, self.quota.delay())
+        return delay
+
+    async def acquire(self, priority: int = INTERACTIVE, max_wait: Optional[float] = None) -> None:
+        """Wait for the turn of a request.
+
+        Args:
+            priority: Priority of the request, INTERACTIVE ones go before BACKGROUND ones
+            max_wait: Fail instead of waiting when the quota is exhausted for longer
+
+        Raises:
+            RateLimitedError: The quota will not allow the request within `max_wait`
+        """
+        condition = self._bind_loop()
+        if self.quota is not None and max_wait is not None:
+            quota_delay = self.quota.delay()
+            if quota_delay > max_wait:
+                self.rejected += 1
+                metrics.increment("rate_limit_rejections_total", upstream=self.name)
+                raise RateLimitedError(self.name, quota_delay)
+
+        entry = (priority, next(self._sequence))
+        heapq.heappush(self._waiters, entry)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        started = time.monotonic()
+        try:
+            async with condition:
+                while True:
+                    timeout = None
+                    if self._waiters[0] == entry:
+                        timeout = self._delay()
+                        if timeout <= 0:
+                            break
+                    try:
+                        await asyncio.wait_for(condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                heapq.heappop(self._waiters)
+                self.bucket.consume()
+                if self.quota is not None:
+                    self.quota.reserve()
+                condition.notify_all()
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                async with condition:
+                    condition.notify_all()
+            raise
+
+        waited = time.monotonic() - started
+        self.requests += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        metrics.observe("rate_limit_wait_seconds", waited, upstream=self.name)
+        if waited > 1:
+            logger.debug(f"{self.name} request waited {waited:.1f} s for its turn")
+
+    def observe(self, headers: Mapping[str, str]) -> None:
+        """Update the quota from response headers and spread it evenly over its window."""
+        if self.quota is None:
+            return
+        self.quota.observe(headers)
+        self.bucket.rate = self.quota.short.limit / self.quota.short.period.total_seconds()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def stats(self) -> Dict[str, object]:
+        """Queue and wait time metrics of the scheduler."""
+        stats = {
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "requests": self.requests,
+            "rejected": self.rejected,
+            "average_wait": self.total_wait / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+        if self.quota is not None:
+            stats["quota"] = self.quota.as_dict()
+        return stats
@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, FrozenSet, Optional
+
+import httpx
+
+from metrics import metrics
+from settings import (
+    CIRCUIT_FAILURE_THRESHOLD,
+    CIRCUIT_RESET_TIMEOUT,
+    HTTP_HEDGE,
+    HTTP_HEDGE_MIN_SAMPLES,
+    HTTP_RETRIES,
+    HTTP_RETRY_BACKOFF,
+    HTTP_RETRY_MAX_BACKOFF,
+)
+
+from .errors import (
+    CircuitOpenError,
+    RateLimitedError,
+    UpstreamError,
+    UpstreamResponseError,
+    UpstreamTimeoutError,
+    UpstreamUnavailableError,
+)
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth sending the request again for
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Fail fast while an upstream is down.
+
+    After `failure_threshold` failures in a row the circuit opens and requests
+    are refused at once. After `reset_timeout` seconds one request is let
+    through as a probe: its success closes the circuit, its failure opens it
+    again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self.trips = 0
+
+    def before(self) -> None:
+        """Let a request through, or refuse it while the circuit is open.
+
+        Raises:
+            CircuitOpenError: The circuit is open, or half open with its probe in flight
+        """
+        if self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.reset_timeout - time.monotonic()
+        if remaining <= 0:
+            # A probe that never reported back is replaced by a new one after as long
+            self.state = HALF_OPEN
+            self.opened_at = time.monotonic()
+            logger.info(f"Probing {self.name} after {self.reset_timeout:.0f} s")
+            return
+        self.rejected += 1
+        metrics.increment("circuit_rejections_total", upstream=self.name)
+        raise CircuitOpenError(self.name, max(remaining, 0.0))
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"{self.name} answers again, closing its circuit")
+        self.state = CLOSED
+        self.failures = 0
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                self.trips += 1
+                logger.warning(f"{self.name} failed {self.failures} times in a row, failing fast for {self.reset_timeout:.0f} s")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures, "trips": self.trips, "rejected": self.rejected}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds the upstream asks to wait before retrying, from its Retry-After header."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResilientUpstream:
+    """Retries, circuit breaking and hedging of the requests to one upstream.
+
+    Timeouts, connection errors and the RETRY_STATUSES are retried up to
+    `retries` times, after a full-jitter exponential backoff or the upstream's
+    Retry-After. Other client errors are not retried. Failures come back as
+    typed UpstreamErrors, instead of empty answers tools could not tell from
+    "nothing found".
+
+    Requests are sent by a callable, so that each retry or hedge goes through
+    the upstream's rate limit again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        retries: int = HTTP_RETRIES,
+        backoff: float = HTTP_RETRY_BACKOFF,
+        max_backoff: float = HTTP_RETRY_MAX_BACKOFF,
+        retry_statuses: FrozenSet[int] = RETRY_STATUSES,
+        hedge: bool = HTTP_HEDGE,
+        hedge_min_samples: int = HTTP_HEDGE_MIN_SAMPLES,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        """Create the policy of an upstream.
+
+        Args:
+            name: The name of the upstream in the HTTP pool and the metrics
+            retries: Most retries of one request
+            backoff: Base of the exponential backoff, in seconds
+            max_backoff: Longest wait before a retry, in seconds, longer Retry-After are not waited for
+            retry_statuses: Statuses retried
+            hedge: Send a duplicate of requests unanswered past the upstream's p95 latency
+            hedge_min_samples: Latencies recorded before hedging starts
+            breaker: The circuit breaker of the upstream, a new one by default
+        """
+        self.name = name
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker(name)
+        self.retried = 0
+        self.hedged = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter backoff before retry number `attempt`, starting at 0."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def hedge_delay(self) -> Optional[float]:
+        """The upstream's p95 latency, None until enough latencies are recorded."""
+        latencies = metrics.histogram("upstream_seconds", upstream=self.name)
+        if latencies is None or latencies.count < self.hedge_min_samples:
+            return None
+        return latencies.quantile(0.95)
+
+    async def _attempt(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send the request, and a duplicate if the first is slower than usual. The first answer wins."""
+        delay = self.hedge_delay() if self.hedge else None
+        if delay is None:
+            return await send()
+
+        tasks = {asyncio.ensure_future(send())}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedged += 1
+                metrics.increment("upstream_hedges_total", upstream=self.name)
+                tasks.add(asyncio.ensure_future(send()))
+
+            error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get(self, send: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """Send a request until it is answered, retrying transient failures.
+
+        Args:
+            send: Sends the request once, such as a rate limited GET through the HTTP pool
+
+        Returns:
+            The first response with a status under 400
+
+        Raises:
+            CircuitOpenError: The upstream failed repeatedly and is not probed yet
+            RateLimitedError: The upstream kept answering 429
+            UpstreamTimeoutError: The upstream kept timing out
+            UpstreamUnavailableError: The upstream kept failing or could not be reached
+            UpstreamResponseError: The upstream rejected the request
+        """
+        error: UpstreamError
+        for attempt in range(self.retries + 1):
+            self.breaker.before()
+            wait = None
+            try:
+                response = await self._attempt(send)
+            except httpx.TimeoutException as e:
+                self.breaker.record_failure()
+                error = UpstreamTimeoutError(self.name, f"no answer in time ({type(e).__name__})")
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                error = UpstreamUnavailableError(self.name, f"unreachable ({type(e).__name__}: {e})")
+            else:
+                status = response.status_code
+                if status < 400:
+                    self.breaker.record_success()
+                    return response
+                if status not in self.retry_statuses:
+                    # The host answered, it is up
+                    self.breaker.record_success()
+                    raise UpstreamResponseError(self.name, status)
+                wait = _retry_after(response)
+                if status == 429:
+                    error = RateLimitedError(self.name, wait or 0.0)
+                else:
+                    self.breaker.record_failure()
+                    error = UpstreamUnavailableError(self.name, f"failed with status {status}", status)
+
+            if attempt == self.retries or (wait is not None and wait > self.max_backoff):
+                break
+            self.retried += 1
+            metrics.increment("upstream_retries_total", upstream=self.name)
+            delay = self.backoff_delay(attempt) if wait is None else wait
+            logger.debug(f"Retrying a request to {self.name} in {delay:.2f} s after: {error}")
+            await asyncio.sleep(delay)
+        raise error
+
+    def stats(self) -> Dict[str, object]:
+        return {"retried": self.retried, "hedged": self.hedged, "circuit": self.breaker.stats()}
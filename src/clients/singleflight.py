@@ -0,0 +1,53 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one.
+
+    The first caller of a key starts the call, callers arriving while it is in
+    flight await the same result, or exception. A caller being cancelled does
+    not cancel the call of the others.
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.calls = 0
+        self.coalesced = 0
+
+    def _forget(self, key: Hashable, call: asyncio.Future) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+        if not call.cancelled():
+            # Mark the exception as retrieved even if every caller went away
+            call.exception()
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        """Run `function`, or join the call already in flight for `key`."""
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Calls of another event loop can never complete on this one
+            self._calls = {}
+            self._loop = loop
+
+        self.calls += 1
+        call = self._calls.get(key)
+        if call is None:
+            call = asyncio.ensure_future(function())
+            self._calls[key] = call
+            call.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Coalesced {self.name} call {key}")
+        return await asyncio.shield(call)
+
+    def stats(self) -> Dict[str, Any]:
+        """Number of calls, of calls coalesced into one in flight, and of calls in flight."""
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._calls)}
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Optional, TypeVar
+from weakref import WeakKeyDictionary
+
+from metrics import metrics
+from settings import PARSE_EXECUTOR, PARSE_OFFLOAD_MIN_BYTES, PARSE_WORKERS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+EXECUTOR_KINDS = ("process", "thread", "inline")
+
+
+class ToolCallLimiter:
+    """Bound the tool calls running at once, overall and per MCP session.
+
+    With a network transport one server process serves many sessions; the
+    overall bound keeps them from starving each other of upstream capacity and
+    the per-session bound keeps one client from taking all of it.
+    """
+
+    def __init__(self, workers: int, per_session: int) -> None:
+        """Create the limiter.
+
+        Args:
+            workers: Maximum number of tool calls running at once over all sessions
+            per_session: Maximum number of tool calls running at once in one session
+        """
+        self.workers = workers
+        self.per_session = per_session
+        self._workers = asyncio.Semaphore(workers)
+        self._sessions: "WeakKeyDictionary[object, asyncio.Semaphore]" = WeakKeyDictionary()
+
+    def configure(self, workers: int, per_session: int) -> None:
+        """Change the bounds, before the server starts serving."""
+        self.workers = workers
+        self.per_session = per_session
+        self._workers = asyncio.Semaphore(workers)
+        self._sessions.clear()
+
+    @asynccontextmanager
+    async def limit(self, session: Optional[object]) -> AsyncIterator[None]:
+        """Wait for a free slot of the session, then of the server."""
+        if session is None:
+            async with self._workers:
+                yield
+            return
+
+        semaphore = self._sessions.get(session)
+        if semaphore is None:
+            semaphore = self._sessions[session] = asyncio.Semaphore(self.per_session)
+        async with semaphore, self._workers:
+            yield
+
+
+class CpuExecutor:
+    """Run CPU-bound functions of raw upstream bytes, such as parsers, off the event loop.
+
+    While a large leaderboard page is parsed on the event loop, every other
+    call it serves waits, fast geocodes included. Pages are handed over as the
+    bytes received, decoded and parsed by the worker: a thread pool shares
+    them without copying, a process pool copies them once, which is cheaper
+    than copying the decoded text. Inputs under `min_bytes` are run inline.
+    """
+
+    def __init__(self, kind: str = PARSE_EXECUTOR, workers: int = PARSE_WORKERS, min_bytes: int = PARSE_OFFLOAD_MIN_BYTES) -> None:
+        """Create the executor, its pool is started on first use.
+
+        Args:
+            kind: "process" for a process pool, "thread" for a thread pool, "inline" for none
+            workers: Size of the pool
+            min_bytes: Size under which inputs are run on the event loop
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor {kind!r}, expected one of {', '.join(EXECUTOR_KINDS)}")
+        self.kind = kind
+        self.workers = max(workers, 1)
+        self.min_bytes = min_bytes
+        self._pool: Optional[Executor] = None
+        self.offloaded = 0
+        self.inline = 0
+
+    def _get_pool(self) -> Executor:
+        if self._pool is None:
+            if self.kind == "process":
+                # Forking a process running an event loop and threads is unsafe
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix="parse")
+        return self._pool
+
+    async def run(self, function: Callable[..., T], data: bytes, *args: Any) -> T:
+        """Call `function(data, *args)` in the pool, or inline for small inputs.
+
+        The function and its arguments must be picklable for a process pool:
+        module-level functions and plain values. A call whose worker dies is
+        retried once in a new pool.
+
+        Raises:
+            ValueError: The worker died running the call twice
+        """
+        return await self._call(len(data), function, data, *args)
+
+    async def run_file(self, function: Callable[..., T], path: str, *args: Any) -> T:
+        """Call `function(path, *args)` in the pool, or inline for small files.
+
+        The worker opens the file itself, so large files are streamed from the
+        disk by the worker instead of being read whole and shipped to it.
+
+        Raises:
+            ValueError: The worker died running the call twice
+        """
+        return await self._call(os.path.getsize(path), function, path, *args)
+
+    async def _call(self, size: int, function: Callable[..., T], *args: Any) -> T:
+        if self.kind == "inline" or size < self.min_bytes:
+            self.inline += 1
+            metrics.increment("cpu_tasks_total", executor="inline")
+            return function(*args)
+
+        self.offloaded += 1
+        metrics.increment("cpu_tasks_total", executor=self.kind)
+        try:
+            return await self._submit(function, *args)
+        except BrokenProcessPool:
+            # The worker may have died of something else, such as another input
+            logger.warning("A parse worker died, retrying in a new pool")
+        try:
+            return await self._submit(function, *args)
+        except BrokenProcessPool as e:
+            # Never on the event loop: the input may well be what kills the worker
+            logger.error(f"A parse worker died again running {getattr(function, '__name__', function)}, giving up on its input")
+            raise ValueError("The input could not be parsed, it killed the parse worker") from e
+
+    async def _submit(self, function: Callable[..., T], *args: Any) -> T:
+        pool = self._get_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, function, *args)
+        except BrokenProcessPool:
+            # Stop the broken pool, unless a concurrent call already replaced it
+            if self._pool is pool:
+                self._pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        return {"executor": self.kind, "workers": self.workers, "offloaded": self.offloaded, "inline": self.inline}
+
+    def shutdown(self) -> None:
+        """Stop the pool, it is started again on the next call."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+_cpu_executor: Optional[CpuExecutor] = None
+
+
+def get_cpu_executor() -> CpuExecutor:
+    """Get the process-wide executor of CPU-bound parsing."""
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = CpuExecutor()
+    return _cpu_executor
+
+
+def close_cpu_executor() -> None:
+    """Stop the pool of the process-wide executor."""
+    if _cpu_executor is not None:
+        _cpu_executor.shutdown()
@@ -0,0 +1,391 @@
+"""Geodesic helpers: bounding boxes, distances, corridors around routes and polylines.
+
+Scalar helpers use `math` and keep numpy off the import path; the vectorised
+ones take arrays of any shape that broadcast together and import numpy on first
+use. Distances are in kilometres and angles in degrees throughout.
+"""
+import math
+from typing import TYPE_CHECKING, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Mean radius of the Earth (IUGG), used by the spherical formulas
+EARTH_RADIUS_KM = 6371.0088
+
+# WGS84 ellipsoid, used by Vincenty's formula
+WGS84_A = 6378.137
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def _wrap_longitude(longitude: float) -> float:
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def bounding_box(latitude: float, longitude: float, distance: float) -> Tuple[float, float, float, float]:
+    """Smallest latitude/longitude box containing every point within `distance` of a centre.
+
+    The box is exact on the sphere: its east and west sides touch the circle
+    where the meridians are tangent to it, not at the centre's latitude. A box
+    containing a pole spans every longitude, and a box crossing the antimeridian
+    has a southwest longitude greater than its northeast longitude.
+
+    Args:
+        latitude: Latitude of the centre
+        longitude: Longitude of the centre
+        distance: Radius of the circle, in kilometres
+
+    Returns:
+        southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude
+    """
+    angle = distance / EARTH_RADIUS_KM
+    south = latitude - math.degrees(angle)
+    north = latitude + math.degrees(angle)
+    if north >= 90.0 or south <= -90.0 or angle >= math.pi / 2:
+        return (max(south, -90.0), -180.0, min(north, 90.0), 180.0)
+
+    spread = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(latitude))))
+    return (south, _wrap_longitude(longitude - spread), north, _wrap_longitude(longitude + spread))
+
+
+def bounding_boxes(latitudes: "np.ndarray", longitudes: "np.ndarray", distances: "np.ndarray") -> "np.ndarray":
+    """Vectorised `bounding_box` over arrays of centres and radii.
+
+    Returns:
+        An array of shape (..., 4) holding the southwest latitude, southwest
+        longitude, northeast latitude and northeast longitude of each box
+    """
+    import numpy as np
+
+    latitudes, longitudes, distances = np.broadcast_arrays(
+        np.asarray(latitudes, dtype=float), np.asarray(longitudes, dtype=float), np.asarray(distances, dtype=float)
+    )
+    angles = distances / EARTH_RADIUS_KM
+    south = latitudes - np.degrees(angles)
+    north = latitudes + np.degrees(angles)
+    polar = (north >= 90.0) | (south <= -90.0) | (angles >= np.pi / 2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = np.sin(angles) / np.cos(np.radians(latitudes))
+    spread = np.degrees(np.arcsin(np.clip(np.where(polar, 0.0, ratio), -1.0, 1.0)))
+    west = np.where(polar, -180.0, (longitudes - spread + 180.0) % 360.0 - 180.0)
+    east = np.where(polar, 180.0, (longitudes + spread + 180.0) % 360.0 - 180.0)
+    return np.stack([np.maximum(south, -90.0), west, np.minimum(north, 90.0), east], axis=-1)
+
+
+def haversine(latitude: float, longitude: float, other_latitude: float, other_longitude: float) -> float:
+    """Great-circle distance between two points, in kilometres."""
+    phi1, phi2 = math.radians(latitude), math.radians(other_latitude)
+    h = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(math.sqrt(h), 1.0))
+
+
+def haversine_distances(latitude: "np.ndarray", longitude: "np.ndarray", latitudes: "np.ndarray", longitudes: "np.ndarray") -> "np.ndarray":
+    """Vectorised great-circle distances, in kilometres.
+
+    Every argument broadcasts, so one point against many, or many against many
+    with `a[:, None]` and `b[None, :]`, are both a single pass.
+    """
+    import numpy as np
+
+    phi1, phi2 = np.radians(latitude), np.radians(latitudes)
+    dlambda = np.radians(np.asarray(longitudes) - longitude)
+    h = np.sin((phi2 - phi1) / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(h), 1.0))
+
+
+def vincenty_distances(
+    latitude: "np.ndarray",
+    longitude: "np.ndarray",
+    latitudes: "np.ndarray",
+    longitudes: "np.ndarray",
+    tolerance: float = 1e-12,
+    max_iterations: int = 200,
+) -> "np.ndarray":
+    """Vectorised distances on the WGS84 ellipsoid with Vincenty's inverse formula, in kilometres.
+
+    Accurate to the millimetre, about 0.5% closer to the truth than the
+    haversine. Nearly antipodal pairs, for which the iteration does not
+    converge, fall back to the haversine.
+    """
+    import numpy as np
+
+    latitude, longitude, latitudes, longitudes = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (latitude, longitude, latitudes, longitudes))
+    )
+    f = WGS84_F
+    u1 = np.arctan((1 - f) * np.tan(np.radians(latitude)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(latitudes)))
+    big_l = np.radians(longitudes - longitude)
+    sin_u1, cos_u1, sin_u2, cos_u2 = np.sin(u1), np.cos(u1), np.sin(u2), np.cos(u2)
+
+    lam = big_l.copy()
+    converged = np.zeros(lam.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Points on the equator have cos2_alpha == 0
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            converged = np.abs(lam - previous) <= tolerance
+            if converged.all():
+                break
+
+        u_squared = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        big_a = 1 + u_squared / 16384 * (4096 + u_squared * (-768 + u_squared * (320 - 175 * u_squared)))
+        big_b = u_squared / 1024 * (256 + u_squared * (-128 + u_squared * (74 - 47 * u_squared)))
+        delta_sigma = big_b * sin_sigma * (
+            cos_2sigma_m + big_b / 4 * (
+                cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+                - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+            )
+        )
+        distances = WGS84_B * big_a * (sigma - delta_sigma)
+
+    fallback = ~converged | ~np.isfinite(distances)
+    if fallback.any():
+        distances = np.where(fallback, haversine_distances(latitude, longitude, latitudes, longitudes), distances)
+    return distances
+
+
+def _local_xy(latitudes: "np.ndarray", longitudes: "np.ndarray", origin_latitude: "np.ndarray", origin_longitude: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    """Project points onto a plane tangent at an origin, in kilometres (equirectangular)."""
+    import numpy as np
+
+    dlon = (np.asarray(longitudes) - origin_longitude + 180.0) % 360.0 - 180.0
+    x = np.radians(dlon) * np.cos(np.radians(origin_latitude)) * EARTH_RADIUS_KM
+    y = np.radians(np.asarray(latitudes) - origin_latitude) * EARTH_RADIUS_KM
+    return x, y
+
+
+def route_distances(latitudes: "np.ndarray", longitudes: "np.ndarray", route_latitudes: "np.ndarray", route_longitudes: "np.ndarray") -> "np.ndarray":
+    """Distance from each point to the closest leg of a route, in kilometres.
+
+    Each leg is measured in a plane tangent at its start, which stays within a
+    fraction of a percent for legs of a few tens of kilometres. All points are
+    measured against all legs in one pass.
+
+    Args:
+        latitudes: Latitudes of the points, shape (n,)
+        longitudes: Longitudes of the points, shape (n,)
+        route_latitudes: Latitudes of the route's vertices, shape (m,)
+        route_longitudes: Longitudes of the route's vertices, shape (m,)
+
+    Returns:
+        The distances, shape (n,)
+    """
+    import numpy as np
+
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))[:, None]
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))[:, None]
+    route_latitudes = np.asarray(route_latitudes, dtype=float)
+    route_longitudes = np.asarray(route_longitudes, dtype=float)
+    if len(route_latitudes) == 1:
+        return haversine_distances(route_latitudes[0], route_longitudes[0], latitudes[:, 0], longitudes[:, 0])
+
+    start_latitudes, start_longitudes = route_latitudes[:-1], route_longitudes[:-1]
+    end_x, end_y = _local_xy(route_latitudes[1:], route_longitudes[1:], start_latitudes, start_longitudes)
+    point_x, point_y = _local_xy(latitudes, longitudes, start_latitudes, start_longitudes)
+    length_squared = end_x ** 2 + end_y ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.clip((point_x * end_x + point_y * end_y) / length_squared, 0.0, 1.0)
+    t = np.where(length_squared == 0, 0.0, t)
+    distances = np.hypot(point_x - t * end_x, point_y - t * end_y)
+    return distances.min(axis=1)
+
+
+def within_corridor(latitudes: "np.ndarray", longitudes: "np.ndarray", route_latitudes: "np.ndarray", route_longitudes: "np.ndarray", width: float) -> "np.ndarray":
+    """Mask of the points within `width` kilometres of a route."""
+    return route_distances(latitudes, longitudes, route_latitudes, route_longitudes) <= width
+
+
+def corridor_polygon(route_latitudes: "np.ndarray", route_longitudes: "np.ndarray", width: float) -> "np.ndarray":
+    """Buffer a route into a polygon, offsetting each vertex by `width` on both sides.
+
+    The offset at a vertex is along the bisector of its two legs, so the
+    polygon follows bends without self-intersecting on gentle turns. Use
+    `within_corridor` for exact membership; the polygon is meant for spatial
+    queries and display.
+
+    Returns:
+        The (latitude, longitude) vertices of the polygon, shape (2m, 2), going
+        up the left side of the route and back down its right side
+    """
+    import numpy as np
+
+    route_latitudes = np.asarray(route_latitudes, dtype=float)
+    route_longitudes = np.asarray(route_longitudes, dtype=float)
+    x, y = _local_xy(route_latitudes, route_longitudes, route_latitudes[0], route_longitudes[0])
+    dx, dy = np.diff(x), np.diff(y)
+    lengths = np.hypot(dx, dy)
+    lengths[lengths == 0] = 1.0
+    # Unit normals of the legs, pointing left, averaged at the inner vertices
+    nx, ny = -dy / lengths, dx / lengths
+    vertex_nx = np.concatenate([nx[:1], nx[:-1] + nx[1:], nx[-1:]])
+    vertex_ny = np.concatenate([ny[:1], ny[:-1] + ny[1:], ny[-1:]])
+    norms = np.hypot(vertex_nx, vertex_ny)
+    norms[norms == 0] = 1.0
+    vertex_nx, vertex_ny = vertex_nx / norms * width, vertex_ny / norms * width
+
+    def offset(sign: float) -> "np.ndarray":
+        latitudes = route_latitudes + np.degrees(sign * vertex_ny / EARTH_RADIUS_KM)
+        longitudes = route_longitudes + np.degrees(sign * vertex_nx / (EARTH_RADIUS_KM * np.cos(np.radians(route_latitudes))))
+        return np.stack([latitudes, (longitudes + 180.0) % 360.0 - 180.0], axis=-1)
+
+    return np.concatenate([offset(1.0), offset(-1.0)[::-1]])
+
+
+def points_in_polygon(latitudes: "np.ndarray", longitudes: "np.ndarray", polygon: "np.ndarray") -> "np.ndarray":
+    """Mask of the points inside a (latitude, longitude) polygon, by ray casting.
+
+    The polygon is treated as planar in degrees, which is fine for regions that
+    neither contain a pole nor cross the antimeridian.
+    """
+    import numpy as np
+
+    latitudes = np.atleast_1d(np.asarray(latitudes, dtype=float))[:, None]
+    longitudes = np.atleast_1d(np.asarray(longitudes, dtype=float))[:, None]
+    y1, x1 = polygon[:, 0], polygon[:, 1]
+    y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+    straddles = (y1 > latitudes) != (y2 > latitudes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        crossing = x1 + (latitudes - y1) * (x2 - x1) / (y2 - y1)
+    crosses = straddles & (longitudes < crossing)
+    return np.count_nonzero(crosses, axis=1) % 2 == 1
+
+
+def route_bounding_box(route_latitudes: "np.ndarray", route_longitudes: "np.ndarray", width: float = 0.0) -> Tuple[float, float, float, float]:
+    """Bounding box of a route widened by `width` kilometres, for routes not crossing the antimeridian.
+
+    Returns:
+        southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude
+    """
+    import numpy as np
+
+    boxes = bounding_boxes(route_latitudes, route_longitudes, width)
+    if np.any(boxes[:, 1] > boxes[:, 3]):
+        return (float(boxes[:, 0].min()), -180.0, float(boxes[:, 2].max()), 180.0)
+    return (float(boxes[:, 0].min()), float(boxes[:, 1].min()), float(boxes[:, 2].max()), float(boxes[:, 3].max()))
+
+
+def simplify_polyline(latitudes: "np.ndarray", longitudes: "np.ndarray", tolerance: float) -> "np.ndarray":
+    """Simplify a polyline with the Douglas-Peucker algorithm.
+
+    Points are projected onto a plane tangent at the first one, so the
+    polyline should span at most a few hundred kilometres. Each split measures
+    every point between two kept ones against the leg joining them in one
+    vectorised pass, against the leg rather than its line so that tracks
+    doubling back are kept. Simplifying n points costs O(n log n) on real
+    tracks and O(n²) at worst, so long tracks are best simplified in chunks.
+
+    Args:
+        latitudes: Latitudes of the points, shape (n,)
+        longitudes: Longitudes of the points, shape (n,)
+        tolerance: Largest distance from a dropped point to the simplified polyline, in kilometres
+
+    Returns:
+        The indices of the points kept, in order, the first and last included
+    """
+    import numpy as np
+
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    if len(latitudes) <= 2:
+        return np.arange(len(latitudes))
+
+    x, y = _local_xy(latitudes, longitudes, latitudes[0], longitudes[0])
+    keep = np.zeros(len(x), dtype=bool)
+    keep[[0, -1]] = True
+    spans = [(0, len(x) - 1)]
+    while spans:
+        start, end = spans.pop()
+        if end - start < 2:
+            continue
+        leg_x, leg_y = x[end] - x[start], y[end] - y[start]
+        point_x, point_y = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        length_squared = leg_x ** 2 + leg_y ** 2
+        t = np.clip((point_x * leg_x + point_y * leg_y) / length_squared, 0.0, 1.0) if length_squared else 0.0
+        distances = np.hypot(point_x - t * leg_x, point_y - t * leg_y)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            spans.append((start, split))
+            spans.append((split, end))
+    return np.flatnonzero(keep)
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> "np.ndarray":
+    """Decode an encoded polyline, as Strava and Google Maps return them.
+
+    Args:
+        encoded: The encoded polyline
+        precision: Number of decimals the coordinates were encoded with
+
+    Returns:
+        A float32 array of (latitude, longitude) points, of shape (n, 2)
+
+    Raises:
+        ValueError: The polyline is malformed
+    """
+    return decode_polylines([encoded], precision)[0]
+
+
+def decode_polylines(encoded: Sequence[str], precision: int = 5) -> Tuple["np.ndarray", "np.ndarray"]:
+    """Decode many encoded polylines at once.
+
+    The polylines are decoded as one: the chunks of five bits are summed per
+    value with `np.add.reduceat`, the deltas accumulated along all of them,
+    then each polyline's points moved back by the sum of the polylines before
+    it, as every polyline starts from zero.
+
+    Args:
+        encoded: The encoded polylines
+        precision: Number of decimals the coordinates were encoded with
+
+    Returns:
+        points: A float32 array of the (latitude, longitude) points of every
+            polyline, one after the other, of shape (n, 2)
+        counts: The number of points of each polyline
+
+    Raises:
+        ValueError: A polyline is malformed
+    """
+    import numpy as np
+
+    lengths = np.fromiter((len(polyline) for polyline in encoded), dtype=np.int64, count=len(encoded))
+    codes = np.frombuffer("".join(encoded).encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if not len(codes):
+        return np.empty((0, 2), dtype=np.float32), np.zeros(len(lengths), dtype=np.int64)
+
+    boundaries = np.cumsum(lengths)
+    if codes.min() < 0 or np.any(codes[boundaries[lengths > 0] - 1] >= 0x20):
+        raise ValueError("Malformed encoded polyline")
+    ends = np.flatnonzero(codes < 0x20)
+    values_before = np.searchsorted(ends, boundaries)
+    values_per_polyline = np.diff(values_before, prepend=0)
+    if np.any(values_per_polyline % 2):
+        raise ValueError("Malformed encoded polyline: odd number of values")
+
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # Position of each chunk within its value, the first chunk holding the lowest bits
+    positions = np.arange(len(codes)) - np.repeat(starts, ends - starts + 1)
+    values = np.add.reduceat((codes & 0x1F) << (5 * positions), starts)
+    values = np.where(values & 1, ~(values >> 1), values >> 1)
+    totals = np.cumsum(values.reshape(-1, 2), axis=0)
+
+    counts = values_per_polyline // 2
+    points_before = values_before // 2 - counts
+    offsets = np.where(points_before[:, None] > 0, totals[np.maximum(points_before - 1, 0)], 0)
+    points = totals - np.repeat(offsets, counts, axis=0)
+    return (points / 10 ** precision).astype(np.float32), counts
@@ -0,0 +1,240 @@
+"""Latency histograms, counters and span tracing of tool calls and upstream requests.
+
+Everything is recorded in memory by the process-wide `metrics` registry, for
+the metrics tool, the `/metrics` endpoint of the network transports and the
+periodic dump. Labels should take few distinct values: tool and upstream
+names, not segment ids.
+"""
+import asyncio
+import bisect
+import contextvars
+import itertools
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from settings import TRACE_SPANS
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("hike_and_fly.trace")
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Histogram:
+    """Bucketed distribution of observed values, with their count, sum and maximum."""
+
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        # One more count for the values above the last bucket
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, the maximum for the last one."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class Metrics:
+    """Registry of labelled counters and histograms."""
+
+    def __init__(self) -> None:
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def increment(self, name: str, value: float = 1, **labels: Any) -> None:
+        """Add `value` to a counter, such as metrics.increment("upstream_bytes_total", 512, upstream="strava_api")."""
+        key = (name, _labels(labels))
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record a value, such as a latency in seconds, in a histogram."""
+        key = (name, _labels(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels: Any) -> Iterator[None]:
+        """Record the time spent in a block in a histogram."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def counter(self, name: str, **labels: Any) -> float:
+        return self._counters.get((name, _labels(labels)), 0)
+
+    def histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        return self._histograms.get((name, _labels(labels)))
+
+    def snapshot(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        """Every counter and histogram, grouped by name, as JSON-serialisable dicts."""
+        counters: Dict[str, List[Dict[str, Any]]] = {}
+        for (name, labels), value in sorted(self._counters.items()):
+            counters.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        histograms: Dict[str, List[Dict[str, Any]]] = {}
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            histograms.setdefault(name, []).append({"labels": dict(labels), **histogram.as_dict()})
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Every counter and histogram in the Prometheus text exposition format."""
+        def format_labels(labels: Labels, extra: Labels = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+        lines = []
+        previous = None
+        for (name, labels), value in sorted(self._counters.items()):
+            if name != previous:
+                lines.append(f"# TYPE {name} counter")
+                previous = name
+            lines.append(f"{name}{format_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+            if name != previous:
+                lines.append(f"# TYPE {name} histogram")
+                previous = name
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{format_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{format_labels(labels, (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        """Write a JSON snapshot to a file, replacing it atomically."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"time": time.time(), **self.snapshot()}, file)
+        os.replace(temporary, path)
+
+    def reset(self) -> None:
+        self._counters.clear()
+        self._histograms.clear()
+
+
+metrics = Metrics()
+
+
+async def dump_periodically(path: str, interval: float) -> None:
+    """Dump the metrics to `path` every `interval` seconds, until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            metrics.dump(path)
+        except OSError as e:
+            logger.warning(f"Unable to dump the metrics to {path}: {e}")
+
+
+async def monitor_event_loop_lag(interval: float) -> None:
+    """Record how late the event loop wakes up from sleeps of `interval` seconds, until cancelled.
+
+    A late wake-up means a callback held the loop, such as a parse, delaying
+    every call served meanwhile. The delays go to the `event_loop_lag_seconds`
+    histogram.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("event_loop_lag_seconds", max(loop.time() - started - interval, 0.0))
+
+
+class Span:
+    """One timed phase of a trace."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes")
+
+    def __init__(self, name: str, trace_id: int, span_id: int, parent_id: Optional[int], attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.attributes = attributes
+
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """Time a phase, such as a tool call, an upstream request or a parse.
+
+    The duration is recorded in the `<name>_seconds` histogram labelled by the
+    attributes, and failures counted in `<name>_errors_total`. With TRACE_SPANS
+    set, each span is also logged as a JSON line, linked to the span it runs in.
+    """
+    parent = _current_span.get()
+    span_id = next(_span_ids)
+    current = Span(name, parent.trace_id if parent else span_id, span_id, parent.span_id if parent else None, dict(attributes))
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = type(e).__name__
+        metrics.increment(f"{name}_errors_total", **attributes, error=error)
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _current_span.reset(token)
+        metrics.observe(f"{name}_seconds", duration, **attributes)
+        if TRACE_SPANS:
+            trace_logger.info(json.dumps({
+                "span": name,
+                "trace_id": current.trace_id,
+                "span_id": span_id,
+                "parent_id": current.parent_id,
+                "duration_ms": round(duration * 1000, 3),
+                "error": error,
+                **current.attributes,
+            }))
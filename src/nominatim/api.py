@@ -1,14 +1,54 @@
+from typing import Dict, Optional
 
 import httpx
 
+from clients.errors import UpstreamError
+from clients.pool import get_http_pool
+from clients.ratelimit import INTERACTIVE, RequestScheduler, TokenBucket
+from clients.resilience import ResilientUpstream
+from clients.singleflight import SingleFlight
+from settings import NOMINATIM_REQUESTS_PER_SECOND
 
-async def make_nominatim_request(url: str) -> dict:
-    """Make a request to the Nominatim API with proper error handling."""
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except Exception:
-            return None
+NOMINATIM = "nominatim"
 
+# Nominatim's usage policy asks for an identifying User-Agent, at most two
+# parallel connections and at most one request per second
+get_http_pool().register(
+    NOMINATIM,
+    max_connections=2,
+    max_keepalive_connections=2,
+    headers={"User-Agent": "mcp-hike-and-fly/0.1.0"},
+)
+nominatim_scheduler = RequestScheduler(
+    "Nominatim",
+    TokenBucket(rate=NOMINATIM_REQUESTS_PER_SECOND, capacity=1),
+)
+nominatim_flights = SingleFlight("Nominatim")
+# Duplicate requests would go against the usage policy, they are never hedged
+nominatim_resilience = ResilientUpstream(NOMINATIM, hedge=False)
+
+
+async def make_nominatim_request(
+    url: str, params: Optional[Dict[str, str]] = None, priority: int = INTERACTIVE
+) -> dict:
+    """Make a request to the Nominatim API, retrying transient failures.
+
+    Concurrent identical requests share a single upstream request.
+
+    Raises:
+        UpstreamError: Nominatim could not be queried
+    """
+    key = (url, tuple(sorted((params or {}).items())))
+    return await nominatim_flights.do(key, lambda: _make_nominatim_request(url, params, priority))
+
+
+async def _make_nominatim_request(url: str, params: Optional[Dict[str, str]], priority: int) -> dict:
+    async def send() -> httpx.Response:
+        await nominatim_scheduler.acquire(priority)
+        return await get_http_pool().get(NOMINATIM, url, params=params)
+
+    response = await nominatim_resilience.get(send)
+    try:
+        return response.json()
+    except ValueError as e:
+        raise UpstreamError(NOMINATIM, f"invalid JSON answer: {e}") from e
@@ -0,0 +1,229 @@
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from clients.errors import UpstreamError, UpstreamUnavailableError
+from clients.ratelimit import INTERACTIVE
+from settings import (
+    GAZETTEER_MIN_SIMILARITY,
+    GAZETTEER_PATH,
+    GAZETTEER_REVERSE_RADIUS,
+    GEOCODING_BACKEND,
+    NOMINATIM_API_BASE,
+)
+
+from .api import make_nominatim_request
+from .cache import normalise_address
+from .gazetteer import Gazetteer
+
+logger = logging.getLogger(__name__)
+
+NOT_FOUND = {"error": "Unable to geocode"}
+
+
+class GeocodingBackend(ABC):
+    """Source of geocoding answers, shaped like Nominatim's JSON answers."""
+
+    name = "backend"
+
+    def __init__(self) -> None:
+        self.answered = 0
+
+    @abstractmethod
+    async def search(self, query: str, priority: int = INTERACTIVE) -> Optional[List[Dict[str, str]]]:
+        """Find the places matching a normalised address.
+
+        Returns:
+            The places, best first, an empty list when there are none
+
+        Raises:
+            UpstreamError: The backend could not be queried
+        """
+
+    @abstractmethod
+    async def reverse(self, latitude: float, longitude: float, priority: int = INTERACTIVE) -> Optional[Dict[str, str]]:
+        """Find the address of a location.
+
+        Returns:
+            The place, with an `error` key when there is none
+
+        Raises:
+            UpstreamError: The backend could not be queried
+        """
+
+    def stats(self) -> Dict[str, int]:
+        """Number of lookups answered per backend."""
+        return {self.name: self.answered}
+
+    def close(self) -> None:
+        pass
+
+
+class NominatimBackend(GeocodingBackend):
+    """The public Nominatim API, throttled to its usage policy."""
+
+    name = "nominatim"
+
+    async def search(self, query: str, priority: int = INTERACTIVE) -> Optional[List[Dict[str, str]]]:
+        data = await make_nominatim_request(
+            f"{NOMINATIM_API_BASE}/search", params={"q": query, "format": "json"}, priority=priority
+        )
+        self.answered += 1
+        return data
+
+    async def reverse(self, latitude: float, longitude: float, priority: int = INTERACTIVE) -> Optional[Dict[str, str]]:
+        data = await make_nominatim_request(
+            f"{NOMINATIM_API_BASE}/reverse",
+            params={"lat": f"{latitude:.5f}", "lon": f"{longitude:.5f}", "format": "json"},
+            priority=priority,
+        )
+        self.answered += 1
+        return data
+
+
+class GazetteerBackend(GeocodingBackend):
+    """The local gazetteer index, opened on first use.
+
+    An address matches when its name is in the index, or its first part is and
+    every other part appears in the place's label, such as "chamonix, fr". Names
+    sharing enough trigrams with the address match too, to absorb typos.
+    """
+
+    name = "gazetteer"
+
+    def __init__(
+        self,
+        path: str = GAZETTEER_PATH,
+        min_similarity: float = GAZETTEER_MIN_SIMILARITY,
+        reverse_radius: float = GAZETTEER_REVERSE_RADIUS,
+    ) -> None:
+        super().__init__()
+        self.path = path
+        self.min_similarity = min_similarity
+        self.reverse_radius = reverse_radius
+        self._gazetteer: Optional[Gazetteer] = None
+
+    @property
+    def gazetteer(self) -> Gazetteer:
+        """The index, opened on first use.
+
+        Raises:
+            UpstreamUnavailableError: The index has not been built, so no lookup
+                can tell whether a place exists
+        """
+        if self._gazetteer is None:
+            if not os.path.exists(self.path):
+                raise UpstreamUnavailableError("Gazetteer", f"no index at {self.path}, build it with `make gazetteer`")
+            self._gazetteer = Gazetteer(self.path)
+        return self._gazetteer
+
+    async def search(self, query: str, priority: int = INTERACTIVE) -> Optional[List[Dict[str, str]]]:
+        gazetteer = self.gazetteer
+        places = gazetteer.lookup(query)
+        if not places and ", " in query:
+            name, *context = query.split(", ")
+            places = [
+                place for place in gazetteer.lookup(name)
+                if all(part in normalise_address(place.label) for part in context)
+            ]
+        if not places and self.min_similarity < 1:
+            places = [place for place, _ in gazetteer.fuzzy(query, limit=1, min_similarity=self.min_similarity)]
+
+        if places:
+            self.answered += 1
+            logger.debug(f"Gazetteer match for {query}: {places[0]}")
+        return [place.as_nominatim() for place in places]
+
+    async def reverse(self, latitude: float, longitude: float, priority: int = INTERACTIVE) -> Optional[Dict[str, str]]:
+        place = self.gazetteer.nearest(latitude, longitude, self.reverse_radius)
+        if place is None:
+            return NOT_FOUND
+        self.answered += 1
+        return place.as_nominatim()
+
+    def close(self) -> None:
+        if self._gazetteer is not None:
+            self._gazetteer.close()
+            self._gazetteer = None
+
+
+class ChainedBackend(GeocodingBackend):
+    """Ask each backend in turn, until one finds the place.
+
+    A backend that fails is skipped. The answer of the last backend is
+    returned as is, so that it decides between "no such place" and a failure.
+    """
+
+    name = "chained"
+
+    def __init__(self, backends: List[GeocodingBackend]) -> None:
+        super().__init__()
+        self.backends = backends
+
+    async def search(self, query: str, priority: int = INTERACTIVE) -> Optional[List[Dict[str, str]]]:
+        for backend in self.backends[:-1]:
+            try:
+                data = await backend.search(query, priority)
+            except UpstreamError as e:
+                logger.warning(f"Geocoding backend {backend.name} failed, trying the next one: {e}")
+                continue
+            if data:
+                return data
+        return await self.backends[-1].search(query, priority)
+
+    async def reverse(self, latitude: float, longitude: float, priority: int = INTERACTIVE) -> Optional[Dict[str, str]]:
+        for backend in self.backends[:-1]:
+            try:
+                data = await backend.reverse(latitude, longitude, priority)
+            except UpstreamError as e:
+                logger.warning(f"Geocoding backend {backend.name} failed, trying the next one: {e}")
+                continue
+            if data and "error" not in data:
+                return data
+        return await self.backends[-1].reverse(latitude, longitude, priority)
+
+    def stats(self) -> Dict[str, int]:
+        return {name: answered for backend in self.backends for name, answered in backend.stats().items()}
+
+    def close(self) -> None:
+        for backend in self.backends:
+            backend.close()
+
+
+def create_geocoding_backend(kind: str = GEOCODING_BACKEND) -> GeocodingBackend:
+    """Create the backend of a GEOCODING_BACKEND setting.
+
+    Args:
+        kind: "remote" for Nominatim, "local" for the gazetteer, "auto" for the
+            gazetteer when its index exists with Nominatim as fallback
+    """
+    if kind == "remote":
+        return NominatimBackend()
+    if kind == "local":
+        return GazetteerBackend()
+    if kind != "auto":
+        raise ValueError(f"Unknown geocoding backend: {kind}")
+    if not os.path.exists(GAZETTEER_PATH):
+        logger.debug(f"No gazetteer index at {GAZETTEER_PATH}, geocoding with Nominatim only")
+        return NominatimBackend()
+    return ChainedBackend([GazetteerBackend(), NominatimBackend()])
+
+
+_backend: Optional[GeocodingBackend] = None
+
+
+def get_geocoding_backend() -> GeocodingBackend:
+    """Get the process-wide geocoding backend, creating it from the settings if needed."""
+    global _backend
+    if _backend is None:
+        _backend = create_geocoding_backend()
+    return _backend
+
+
+def close_geocoding_backend() -> None:
+    """Close the process-wide geocoding backend."""
+    global _backend
+    if _backend is not None:
+        _backend.close()
+        _backend = None
@@ -0,0 +1,41 @@
+import re
+import unicodedata
+
+from cache.tiered import TieredCache
+from settings import GEOCODE_CACHE_SIZE, GEOCODE_CACHE_TTL, GEOCODE_NEGATIVE_CACHE_TTL
+
+_WHITESPACE = re.compile(r"\s+")
+_SEPARATORS = re.compile(r"\s*,\s*")
+
+geocode_cache = TieredCache(
+    "geocode",
+    maxsize=GEOCODE_CACHE_SIZE,
+    ttl=GEOCODE_CACHE_TTL,
+    negative_ttl=GEOCODE_NEGATIVE_CACHE_TTL,
+)
+reverse_geocode_cache = TieredCache(
+    "reverse_geocode",
+    maxsize=GEOCODE_CACHE_SIZE,
+    ttl=GEOCODE_CACHE_TTL,
+    negative_ttl=GEOCODE_NEGATIVE_CACHE_TTL,
+)
+
+
+def normalise_address(address: str) -> str:
+    """Normalise an address so that spelling variants share one cache entry.
+
+    Args:
+        address: The address as typed by the user
+
+    Returns:
+        The address case-folded, with collapsed whitespace and comma separators
+    """
+    address = unicodedata.normalize("NFKC", address).casefold()
+    address = _WHITESPACE.sub(" ", address)
+    address = _SEPARATORS.sub(", ", address)
+    return address.strip(" ,.;")
+
+
+def coordinates_key(latitude: float, longitude: float) -> str:
+    """Round coordinates to about a metre so that nearby points share one cache entry."""
+    return f"{latitude:.5f},{longitude:.5f}"
@@ -0,0 +1,343 @@
+"""Compact on-disk index of place names, built from GeoNames extracts.
+
+The index is a single file memory-mapped on open, so lookups touch only the
+pages they need and several processes share one copy in the page cache:
+
+    header     magic and the size of each section
+    places     coordinates, population and feature of each place, by latitude
+    names      normalised names sorted by name then population, each pointing
+               to its place, searched by bisection for exact and prefix lookups
+    trigrams   hash of each name trigram with its slice of the postings
+    postings   indices of the names containing each trigram
+    strings    UTF-8 names and labels
+
+Build it from one or more GeoNames dumps (https://download.geonames.org/export/dump/):
+
+    cd src && python -m nominatim.gazetteer FR.txt CH.txt IT.txt
+"""
+import argparse
+import bisect
+import logging
+import math
+import mmap
+import os
+import struct
+import zlib
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from settings import GAZETTEER_PATH
+
+from .cache import normalise_address
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"HFGAZ001"
+HEADER = struct.Struct("<8s5Q")
+
+# GeoNames feature classes: P populated places, T mountains, passes and hills,
+# S spots such as huts, L parks and areas, H water
+DEFAULT_FEATURE_CLASSES = ("P", "T")
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _place_dtype():
+    import numpy as np
+
+    return np.dtype([
+        ("latitude", "<f8"),
+        ("longitude", "<f8"),
+        ("label_offset", "<u4"),
+        ("label_length", "<u4"),
+        ("population", "<u4"),
+        ("feature", "S8"),
+    ])
+
+
+def _name_dtype():
+    import numpy as np
+
+    return np.dtype([("offset", "<u4"), ("length", "<u4"), ("trigrams", "<u4"), ("place", "<u4")])
+
+
+def _trigram_dtype():
+    import numpy as np
+
+    return np.dtype([("hash", "<u4"), ("start", "<u4"), ("count", "<u4")])
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def trigrams(key: str) -> Set[int]:
+    """Hash the character trigrams of a normalised name, padded so that word starts weigh more."""
+    padded = f"  {key} "
+    return {zlib.crc32(padded[i:i + 3].encode("utf-8")) for i in range(len(padded) - 2)}
+
+
+class Place:
+    """A place of the gazetteer."""
+
+    __slots__ = ("label", "latitude", "longitude", "population", "feature")
+
+    def __init__(self, label: str, latitude: float, longitude: float, population: int, feature: str) -> None:
+        self.label = label
+        self.latitude = latitude
+        self.longitude = longitude
+        self.population = population
+        self.feature = feature
+
+    def as_nominatim(self) -> Dict[str, str]:
+        """Shape the place like an entry of a Nominatim answer."""
+        return {
+            "lat": repr(self.latitude),
+            "lon": repr(self.longitude),
+            "display_name": self.label,
+            "type": self.feature,
+        }
+
+    def __repr__(self) -> str:
+        return f"Place(label={self.label!r}, latitude={self.latitude}, longitude={self.longitude})"
+
+
+class _SortedKeys:
+    """Sequence view of the sorted name keys, for bisection without decoding them all."""
+
+    def __init__(self, gazetteer: "Gazetteer") -> None:
+        self._gazetteer = gazetteer
+
+    def __len__(self) -> int:
+        return len(self._gazetteer._names)
+
+    def __getitem__(self, index: int) -> bytes:
+        return self._gazetteer._name_key(index)
+
+
+class Gazetteer:
+    """Read-only, memory-mapped index of place names."""
+
+    def __init__(self, path: str) -> None:
+        import numpy as np
+
+        self.path = path
+        with open(path, "rb") as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_places, n_names, n_trigrams, n_postings, strings_size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a gazetteer index")
+
+        offset = _align(HEADER.size)
+        self._places = np.frombuffer(self._mmap, _place_dtype(), n_places, offset)
+        offset = _align(offset + self._places.nbytes)
+        self._names = np.frombuffer(self._mmap, _name_dtype(), n_names, offset)
+        offset = _align(offset + self._names.nbytes)
+        self._trigrams = np.frombuffer(self._mmap, _trigram_dtype(), n_trigrams, offset)
+        offset = _align(offset + self._trigrams.nbytes)
+        self._postings = np.frombuffer(self._mmap, "<u4", n_postings, offset)
+        self._strings_offset = _align(offset + self._postings.nbytes)
+        self._keys = _SortedKeys(self)
+        logger.debug(f"Opened gazetteer {path}: {n_places} places, {n_names} names")
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def _string(self, offset: int, length: int) -> bytes:
+        start = self._strings_offset + int(offset)
+        return self._mmap[start:start + int(length)]
+
+    def _name_key(self, index: int) -> bytes:
+        name = self._names[index]
+        return self._string(name["offset"], name["length"])
+
+    def _place(self, index: int) -> Place:
+        place = self._places[index]
+        return Place(
+            label=self._string(place["label_offset"], place["label_length"]).decode("utf-8"),
+            latitude=float(place["latitude"]),
+            longitude=float(place["longitude"]),
+            population=int(place["population"]),
+            feature=place["feature"].decode("ascii"),
+        )
+
+    def lookup(self, name: str) -> List[Place]:
+        """Find the places named exactly `name`, most populated first."""
+        key = normalise_address(name).encode("utf-8")
+        index = bisect.bisect_left(self._keys, key)
+        places = []
+        while index < len(self._names) and self._name_key(index) == key:
+            places.append(self._place(self._names[index]["place"]))
+            index += 1
+        return places
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Find the places whose name starts with `prefix`, most populated first."""
+        key = normalise_address(prefix).encode("utf-8")
+        index = bisect.bisect_left(self._keys, key)
+        indices = []
+        # Names are sorted alphabetically, so look a little further than `limit`
+        # to rank the matches by population
+        while index < len(self._names) and len(indices) < limit * 10 and self._name_key(index).startswith(key):
+            indices.append(int(self._names[index]["place"]))
+            index += 1
+        indices = sorted(dict.fromkeys(indices), key=lambda place: -int(self._places[place]["population"]))
+        return [self._place(place) for place in indices[:limit]]
+
+    def fuzzy(self, name: str, limit: int = 10, min_similarity: float = 0.5) -> List[Tuple[Place, float]]:
+        """Find the places whose name shares the most trigrams with `name`.
+
+        Returns:
+            The places and the Jaccard similarity of their name's trigrams, best first
+        """
+        import numpy as np
+
+        query = np.fromiter(trigrams(normalise_address(name)), dtype=np.uint32)
+        hashes = self._trigrams["hash"]
+        positions = np.searchsorted(hashes, query)
+        present = positions < len(hashes)
+        present[present] = hashes[positions[present]] == query[present]
+        found = self._trigrams[positions[present]]
+        if not len(found):
+            return []
+
+        postings = np.concatenate([self._postings[start:start + count] for start, count in zip(found["start"], found["count"])])
+        names, shared = np.unique(postings, return_counts=True)
+        similarity = shared / (len(query) + self._names["trigrams"][names] - shared)
+        order = np.argsort(-similarity, kind="stable")
+        results = []
+        seen = set()
+        for position in order:
+            if similarity[position] < min_similarity or len(results) == limit:
+                break
+            place = int(self._names[names[position]]["place"])
+            if place not in seen:
+                seen.add(place)
+                results.append((self._place(place), float(similarity[position])))
+        return results
+
+    def nearest(self, latitude: float, longitude: float, radius: float) -> Optional[Place]:
+        """Find the place closest to a location, within `radius` kilometres."""
+        import numpy as np
+
+        window = math.degrees(radius / EARTH_RADIUS_KM)
+        latitudes = self._places["latitude"]
+        start, end = np.searchsorted(latitudes, [latitude - window, latitude + window])
+        if start == end:
+            return None
+
+        candidates = self._places[start:end]
+        lat1, lat2 = math.radians(latitude), np.radians(candidates["latitude"])
+        dlon = np.radians(candidates["longitude"] - longitude)
+        haversine = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(haversine))
+        closest = int(np.argmin(distances))
+        if distances[closest] > radius:
+            return None
+        return self._place(start + closest)
+
+    def close(self) -> None:
+        # The arrays export the map's buffer, drop them before closing it
+        self._places = self._names = self._trigrams = self._postings = None
+        self._mmap.close()
+
+
+def read_geonames(path: str, feature_classes: Iterable[str] = DEFAULT_FEATURE_CLASSES) -> Iterable[Tuple[List[str], Tuple[float, float, int, str, str]]]:
+    """Read the places of a GeoNames dump.
+
+    Yields:
+        The names of each place and its latitude, longitude, population, feature
+        and label
+    """
+    feature_classes = set(feature_classes)
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            columns = line.rstrip("\n").split("\t")
+            if len(columns) < 15 or columns[6] not in feature_classes:
+                continue
+            name, ascii_name = columns[1], columns[2]
+            names = [name] if not ascii_name or ascii_name == name else [name, ascii_name]
+            label = f"{name}, {columns[8]}" if columns[8] else name
+            population = int(columns[14]) if columns[14].isdigit() else 0
+            yield names, (float(columns[4]), float(columns[5]), population, f"{columns[6]}.{columns[7]}", label)
+
+
+def build_gazetteer(paths: Iterable[str], output: str, feature_classes: Iterable[str] = DEFAULT_FEATURE_CLASSES) -> int:
+    """Build the index of the places of GeoNames dumps.
+
+    Args:
+        paths: GeoNames dumps, such as FR.txt or cities500.txt
+        output: Path of the index, replaced atomically
+        feature_classes: GeoNames feature classes to keep
+
+    Returns:
+        The number of places indexed
+    """
+    import numpy as np
+
+    records = []
+    for path in paths:
+        records.extend(read_geonames(path, feature_classes))
+    records.sort(key=lambda record: record[1][0])
+
+    strings = bytearray()
+
+    def add_string(text: str) -> Tuple[int, int]:
+        data = text.encode("utf-8")
+        strings.extend(data)
+        return len(strings) - len(data), len(data)
+
+    places = np.zeros(len(records), dtype=_place_dtype())
+    entries = []
+    for index, (names, (latitude, longitude, population, feature, label)) in enumerate(records):
+        label_offset, label_length = add_string(label)
+        places[index] = (latitude, longitude, label_offset, label_length, population, feature.encode("ascii"))
+        for key in dict.fromkeys(normalise_address(name) for name in names):
+            if key:
+                entries.append((key.encode("utf-8"), -population, index, key))
+    entries.sort()
+
+    names = np.zeros(len(entries), dtype=_name_dtype())
+    postings_of: Dict[int, List[int]] = {}
+    for index, (encoded, _, place, key) in enumerate(entries):
+        name_trigrams = trigrams(key)
+        offset, length = add_string(key)
+        names[index] = (offset, length, len(name_trigrams), place)
+        for trigram in name_trigrams:
+            postings_of.setdefault(trigram, []).append(index)
+
+    trigram_table = np.zeros(len(postings_of), dtype=_trigram_dtype())
+    postings = []
+    for index, trigram in enumerate(sorted(postings_of)):
+        trigram_table[index] = (trigram, len(postings), len(postings_of[trigram]))
+        postings.extend(postings_of[trigram])
+    postings = np.asarray(postings, dtype="<u4")
+
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    temporary = f"{output}.tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(places), len(names), len(trigram_table), len(postings), len(strings)))
+        for section in (places.tobytes(), names.tobytes(), trigram_table.tobytes(), postings.tobytes(), bytes(strings)):
+            file.write(b"\0" * (_align(file.tell()) - file.tell()))
+            file.write(section)
+    os.replace(temporary, output)
+    logger.info(f"Built gazetteer {output}: {len(places)} places, {len(names)} names")
+    return len(places)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the local gazetteer index from GeoNames dumps")
+    parser.add_argument("paths", nargs="+", help="GeoNames dumps, such as FR.txt")
+    parser.add_argument("--output", default=GAZETTEER_PATH, help="Path of the index")
+    parser.add_argument(
+        "--feature-classes",
+        default=",".join(DEFAULT_FEATURE_CLASSES),
+        help="Comma separated GeoNames feature classes to keep",
+    )
+    args = parser.parse_args()
+    count = build_gazetteer(args.paths, args.output, args.feature_classes.split(","))
+    print(f"Indexed {count} places into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
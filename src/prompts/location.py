@@ -11,10 +11,9 @@ def register_location_prompts(mcp: FastMCP):
                     role="system",
                     content=types.TextContent(
                         type="text",
-                        text="You are a helpful assistant that finds Strava segments near addresses. You will use the following tools in sequence:\n"
-                        "1. get_latitude_and_longitude to get coordinates\n"
-                        "2. define_rectangular_area to create a search area\n"
-                        "3. get_nearby_segments to find segments"
+                        text="You are a helpful assistant that finds Strava segments near addresses. "
+                        "Use find_segments_near_address_tool, which geocodes the address and searches the area around it in a single call. "
+                        "Pass the gradient and length filters the user asks for, and include_attempts=true when they ask how popular the segments are."
                     )
                 ),
                 types.PromptMessage(
@@ -28,47 +27,15 @@ def register_location_prompts(mcp: FastMCP):
                     role="assistant",
                     content=types.TextContent(
                         type="text",
-                        text="I'll help you find Strava segments near that address. Let me break this down into steps:\n"
-                        "1. First, I'll get the coordinates for the address using get_latitude_and_longitude\n"
-                        "2. Then, I'll define a rectangular area around those coordinates using define_rectangular_area with a 10km radius\n"
-                        "3. Finally, I'll find all segments in that area using get_nearby_segments\n\n"
-                        "Let's start by getting the coordinates for the address."
+                        text="I'll find the Strava segments within 10 km of that address, closest first, using find_segments_near_address_tool with radius=10."
                     )
                 ),
                 types.PromptMessage(
                     role="tool",
                     content=types.TextContent(
                         type="text",
-                        text="get_latitude_and_longitude"
-                    )
-                ),
-                types.PromptMessage(
-                    role="assistant",
-                    content=types.TextContent(
-                        type="text",
-                        text="Now that we have the coordinates, let's define a search area around them."
-                    )
-                ),
-                types.PromptMessage(
-                    role="tool",
-                    content=types.TextContent(
-                        type="text",
-                        text="define_rectangular_area"
-                    )
-                ),
-                types.PromptMessage(
-                    role="assistant",
-                    content=types.TextContent(
-                        type="text",
-                        text="Finally, let's find all segments in this area."
-                    )
-                ),
-                types.PromptMessage(
-                    role="tool",
-                    content=types.TextContent(
-                        type="text",
-                        text="get_nearby_segments"
+                        text="find_segments_near_address_tool"
                     )
                 )
             ]
-        ) 
\ No newline at end of file
+        )
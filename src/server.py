@@ -1,32 +1,201 @@
+import argparse
+import asyncio
 import logging
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional, Sequence
 
 from mcp.server.fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response
 
+from cache.sqlite import close_cache_store
+from clients.pool import get_http_pool
+from concurrency import ToolCallLimiter, close_cpu_executor
+from metrics import (
+    dump_periodically,
+    metrics,
+    monitor_event_loop_lag,
+    span,
+    trace_logger,
+)
+from nominatim.backends import close_geocoding_backend
 from prompts.location import register_location_prompts
 from prompts.segments import register_segment_prompts
+from settings import (
+    EVENT_LOOP_LAG_INTERVAL,
+    HOT_SEGMENTS,
+    LOG_LEVEL,
+    MCP_HOST,
+    MCP_PORT,
+    MCP_SESSION_CONCURRENCY,
+    MCP_TRANSPORT,
+    MCP_WORKERS,
+    METRICS_DUMP_INTERVAL,
+    METRICS_DUMP_PATH,
+    TRACE_SPANS,
+)
+from strava.details import close_detail_store
+from strava.efforts import close_effort_store
+from strava.refresh import climb_attempts_cache
 from tools.nominatim import (
     register_location_tools,
 )
+from tools.server import register_server_tools
 from tools.strava import register_segment_tools
 
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
 logger = logging.getLogger(__name__)
 
-# Initialize FastMCP server
-mcp = FastMCP("hike-and-fly")
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+# Sessions currently holding the shared resources open
+_open_sessions = 0
+# Task dumping the metrics to METRICS_DUMP_PATH while sessions are open
+_metrics_dump: Optional[asyncio.Task] = None
+# Task sampling the event loop lag while sessions are open
+_lag_monitor: Optional[asyncio.Task] = None
+# Held while the shared resources are opened or closed, so that a session
+# starting during the teardown of the last one waits for it, then reopens them
+_lifespan_lock = asyncio.Lock()
+
+
+def configure_logging(level: str = LOG_LEVEL) -> None:
+    """Send the logs to stderr, stdout being the channel of the stdio transport."""
+    logging.basicConfig(
+        level=level,
+        stream=sys.stderr,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if TRACE_SPANS:
+        trace_logger.setLevel(logging.INFO)
+
+
+@asynccontextmanager
+async def app_lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Open the shared upstream clients with the first session and close them and
+    the caches with the last one.
+
+    Network transports run the lifespan once per session, while the clients,
+    caches and stores are shared by every session of the process.
+    """
+    global _open_sessions, _metrics_dump, _lag_monitor
+    pool = get_http_pool()
+    async with _lifespan_lock:
+        if _open_sessions == 0:
+            await pool.start()
+            climb_attempts_cache.warm(HOT_SEGMENTS)
+            if METRICS_DUMP_PATH:
+                _metrics_dump = asyncio.create_task(dump_periodically(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL))
+            if EVENT_LOOP_LAG_INTERVAL > 0:
+                _lag_monitor = asyncio.create_task(monitor_event_loop_lag(EVENT_LOOP_LAG_INTERVAL))
+        _open_sessions += 1
+    try:
+        yield
+    finally:
+        async with _lifespan_lock:
+            _open_sessions -= 1
+            if _open_sessions == 0:
+                if _metrics_dump is not None:
+                    _metrics_dump.cancel()
+                    _metrics_dump = None
+                    metrics.dump(METRICS_DUMP_PATH)
+                if _lag_monitor is not None:
+                    _lag_monitor.cancel()
+                    _lag_monitor = None
+                await climb_attempts_cache.stop()
+                await pool.aclose()
+                close_cache_store()
+                close_geocoding_backend()
+                close_effort_store()
+                close_detail_store()
+                close_cpu_executor()
+
+
+class HikeAndFlyMCP(FastMCP):
+    """FastMCP server bounding the tool calls running at once and timing them."""
+
+    def __init__(self, *args: Any, limiter: ToolCallLimiter, **kwargs: Any) -> None:
+        self.limiter = limiter
+        super().__init__(*args, **kwargs)
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any]) -> Sequence[Any]:
+        try:
+            session = self._mcp_server.request_context.session
+        except LookupError:
+            session = None
+        with span("tool", tool=name):
+            queued = time.perf_counter()
+            async with self.limiter.limit(session):
+                metrics.observe("tool_queue_seconds", time.perf_counter() - queued, tool=name)
+                return await super().call_tool(name, arguments)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    """Parse the command line, defaulting to the environment settings."""
+    parser = argparse.ArgumentParser(description="Hike and fly MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default=MCP_TRANSPORT, help="MCP transport, a network one serves many sessions from one process")
+    parser.add_argument("--host", default=MCP_HOST, help="Address the network transports listen on")
+    parser.add_argument("--port", type=int, default=MCP_PORT, help="Port the network transports listen on")
+    parser.add_argument("--workers", type=int, default=MCP_WORKERS, help="Maximum number of tool calls running at once over all sessions")
+    parser.add_argument("--session-concurrency", type=int, default=MCP_SESSION_CONCURRENCY, help="Maximum number of tool calls running at once in one session")
+    return parser.parse_args(argv)
+
+
+
+def create_server(
+    workers: int = MCP_WORKERS,
+    session_concurrency: int = MCP_SESSION_CONCURRENCY,
+    host: str = MCP_HOST,
+    port: int = MCP_PORT,
+) -> HikeAndFlyMCP:
+    """Create the server and register its tools, prompts and routes.
+
+    Nothing is built when this module is imported: the workers of the process
+    pool import it again as their `__main__`, and only need the parsers.
+
+    Args:
+        workers: Maximum number of tool calls running at once over all sessions
+        session_concurrency: Maximum number of tool calls running at once in one session
+        host: Address the network transports listen on
+        port: Port the network transports listen on
+    """
+    mcp = HikeAndFlyMCP(
+        "hike-and-fly",
+        lifespan=app_lifespan,
+        host=host,
+        port=port,
+        limiter=ToolCallLimiter(workers, session_concurrency),
+    )
+    if host not in LOOPBACK_HOSTS and getattr(mcp.settings, "transport_security", None) is not None:
+        # DNS rebinding protection only applies to servers bound to loopback
+        mcp.settings.transport_security = None
+
+    if hasattr(mcp, "custom_route"):
+        @mcp.custom_route("/metrics", methods=["GET"])
+        async def metrics_endpoint(request: Request) -> Response:
+            """Expose the metrics to Prometheus on the network transports."""
+            return PlainTextResponse(metrics.to_prometheus(), media_type="text/plain; version=0.0.4")
+
+    # Register tools
+    register_location_tools(mcp)
+    register_segment_tools(mcp)
+    register_server_tools(mcp)
+
+    # Register prompts
+    register_location_prompts(mcp)
+    register_segment_prompts(mcp)
+    return mcp
+
 
-# Register tools
-register_location_tools(mcp)
-register_segment_tools(mcp)
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    """Run the server with the transport and limits of the command line."""
+    configure_logging()
+    args = parse_args(argv)
+    mcp = create_server(args.workers, args.session_concurrency, args.host, args.port)
+    logger.info(f"Starting the {args.transport} transport")
+    mcp.run(transport=args.transport)
 
-# Register prompts
-register_location_prompts(mcp)
-register_segment_prompts(mcp)
 
 if __name__ == "__main__":
-    # Initialize and run the server
-    mcp.run(transport='stdio')
\ No newline at end of file
+    main()
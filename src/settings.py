@@ -0,0 +1,137 @@
+import os
+from typing import Tuple
+
+from dotenv import load_dotenv
+
+# Every setting is read below, so .env is loaded once here rather than by the
+# modules that happen to need a variable
+load_dotenv()
+
+
+def _env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment."""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment."""
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_ints(name: str) -> Tuple[int, ...]:
+    """Read a comma-separated list of integers from the environment."""
+    value = os.getenv(name) or ""
+    return tuple(int(item) for item in value.split(",") if item.strip())
+
+
+def _env_bool(name: str, default: bool = False) -> bool:
+    """Read a boolean setting from the environment, such as 1, true or yes."""
+    value = os.getenv(name)
+    return value.strip().lower() in ("1", "true", "yes", "on") if value else default
+
+
+# Upstream services, pointed at a local mock server by the benchmarks
+STRAVA_API_BASE = os.getenv("STRAVA_API_BASE", "https://www.strava.com/api/v3")
+STRAVA_WEB_BASE = os.getenv("STRAVA_WEB_BASE", "https://www.strava.com")
+NOMINATIM_API_BASE = os.getenv("NOMINATIM_API_BASE", "https://nominatim.openstreetmap.org")
+
+# Shared HTTP client pool
+HTTP_MAX_CONNECTIONS_PER_HOST = _env_int("HTTP_MAX_CONNECTIONS_PER_HOST", 10)
+HTTP_MAX_KEEPALIVE_CONNECTIONS = _env_int("HTTP_MAX_KEEPALIVE_CONNECTIONS", 5)
+HTTP_KEEPALIVE_EXPIRY = _env_float("HTTP_KEEPALIVE_EXPIRY", 60.0)
+HTTP_TIMEOUT = _env_float("HTTP_TIMEOUT", 30.0)
+HTTP_CONNECT_TIMEOUT = _env_float("HTTP_CONNECT_TIMEOUT", 5.0)
+HTTP_READ_TIMEOUT = _env_float("HTTP_READ_TIMEOUT", 15.0)
+
+# Upstream failures: retries of timeouts, 5xx and 429 with jittered exponential
+# backoff, and a circuit breaker per upstream failing fast while it is down
+HTTP_RETRIES = _env_int("HTTP_RETRIES", 2)
+HTTP_RETRY_BACKOFF = _env_float("HTTP_RETRY_BACKOFF", 0.5)
+HTTP_RETRY_MAX_BACKOFF = _env_float("HTTP_RETRY_MAX_BACKOFF", 8.0)
+CIRCUIT_FAILURE_THRESHOLD = _env_int("CIRCUIT_FAILURE_THRESHOLD", 5)
+CIRCUIT_RESET_TIMEOUT = _env_float("CIRCUIT_RESET_TIMEOUT", 30.0)
+# Send a duplicate of idempotent requests still unanswered past the upstream's
+# p95 latency, once HTTP_HEDGE_MIN_SAMPLES latencies are known
+HTTP_HEDGE = _env_bool("HTTP_HEDGE")
+HTTP_HEDGE_MIN_SAMPLES = _env_int("HTTP_HEDGE_MIN_SAMPLES", 20)
+
+# Caches
+CACHE_DIR = os.getenv(
+    "HIKE_AND_FLY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "mcp-hike-and-fly"),
+)
+GEOCODE_CACHE_SIZE = _env_int("GEOCODE_CACHE_SIZE", 4096)
+GEOCODE_CACHE_TTL = _env_float("GEOCODE_CACHE_TTL", 30 * 24 * 3600)
+GEOCODE_NEGATIVE_CACHE_TTL = _env_float("GEOCODE_NEGATIVE_CACHE_TTL", 24 * 3600)
+SEGMENT_TILE_CACHE_SIZE = _env_int("SEGMENT_TILE_CACHE_SIZE", 2048)
+SEGMENT_TILE_CACHE_TTL = _env_float("SEGMENT_TILE_CACHE_TTL", 24 * 3600)
+EXPLORE_MAX_TILES = _env_int("EXPLORE_MAX_TILES", 9)
+HARVEST_MAX_REQUESTS = _env_int("HARVEST_MAX_REQUESTS", 20)
+HARVEST_MAX_ZOOM = _env_int("HARVEST_MAX_ZOOM", 16)
+SEGMENT_PAGE_SIZE = _env_int("SEGMENT_PAGE_SIZE", 50)
+SEGMENT_DETAIL_CACHE_SIZE = _env_int("SEGMENT_DETAIL_CACHE_SIZE", 1024)
+SEGMENT_DETAIL_TTL = _env_float("SEGMENT_DETAIL_TTL", 90 * 24 * 3600)
+SEGMENT_DETAIL_CONCURRENCY = _env_int("SEGMENT_DETAIL_CONCURRENCY", 4)
+
+# Geocoding: "auto" answers from the local gazetteer when its index exists and
+# falls back to Nominatim, "local" and "remote" use only one of them
+GEOCODING_BACKEND = os.getenv("GEOCODING_BACKEND", "auto")
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH", os.path.join(CACHE_DIR, "gazetteer.idx"))
+GAZETTEER_MIN_SIMILARITY = _env_float("GAZETTEER_MIN_SIMILARITY", 0.8)
+GAZETTEER_REVERSE_RADIUS = _env_float("GAZETTEER_REVERSE_RADIUS", 0.5)
+
+# Upstream rate limits
+STRAVA_RATE_LIMIT_15MIN = _env_int("STRAVA_RATE_LIMIT_15MIN", 100)
+STRAVA_RATE_LIMIT_DAILY = _env_int("STRAVA_RATE_LIMIT_DAILY", 1000)
+STRAVA_BURST = _env_int("STRAVA_BURST", 20)
+STRAVA_MAX_QUEUE_WAIT = _env_float("STRAVA_MAX_QUEUE_WAIT", 30.0)
+NOMINATIM_REQUESTS_PER_SECOND = _env_float("NOMINATIM_REQUESTS_PER_SECOND", 1.0)
+
+# Leaderboard scraping
+LEADERBOARD_CONCURRENCY = _env_int("LEADERBOARD_CONCURRENCY", 4)
+LEADERBOARD_PAGE_SIZE = _env_int("LEADERBOARD_PAGE_SIZE", 100)
+LEADERBOARD_REQUESTS_PER_SECOND = _env_float("LEADERBOARD_REQUESTS_PER_SECOND", 2.0)
+
+# Climb attempt counts younger than LEADERBOARD_FRESH_TTL are answered as is,
+# older ones are answered at once and refreshed in the background, unless they
+# are older than LEADERBOARD_MAX_STALE
+LEADERBOARD_FRESH_TTL = _env_float("LEADERBOARD_FRESH_TTL", 3600.0)
+LEADERBOARD_MAX_STALE = _env_float("LEADERBOARD_MAX_STALE", 7 * 24 * 3600)
+LEADERBOARD_REFRESH_WORKERS = _env_int("LEADERBOARD_REFRESH_WORKERS", 2)
+# Segments whose leaderboards are refreshed when the server starts
+HOT_SEGMENTS = _env_ints("HOT_SEGMENTS")
+
+# CPU-bound parsing runs off the event loop in a "process" or "thread" pool, or
+# "inline" on it. Pages under PARSE_OFFLOAD_MIN_BYTES are parsed inline, shipping
+# them to a worker would cost more than parsing them
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "process")
+PARSE_WORKERS = _env_int("PARSE_WORKERS", 2)
+PARSE_OFFLOAD_MIN_BYTES = _env_int("PARSE_OFFLOAD_MIN_BYTES", 16 * 1024)
+
+# GPX and IGC tracks: fixes closer than TRACK_MIN_SPACING to the last one kept are
+# dropped while reading, the rest simplified with Douglas-Peucker to within
+# TRACK_SIMPLIFY_TOLERANCE. A segment was ridden when TRACK_MATCH_MIN_OVERLAP of
+# its points lie within about TRACK_MATCH_WIDTH of the track. Distances in km.
+# Track files are only read by path from within TRACK_DIR, when it is set
+TRACK_DIR = os.path.expanduser(os.getenv("TRACK_DIR", ""))
+TRACK_MIN_SPACING = _env_float("TRACK_MIN_SPACING", 0.005)
+TRACK_SIMPLIFY_TOLERANCE = _env_float("TRACK_SIMPLIFY_TOLERANCE", 0.01)
+TRACK_MATCH_WIDTH = _env_float("TRACK_MATCH_WIDTH", 0.05)
+TRACK_MATCH_MIN_OVERLAP = _env_float("TRACK_MATCH_MIN_OVERLAP", 0.8)
+
+# MCP server
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = _env_int("MCP_PORT", 8000)
+MCP_WORKERS = _env_int("MCP_WORKERS", 32)
+MCP_SESSION_CONCURRENCY = _env_int("MCP_SESSION_CONCURRENCY", 8)
+
+# Instrumentation, logs go to stderr as stdout carries the stdio transport
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING").upper()
+TRACE_SPANS = _env_bool("TRACE_SPANS")
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH", "")
+METRICS_DUMP_INTERVAL = _env_float("METRICS_DUMP_INTERVAL", 60.0)
+# Seconds between two event loop lag samples, 0 to sample none
+EVENT_LOOP_LAG_INTERVAL = _env_float("EVENT_LOOP_LAG_INTERVAL", 0.1)
@@ -1,23 +1,74 @@
+import logging
 import os
 
 import httpx
-from dotenv import load_dotenv
 
-load_dotenv()
+from clients.errors import RateLimitedError, UpstreamError
+from clients.pool import get_http_pool
+from clients.ratelimit import (
+    BACKGROUND,
+    INTERACTIVE,
+    RequestScheduler,
+    StravaQuota,
+    TokenBucket,
+)
+from clients.resilience import RETRY_STATUSES, ResilientUpstream
+from clients.singleflight import SingleFlight
+from metrics import span
+from settings import (
+    STRAVA_BURST,
+    STRAVA_MAX_QUEUE_WAIT,
+    STRAVA_RATE_LIMIT_15MIN,
+    STRAVA_RATE_LIMIT_DAILY,
+)
 
-STRAVA_ACCESS_TOKEN = os.getenv("STRAVA_ACCESS_TOKEN")
+logger = logging.getLogger(__name__)
 
-async def make_strava_request(url: str) -> dict:
-    """Make a request to the Strava API with proper error handling."""
+STRAVA_API = "strava_api"
 
+get_http_pool().register(STRAVA_API)
+
+# Spread the 15-minute quota evenly, allowing short bursts
+strava_quota = StravaQuota(STRAVA_RATE_LIMIT_15MIN, STRAVA_RATE_LIMIT_DAILY)
+strava_scheduler = RequestScheduler(
+    "Strava",
+    TokenBucket(rate=STRAVA_RATE_LIMIT_15MIN / 900, capacity=STRAVA_BURST),
+    quota=strava_quota,
+)
+strava_flights = SingleFlight("Strava")
+# A 429 means the quota window is spent, retrying before it ends would not help
+strava_resilience = ResilientUpstream(STRAVA_API, retry_statuses=RETRY_STATUSES - {429})
+
+async def make_strava_request(url: str, priority: int = INTERACTIVE) -> dict:
+    """Make a request to the Strava API, retrying transient failures.
+
+    Concurrent requests of the same URL share a single upstream request.
+
+    Raises:
+        RateLimitedError: Strava's quota is exhausted
+        UpstreamError: Strava could not be queried
+    """
+    return await strava_flights.do(url, lambda: _make_strava_request(url, priority))
+
+async def _make_strava_request(url: str, priority: int) -> dict:
     headers = {
-        "Authorization": f"Bearer {STRAVA_ACCESS_TOKEN}"
+        # Read on each request so a token loaded or rotated after import is used
+        "Authorization": f"Bearer {os.getenv('STRAVA_ACCESS_TOKEN')}"
     }
-    async with httpx.AsyncClient() as client:
+
+    async def send() -> httpx.Response:
+        # Background requests may wait for the next quota window, interactive ones may not
+        await strava_scheduler.acquire(priority, max_wait=None if priority >= BACKGROUND else STRAVA_MAX_QUEUE_WAIT)
+        response = await get_http_pool().get(STRAVA_API, url, headers=headers)
+        strava_scheduler.observe(response.headers)
+        if response.status_code == 429:
+            strava_quota.exhaust()
+            raise RateLimitedError(strava_scheduler.name, strava_quota.delay())
+        return response
+
+    response = await strava_resilience.get(send)
+    with span("parse", parser="strava_json"):
         try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
             return response.json()
-        except Exception as e:
-            print(f"Error making Strava request: {e}")
-            return None
+        except ValueError as e:
+            raise UpstreamError(STRAVA_API, f"invalid JSON answer: {e}") from e
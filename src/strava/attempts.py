@@ -0,0 +1,65 @@
+from datetime import date
+from typing import TYPE_CHECKING, Dict, Optional
+
+from .leaderboard import EPOCH_ORDINAL
+
+if TYPE_CHECKING:
+    import numpy as np
+
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def to_day(value: date) -> int:
+    """Convert a date to days since 1970-01-01."""
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def count_between(days: "np.ndarray", start: date, end: date) -> int:
+    """Count the efforts from `start` included to `end` excluded.
+
+    Args:
+        days: The days of the efforts, as days since 1970-01-01
+        start: First day of the window
+        end: Day after the window
+    """
+    import numpy as np
+
+    return int(np.count_nonzero((days >= to_day(start)) & (days < to_day(end))))
+
+
+def monthly_histogram(days: "np.ndarray", year: int) -> "np.ndarray":
+    """Count the efforts of each month of a year in one pass.
+
+    Returns:
+        An array of 12 counts, January first
+    """
+    import numpy as np
+
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    first_month = (year - 1970) * 12
+    months = months[(months >= first_month) & (months < first_month + 12)]
+    return np.bincount(months - first_month, minlength=12)
+
+
+def count_climb_attempts(days: "np.ndarray", today: Optional[date] = None) -> Dict[str, object]:
+    """Count the climb attempts of this year.
+
+    Args:
+        days: The days of the efforts on a segment, as days since 1970-01-01
+        today: The current date
+
+    Returns:
+        last_month_climbs_attempts: The number of climb attempts this calendar month
+        beginning_of_the_year_climbs_attempts: The number of climb attempts since January 1st
+        monthly_climbs_attempts: The number of climb attempts of each month of the year so far
+    """
+    today = today or date.today()
+    histogram = monthly_histogram(days, today.year)
+
+    return {
+        'last_month_climbs_attempts': int(histogram[today.month - 1]),
+        'beginning_of_the_year_climbs_attempts': int(histogram.sum()),
+        'monthly_climbs_attempts': {
+            MONTH_NAMES[month]: int(count) for month, count in enumerate(histogram[:today.month])
+        },
+    }
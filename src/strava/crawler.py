@@ -0,0 +1,112 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from clients.errors import UpstreamError
+from clients.ratelimit import INTERACTIVE
+from clients.singleflight import SingleFlight
+from settings import LEADERBOARD_CONCURRENCY
+
+from .efforts import EffortStore, get_effort_store
+from .scraper import fetch_leaderboard_page
+
+logger = logging.getLogger(__name__)
+
+FULL_DATE_RANGE = "this_year"
+
+crawl_flights = SingleFlight("Leaderboard crawl")
+
+
+def _period_starts(now: datetime) -> dict:
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "today": today,
+        "this_week": today - timedelta(days=today.weekday()),
+        "this_month": today.replace(day=1),
+        "this_year": today.replace(month=1, day=1),
+    }
+
+
+def choose_date_range(store: EffortStore, segment_id: int, now: Optional[datetime] = None) -> str:
+    """Choose the smallest leaderboard date range covering what the store misses.
+
+    Until a full-year crawl of the current year has completed, the whole year is
+    crawled. Afterwards only the efforts since the last completed crawl are, through
+    the shortest of today, this_week or this_month starting before it.
+    """
+    now = now or datetime.now()
+    starts = _period_starts(now)
+    completed = [crawl for crawl in store.crawls(segment_id) if crawl.complete]
+
+    full = [crawl for crawl in completed if crawl.date_range == FULL_DATE_RANGE]
+    if not full or datetime.fromtimestamp(max(crawl.completed_at for crawl in full)) < starts[FULL_DATE_RANGE]:
+        return FULL_DATE_RANGE
+
+    last_completed = datetime.fromtimestamp(max(crawl.completed_at for crawl in completed))
+    for date_range in ("today", "this_week", "this_month"):
+        if last_completed >= starts[date_range]:
+            return date_range
+    return FULL_DATE_RANGE
+
+
+async def crawl_leaderboard(segment_id: int, store: Optional[EffortStore] = None, priority: int = INTERACTIVE) -> bool:
+    """Crawl the pages of a segment leaderboard the store is missing.
+
+    Resumes the crawl of a date range interrupted earlier, otherwise starts a new
+    crawl of the date range chosen by `choose_date_range`. Pages are fetched
+    concurrently and stored as they arrive. Concurrent crawls of the same segment
+    are coalesced into one.
+
+    Args:
+        segment_id: The ID of the segment
+        store: The effort store, the process-wide one by default
+        priority: Priority of the page requests
+
+    Returns:
+        Whether every page of the crawl is now stored
+
+    Raises:
+        UpstreamError: The first page of a new crawl could not be fetched
+    """
+    store = store or get_effort_store()
+    return await crawl_flights.do((store.path, segment_id), lambda: _crawl_leaderboard(segment_id, store, priority))
+
+
+async def _crawl_leaderboard(segment_id: int, store: EffortStore, priority: int) -> bool:
+    starts = _period_starts(datetime.now())
+    crawl = next((
+        crawl for crawl in store.crawls(segment_id)
+        if not crawl.complete and datetime.fromtimestamp(crawl.started_at) >= starts[crawl.date_range]
+    ), None)
+
+    if crawl is None:
+        date_range = choose_date_range(store, segment_id)
+        first_page = await fetch_leaderboard_page(segment_id, date_range, 1, priority=priority)
+        store.start_crawl(segment_id, date_range, first_page.pages)
+        store.store_page(segment_id, date_range, 1, first_page.rows)
+        pages = first_page.pages
+    else:
+        date_range, pages = crawl.date_range, crawl.pages
+        logger.info(f"Resuming the {date_range} leaderboard crawl of segment {segment_id}")
+
+    missing = sorted(set(range(1, pages + 1)) - store.stored_pages(segment_id, date_range))
+    logger.debug(f"Crawling {len(missing)} of {pages} {date_range} leaderboard pages of segment {segment_id}")
+    semaphore = asyncio.Semaphore(LEADERBOARD_CONCURRENCY)
+
+    async def crawl_page(page: int) -> bool:
+        async with semaphore:
+            try:
+                leaderboard = await fetch_leaderboard_page(segment_id, date_range, page, priority=priority)
+            except UpstreamError:
+                return False
+        store.store_page(segment_id, date_range, page, leaderboard.rows)
+        return True
+
+    stored = await asyncio.gather(*(crawl_page(page) for page in missing))
+    if not all(stored):
+        logger.warning(f"The {date_range} leaderboard crawl of segment {segment_id} is incomplete, it will resume next time")
+        return False
+
+    store.finish_crawl(segment_id, date_range)
+    return True
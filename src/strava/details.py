@@ -0,0 +1,239 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from cache.lru import TTLCache
+from clients.errors import UpstreamError
+from clients.ratelimit import INTERACTIVE
+from geometry import decode_polyline
+from metrics import metrics
+from settings import (
+    CACHE_DIR,
+    SEGMENT_DETAIL_CACHE_SIZE,
+    SEGMENT_DETAIL_CONCURRENCY,
+    SEGMENT_DETAIL_TTL,
+    STRAVA_API_BASE,
+)
+
+from .api import make_strava_request
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS segments (
+    segment_id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    fetched_at REAL NOT NULL
+);
+"""
+
+# Fields of Strava's detailed segment kept in the store
+DETAIL_FIELDS = (
+    "id",
+    "name",
+    "activity_type",
+    "distance",
+    "average_grade",
+    "maximum_grade",
+    "elevation_high",
+    "elevation_low",
+    "total_elevation_gain",
+    "climb_category",
+    "start_latlng",
+    "end_latlng",
+    "city",
+    "country",
+)
+
+
+class SegmentDetail:
+    """Details of a segment, with its decoded polyline.
+
+    Distances and elevations are in metres, gradients in percent.
+    """
+
+    __slots__ = ("fields", "polyline", "points", "digest")
+
+    def __init__(self, fields: Dict[str, Any], polyline: str, digest: str) -> None:
+        self.fields = fields
+        self.polyline = polyline
+        self.digest = digest
+        self.points = decode_polyline(polyline)
+
+    @property
+    def id(self) -> int:
+        return self.fields["id"]
+
+    def as_dict(self, include_points: bool = False) -> Dict[str, Any]:
+        """Turn the details into a JSON-serialisable dict, the points as a list of [latitude, longitude] when asked."""
+        result = dict(self.fields)
+        result["point_count"] = len(self.points)
+        if include_points:
+            result["points"] = [[round(float(latitude), 5), round(float(longitude), 5)] for latitude, longitude in self.points]
+        return result
+
+
+def _detail_blob(data: Dict[str, Any]) -> bytes:
+    """Canonical serialisation of a detailed segment answer, so equal details share a digest."""
+    detail = {field: data.get(field) for field in DETAIL_FIELDS}
+    detail["polyline"] = (data.get("map") or {}).get("polyline") or ""
+    return json.dumps(detail, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def _parse_blob(blob: bytes, digest: str) -> SegmentDetail:
+    fields = json.loads(blob)
+    polyline = fields.pop("polyline")
+    return SegmentDetail(fields, polyline, digest)
+
+
+class SegmentDetailStore:
+    """Persistent content-addressed store of segment details.
+
+    Each detail is stored once under the SHA-256 digest of its canonical
+    serialisation, compressed, and segments point to the digest of their latest
+    details, so refreshing unchanged details only touches the segment row.
+    """
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+
+    def get(self, segment_id: int, max_age: float) -> Optional[SegmentDetail]:
+        """Get the stored details of a segment, None if missing or older than `max_age` seconds."""
+        row = self._connection.execute(
+            "SELECT blobs.digest, blobs.data FROM segments JOIN blobs USING (digest) WHERE segment_id = ? AND fetched_at > ?",
+            (segment_id, time.time() - max_age),
+        ).fetchone()
+        if row is None:
+            return None
+        digest, data = row
+        return _parse_blob(zlib.decompress(data), digest)
+
+    def put(self, segment_id: int, blob: bytes) -> str:
+        """Store the serialised details of a segment and return their digest."""
+        digest = hashlib.sha256(blob).hexdigest()
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO blobs (digest, data) VALUES (?, ?)",
+                (digest, zlib.compress(blob)),
+            )
+            self._connection.execute(
+                "INSERT OR REPLACE INTO segments (segment_id, digest, fetched_at) VALUES (?, ?, ?)",
+                (segment_id, digest, time.time()),
+            )
+        return digest
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+_store: Optional[SegmentDetailStore] = None
+
+# Decoded details, so repeated lookups skip the store and the decoding
+detail_cache = TTLCache(SEGMENT_DETAIL_CACHE_SIZE, SEGMENT_DETAIL_TTL)
+
+
+def get_detail_store() -> SegmentDetailStore:
+    """Get the process-wide segment detail store, opening it under CACHE_DIR if needed."""
+    global _store
+    if _store is None:
+        _store = SegmentDetailStore(os.path.join(CACHE_DIR, "segment_details.sqlite3"))
+    return _store
+
+
+def close_detail_store() -> None:
+    """Close the process-wide segment detail store."""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+async def get_segment_detail(segment_id: int, priority: int = INTERACTIVE) -> SegmentDetail:
+    """Get the details of a segment, through the memory cache, the store, then Strava.
+
+    Args:
+        segment_id: The ID of the segment
+        priority: Priority of the Strava request on a miss
+
+    Raises:
+        RateLimitedError: Strava's quota is exhausted
+        UpstreamError: Strava could not be queried
+    """
+    hit, detail = detail_cache.get(segment_id)
+    if hit:
+        metrics.increment("cache_lookups_total", cache="segment_details", result="memory")
+        return detail
+
+    store = get_detail_store()
+    detail = store.get(segment_id, SEGMENT_DETAIL_TTL)
+    metrics.increment("cache_lookups_total", cache="segment_details", result="miss" if detail is None else "store")
+    if detail is None:
+        logger.debug(f"Fetching the details of segment {segment_id}")
+        data = await make_strava_request(f"{STRAVA_API_BASE}/segments/{segment_id}", priority)
+        if not data or "id" not in data:
+            raise UpstreamError("Strava", f"unable to fetch the details of segment {segment_id}")
+        blob = _detail_blob(data)
+        digest = store.put(segment_id, blob)
+        detail = _parse_blob(blob, digest)
+
+    detail_cache.set(segment_id, detail)
+    return detail
+
+
+async def enrich_segments(
+    segment_ids: List[int],
+    on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+    include_points: bool = False,
+    priority: int = INTERACTIVE,
+) -> List[Dict[str, Any]]:
+    """Get the details of several segments concurrently.
+
+    Stored details are answered at once, the others are fetched from Strava
+    SEGMENT_DETAIL_CONCURRENCY at a time.
+
+    Args:
+        segment_ids: The IDs of the segments
+        on_result: Called with the result of each segment as soon as it is known
+        include_points: Include the decoded points of each segment
+        priority: Priority of the Strava requests, interactive ones fail rather
+            than wait for the next quota window
+
+    Returns:
+        One result per distinct segment, in input order, holding either its
+        details or its segment_id and an error
+    """
+    semaphore = asyncio.Semaphore(SEGMENT_DETAIL_CONCURRENCY)
+
+    async def detail_of(segment_id: int) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                detail = await get_segment_detail(segment_id, priority)
+                return {"segment_id": segment_id, **detail.as_dict(include_points)}
+            except (UpstreamError, ValueError) as e:
+                # Programming errors are not the segment's, they fail the call
+                return {"segment_id": segment_id, "error": str(e)}
+
+    unique_ids = list(dict.fromkeys(segment_ids))
+    results = {}
+    for future in asyncio.as_completed([detail_of(segment_id) for segment_id in unique_ids]):
+        result = await future
+        results[result["segment_id"]] = result
+        if on_result is not None:
+            await on_result(result)
+    return [results[segment_id] for segment_id in unique_ids]
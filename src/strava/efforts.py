@@ -0,0 +1,185 @@
+import logging
+import os
+import sqlite3
+import time
+from typing import TYPE_CHECKING, Iterable, List, Optional, Set
+
+from settings import CACHE_DIR
+
+from .leaderboard import LeaderboardRow, parse_effort_date
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS efforts (
+    effort_id INTEGER PRIMARY KEY,
+    segment_id INTEGER NOT NULL,
+    athlete_id TEXT NOT NULL,
+    athlete_name TEXT NOT NULL,
+    date TEXT NOT NULL,
+    day INTEGER,
+    rank INTEGER,
+    speed REAL,
+    heart_rate REAL,
+    power REAL,
+    vam REAL,
+    time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS efforts_segment_day ON efforts (segment_id, day);
+CREATE TABLE IF NOT EXISTS crawls (
+    segment_id INTEGER NOT NULL,
+    date_range TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    started_at REAL NOT NULL,
+    completed_at REAL,
+    PRIMARY KEY (segment_id, date_range)
+);
+CREATE TABLE IF NOT EXISTS crawl_pages (
+    segment_id INTEGER NOT NULL,
+    date_range TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    PRIMARY KEY (segment_id, date_range, page)
+);
+"""
+
+
+class Crawl:
+    """State of the crawl of one leaderboard date range of a segment."""
+
+    __slots__ = ("segment_id", "date_range", "pages", "started_at", "completed_at")
+
+    def __init__(self, segment_id: int, date_range: str, pages: int, started_at: float, completed_at: Optional[float]) -> None:
+        self.segment_id = segment_id
+        self.date_range = date_range
+        self.pages = pages
+        self.started_at = started_at
+        self.completed_at = completed_at
+
+    @property
+    def complete(self) -> bool:
+        return self.completed_at is not None
+
+
+class EffortStore:
+    """Local store of leaderboard efforts keyed by effort id, with crawl progress.
+
+    Each page is stored with its progress in one transaction, so an interrupted
+    crawl resumes at the pages it had not stored yet.
+    """
+
+    def __init__(self, path: str) -> None:
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._migrate()
+        self._connection.executescript(SCHEMA)
+
+    def _migrate(self) -> None:
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(efforts)")}
+        if not columns or "day" in columns:
+            return
+        # Stores created before dates were parsed at ingest
+        logger.info(f"Adding parsed effort days to {self.path}")
+        with self._connection:
+            self._connection.execute("ALTER TABLE efforts ADD COLUMN day INTEGER")
+            self._connection.execute("DROP INDEX IF EXISTS efforts_segment")
+            rows = self._connection.execute("SELECT effort_id, date FROM efforts").fetchall()
+            self._connection.executemany(
+                "UPDATE efforts SET day = ? WHERE effort_id = ?",
+                [(parse_effort_date(date), effort_id) for effort_id, date in rows],
+            )
+
+    def crawl(self, segment_id: int, date_range: str) -> Optional[Crawl]:
+        """Get the latest crawl of a date range of a segment."""
+        row = self._connection.execute(
+            "SELECT pages, started_at, completed_at FROM crawls WHERE segment_id = ? AND date_range = ?",
+            (segment_id, date_range),
+        ).fetchone()
+        return Crawl(segment_id, date_range, *row) if row else None
+
+    def crawls(self, segment_id: int) -> List[Crawl]:
+        """Get the latest crawl of every date range of a segment."""
+        rows = self._connection.execute(
+            "SELECT date_range, pages, started_at, completed_at FROM crawls WHERE segment_id = ?",
+            (segment_id,),
+        ).fetchall()
+        return [Crawl(segment_id, *row) for row in rows]
+
+    def start_crawl(self, segment_id: int, date_range: str, pages: int) -> None:
+        """Start a new crawl, forgetting the pages stored by the previous one."""
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO crawls (segment_id, date_range, pages, started_at, completed_at) VALUES (?, ?, ?, ?, NULL)",
+                (segment_id, date_range, pages, time.time()),
+            )
+            self._connection.execute(
+                "DELETE FROM crawl_pages WHERE segment_id = ? AND date_range = ?", (segment_id, date_range)
+            )
+
+    def stored_pages(self, segment_id: int, date_range: str) -> Set[int]:
+        """Get the pages already stored by the current crawl."""
+        rows = self._connection.execute(
+            "SELECT page FROM crawl_pages WHERE segment_id = ? AND date_range = ?", (segment_id, date_range)
+        ).fetchall()
+        return {page for (page,) in rows}
+
+    def store_page(self, segment_id: int, date_range: str, page: int, rows: Iterable[LeaderboardRow]) -> None:
+        """Upsert the efforts of a page and record the page as stored."""
+        efforts = [
+            (int(row.effort_id), segment_id, row.athlete_id, row.athlete_name, row.date, row.day, row.rank, row.speed, row.heart_rate, row.power, row.vam, row.time)
+            for row in rows
+            if row.effort_id.isdigit()
+        ]
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO efforts (effort_id, segment_id, athlete_id, athlete_name, date, day, rank, speed, heart_rate, power, vam, time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                efforts,
+            )
+            self._connection.execute(
+                "INSERT OR IGNORE INTO crawl_pages (segment_id, date_range, page) VALUES (?, ?, ?)",
+                (segment_id, date_range, page),
+            )
+
+    def finish_crawl(self, segment_id: int, date_range: str) -> None:
+        with self._connection:
+            self._connection.execute(
+                "UPDATE crawls SET completed_at = ? WHERE segment_id = ? AND date_range = ?",
+                (time.time(), segment_id, date_range),
+            )
+
+    def effort_days(self, segment_id: int) -> "np.ndarray":
+        """Get the days of the stored efforts of a segment, as days since 1970-01-01."""
+        import numpy as np
+
+        cursor = self._connection.execute(
+            "SELECT day FROM efforts WHERE segment_id = ? AND day IS NOT NULL", (segment_id,)
+        )
+        return np.fromiter((day for (day,) in cursor), dtype=np.int32)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+_store: Optional[EffortStore] = None
+
+
+def get_effort_store() -> EffortStore:
+    """Get the process-wide effort store, opening it under CACHE_DIR if needed."""
+    global _store
+    if _store is None:
+        _store = EffortStore(os.path.join(CACHE_DIR, "efforts.sqlite3"))
+    return _store
+
+
+def close_effort_store() -> None:
+    """Close the process-wide effort store."""
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
@@ -0,0 +1,385 @@
+import asyncio
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from cache.tiered import TieredCache
+from clients.errors import UpstreamError
+from geometry import bounding_boxes, haversine, route_bounding_box
+from settings import (
+    EXPLORE_MAX_TILES,
+    HARVEST_MAX_REQUESTS,
+    HARVEST_MAX_ZOOM,
+    SEGMENT_TILE_CACHE_SIZE,
+    SEGMENT_TILE_CACHE_TTL,
+    STRAVA_API_BASE,
+)
+
+from .api import make_strava_request
+from .index import segment_index
+from .tiles import covering_quadkeys, quadkey_to_tile, tile_bounds
+
+logger = logging.getLogger(__name__)
+
+# Most segments Strava's explore endpoint returns for one box
+EXPLORE_LIMIT = 10
+
+# Longest diagonal of the boxes a route is explored in, in kilometres
+ROUTE_STRETCH_KM = 15.0
+
+segment_tile_cache = TieredCache(
+    "segments_explore",
+    maxsize=SEGMENT_TILE_CACHE_SIZE,
+    ttl=SEGMENT_TILE_CACHE_TTL,
+)
+
+
+async def _explore(southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> Optional[List[dict]]:
+    url = f"{STRAVA_API_BASE}/segments/explore?bounds={southwest_latitude},{southwest_longitude},{northeast_latitude},{northeast_longitude}&activity_type=riding"
+    data = await make_strava_request(url)
+    if not data or "segments" not in data:
+        logger.warning(f"No data or segments found in Strava API response for {southwest_latitude},{southwest_longitude},{northeast_latitude},{northeast_longitude}")
+        return None
+    return data["segments"]
+
+
+async def fetch_tile_segments(quadkey: str) -> Optional[List[dict]]:
+    """Fetch the segments Strava explores within one tile and cache them.
+
+    Args:
+        quadkey: The quadkey of the tile
+
+    Returns:
+        The raw segments of the tile, None if Strava's answer holds none
+
+    Raises:
+        UpstreamError: Strava could not be queried
+    """
+    segments = await _explore(*tile_bounds(*quadkey_to_tile(quadkey)))
+    if segments is None:
+        return None
+
+    segment_tile_cache.set(quadkey, segments)
+    segment_index.add_tile(quadkey, segments, saturated=len(segments) >= EXPLORE_LIMIT)
+    return segments
+
+
+async def fetch_box_segments(southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> Optional[List[dict]]:
+    """Explore a box too large for the tile grid with a single request, as Strava answers it.
+
+    The answer is indexed but neither cached nor remembered as covering the
+    box, since it holds at most EXPLORE_LIMIT of its segments.
+
+    Returns:
+        The raw segments, None if Strava's answer holds none
+
+    Raises:
+        UpstreamError: Strava could not be queried
+    """
+    logger.info(f"Box {southwest_latitude},{southwest_longitude},{northeast_latitude},{northeast_longitude} is too large for {EXPLORE_MAX_TILES} tiles, exploring it in one request")
+    segments = await _explore(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+    if segments:
+        segment_index.add(segments)
+    return segments
+
+
+async def _fetch_tiles(quadkeys: List[str]) -> Tuple[List[Optional[List[dict]]], List[UpstreamError]]:
+    """Fetch tiles concurrently, so that one failing tile does not lose the others.
+
+    Returns:
+        The segments of each tile, None for those that failed, and the errors
+    """
+    results = await asyncio.gather(*(fetch_tile_segments(quadkey) for quadkey in quadkeys), return_exceptions=True)
+    errors = [result for result in results if isinstance(result, UpstreamError)]
+    for result in results:
+        if isinstance(result, BaseException) and not isinstance(result, UpstreamError):
+            raise result
+    return [None if isinstance(result, UpstreamError) else result for result in results], errors
+
+
+def _starts_within(segment: dict, southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> bool:
+    start = segment.get("start_latlng")
+    if not start:
+        return True
+    latitude, longitude = start
+    if not southwest_latitude <= latitude <= northeast_latitude:
+        return False
+    if southwest_longitude <= northeast_longitude:
+        return southwest_longitude <= longitude <= northeast_longitude
+    # The box crosses the antimeridian
+    return longitude >= southwest_longitude or longitude <= northeast_longitude
+
+
+async def explore_segments(southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> Optional[List[dict]]:
+    """Explore the segments of a bounding box through the tile cache.
+
+    The box is snapped onto the tile grid, tiles missing from the cache are
+    fetched concurrently, and the segments of all tiles are merged, deduplicated
+    by id and restricted to those starting inside the box. A box needing more
+    than EXPLORE_MAX_TILES tiles is explored in a single request instead.
+
+    Returns:
+        The raw segments, None if no tile holds any
+
+    Raises:
+        UpstreamError: Strava could not be queried for any tile
+    """
+    bounds = (southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+    quadkeys = covering_quadkeys(*bounds, max_tiles=EXPLORE_MAX_TILES)
+    if not quadkeys:
+        return await fetch_box_segments(*bounds)
+
+    tiles: Dict[str, Optional[List[dict]]] = {}
+    missing = []
+    for quadkey in quadkeys:
+        hit, segments = segment_tile_cache.get(quadkey)
+        if hit:
+            tiles[quadkey] = segments
+            if not segment_index.covers(quadkey):
+                segment_index.add_tile(quadkey, segments or [], saturated=len(segments or []) >= EXPLORE_LIMIT)
+        else:
+            missing.append(quadkey)
+    logger.debug(f"Explore over {len(quadkeys)} tiles, {len(missing)} missing from cache")
+
+    fetched, errors = await _fetch_tiles(missing)
+    tiles.update(zip(missing, fetched))
+
+    if all(segments is None for segments in tiles.values()):
+        if errors:
+            raise errors[0]
+        return None
+
+    merged: Dict[int, dict] = {}
+    for quadkey in quadkeys:
+        for segment in tiles[quadkey] or []:
+            if segment["id"] not in merged and _starts_within(segment, *bounds):
+                merged[segment["id"]] = segment
+    return list(merged.values())
+
+
+
+def _intersects(southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float, quadkey: str) -> bool:
+    """Whether a tile overlaps a bounding box, which may cross the antimeridian."""
+    south, west, north, east = tile_bounds(*quadkey_to_tile(quadkey))
+    if south > northeast_latitude or north < southwest_latitude:
+        return False
+    if southwest_longitude <= northeast_longitude:
+        return west <= northeast_longitude and east >= southwest_longitude
+    return east >= southwest_longitude or west <= northeast_longitude
+
+
+class RequestBudget:
+    """Strava requests one or several harvests sharing it may still send.
+
+    Harvests run on the event loop, so taking from the budget needs no lock.
+    """
+
+    __slots__ = ("remaining",)
+
+    def __init__(self, requests: int) -> None:
+        self.remaining = requests
+
+    def take(self, requests: int) -> int:
+        """Spend up to `requests` of the budget.
+
+        Returns:
+            The number of requests that may be sent
+        """
+        granted = max(min(requests, self.remaining), 0)
+        self.remaining -= granted
+        return granted
+
+
+class Harvest:
+    """Segments harvested over a bounding box.
+
+    Attributes:
+        segments: The raw segments starting inside the box
+        requests: Number of Strava requests sent
+        complete: False when saturated tiles were left unsplit because the
+            request budget ran out or Strava could not be reached
+    """
+
+    __slots__ = ("segments", "requests", "complete")
+
+    def __init__(self, segments: List[dict], requests: int, complete: bool) -> None:
+        self.segments = segments
+        self.requests = requests
+        self.complete = complete
+
+
+async def harvest_segments(
+    southwest_latitude: float,
+    southwest_longitude: float,
+    northeast_latitude: float,
+    northeast_longitude: float,
+    max_requests: int = HARVEST_MAX_REQUESTS,
+    max_zoom: int = HARVEST_MAX_ZOOM,
+    budget: Optional[RequestBudget] = None,
+) -> Harvest:
+    """Harvest every segment of a bounding box, beyond Strava's 10 per request.
+
+    The box is snapped onto the tile grid and explored level by level. Each
+    tile for which Strava returned its maximum of segments is split into its
+    four children overlapping the box, down to `max_zoom`. The tiles of a level
+    are fetched concurrently, paced by the Strava scheduler. Tiles found in the
+    tile cache cost nothing, so harvests of overlapping areas only pay for what
+    they have not seen yet. A box needing more than EXPLORE_MAX_TILES tiles
+    costs a single request, and is complete only if Strava was not saturated.
+
+    Args:
+        southwest_latitude: Latitude of the southwest corner of the bounding box
+        southwest_longitude: Longitude of the southwest corner of the bounding box
+        northeast_latitude: Latitude of the northeast corner of the bounding box
+        northeast_longitude: Longitude of the northeast corner of the bounding box
+        max_requests: Most Strava requests the harvest may send
+        max_zoom: Finest zoom level tiles are split down to
+        budget: Budget shared with other harvests, which the harvest's
+            requests are also taken from
+
+    Returns:
+        The harvested segments, deduplicated by id
+
+    Raises:
+        UpstreamError: Strava could not be queried and nothing was harvested
+    """
+    bounds = (southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+    if budget is None:
+        budget = RequestBudget(max_requests)
+    frontier = covering_quadkeys(*bounds, max_tiles=EXPLORE_MAX_TILES)
+    if not frontier:
+        if not budget.take(min(max_requests, 1)):
+            return Harvest([], 0, False)
+        segments = await fetch_box_segments(*bounds) or []
+        return Harvest([segment for segment in segments if _starts_within(segment, *bounds)], 1, len(segments) < EXPLORE_LIMIT)
+    merged: Dict[int, dict] = {}
+    requests = 0
+    complete = True
+    errors: List[UpstreamError] = []
+
+    while frontier:
+        tiles: Dict[str, Optional[List[dict]]] = {}
+        missing = []
+        for quadkey in frontier:
+            hit, segments = segment_tile_cache.get(quadkey)
+            if hit:
+                tiles[quadkey] = segments
+                if not segment_index.covers(quadkey):
+                    segment_index.add_tile(quadkey, segments or [], saturated=len(segments or []) >= EXPLORE_LIMIT)
+            elif segment_index.complete(quadkey):
+                # A larger tile around it held fewer segments than the limit, so they are all indexed
+                tiles[quadkey] = segment_index.in_box(*tile_bounds(*quadkey_to_tile(quadkey)))
+            else:
+                missing.append(quadkey)
+
+        granted = budget.take(min(len(missing), max_requests - requests))
+        if len(missing) > granted:
+            complete = False
+            missing = missing[:granted]
+        requests += len(missing)
+        fetched, level_errors = await _fetch_tiles(missing)
+        errors.extend(level_errors)
+        tiles.update(zip(missing, fetched))
+        logger.debug(f"Harvest level of {len(frontier)} tiles, fetched {len(missing)}, {requests} requests so far")
+
+        children = []
+        for quadkey in frontier:
+            if quadkey not in tiles:
+                continue
+            segments = tiles[quadkey]
+            if segments is None:
+                complete = False
+                continue
+            for segment in segments:
+                if segment["id"] not in merged and _starts_within(segment, *bounds):
+                    merged[segment["id"]] = segment
+            if len(segments) >= EXPLORE_LIMIT:
+                if len(quadkey) >= max_zoom:
+                    continue
+                children.extend(child for child in (quadkey + digit for digit in "0123") if _intersects(*bounds, child))
+        frontier = children
+
+    if errors and not merged:
+        raise errors[0]
+    return Harvest(list(merged.values()), requests, complete)
+
+async def explore_uncovered(
+    southwest_latitude: float,
+    southwest_longitude: float,
+    northeast_latitude: float,
+    northeast_longitude: float,
+    max_requests: int = HARVEST_MAX_REQUESTS,
+    budget: Optional[RequestBudget] = None,
+) -> bool:
+    """Harvest a bounding box into the segment index, unless the index already holds all its segments.
+
+    Returns:
+        False if nothing could be harvested
+    """
+    quadkeys = covering_quadkeys(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude, max_tiles=EXPLORE_MAX_TILES)
+    if quadkeys and all(segment_index.complete(quadkey) for quadkey in quadkeys):
+        return True
+    harvest = await harvest_segments(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude, max_requests, budget=budget)
+    return harvest.complete or bool(harvest.segments)
+
+
+def _stretch_box(latitudes: Sequence[float], longitudes: Sequence[float], width: float) -> Tuple[float, float, float, float]:
+    """Bounding box of a stretch widened by `width` kilometres.
+
+    Unlike `route_bounding_box`, a stretch crossing the antimeridian gets a
+    box crossing it too, rather than one spanning every longitude.
+    """
+    import numpy as np
+
+    boxes = bounding_boxes(latitudes, longitudes, width)
+    if np.all(boxes[:, 1] <= boxes[:, 3]) and np.ptp(np.asarray(longitudes, dtype=float)) <= 180.0:
+        return route_bounding_box(latitudes, longitudes, width)
+    if np.any((boxes[:, 1] == -180.0) & (boxes[:, 3] == 180.0)):
+        # Near a pole every longitude is within reach
+        return route_bounding_box(latitudes, longitudes, width)
+    # Longitudes relative to the first point, so that the stretch is contiguous
+    origin = float(longitudes[0])
+    west = origin + float(((boxes[:, 1] - origin + 180.0) % 360.0 - 180.0).min())
+    east = origin + float(((boxes[:, 3] - origin + 180.0) % 360.0 - 180.0).max())
+    if east - west >= 360.0:
+        return (float(boxes[:, 0].min()), -180.0, float(boxes[:, 2].max()), 180.0)
+    return (float(boxes[:, 0].min()), (west + 180.0) % 360.0 - 180.0, float(boxes[:, 2].max()), (east + 180.0) % 360.0 - 180.0)
+
+
+async def explore_route(route_latitudes: Sequence[float], route_longitudes: Sequence[float], width: float) -> bool:
+    """Explore the corridor of a route, unless the segment index already covers it.
+
+    The route is cut into stretches whose widened bounding box spans at most
+    ROUTE_STRETCH_KM, so each stretch is explored at a fine zoom level rather
+    than the whole route at a coarse one. The stretches share the request
+    budget of one harvest, each taking at most its share of it, so the
+    stretches past the budget of a long route are left unexplored.
+
+    Returns:
+        False if no stretch could be explored
+    """
+    # Cut long legs so that every stretch holds at least one whole leg
+    latitudes, longitudes = [route_latitudes[0]], [route_longitudes[0]]
+    for latitude, longitude in zip(route_latitudes[1:], route_longitudes[1:]):
+        steps = math.ceil(haversine(latitudes[-1], longitudes[-1], latitude, longitude) / (ROUTE_STRETCH_KM / 3)) or 1
+        base_latitude, base_longitude = latitudes[-1], longitudes[-1]
+        # The short way round, across the antimeridian if need be
+        dlon = (longitude - base_longitude + 180.0) % 360.0 - 180.0
+        for step in range(1, steps + 1):
+            latitudes.append(base_latitude + (latitude - base_latitude) * step / steps)
+            longitudes.append((base_longitude + dlon * step / steps + 180.0) % 360.0 - 180.0)
+
+    stretches = []
+    start = 0
+    for end in range(3, len(latitudes) + 1):
+        box = _stretch_box(latitudes[start:end], longitudes[start:end], width)
+        if haversine(box[0], box[1], box[2], box[3]) > ROUTE_STRETCH_KM:
+            stretches.append(_stretch_box(latitudes[start:end - 1], longitudes[start:end - 1], width))
+            start = end - 2
+    stretches.append(_stretch_box(latitudes[start:], longitudes[start:], width))
+    logger.debug(f"Explore route of {len(route_latitudes)} points in {len(stretches)} stretches")
+
+    budget = RequestBudget(HARVEST_MAX_REQUESTS)
+    max_requests = max(HARVEST_MAX_REQUESTS // len(stretches), 1)
+    explored = await asyncio.gather(*(explore_uncovered(*box, max_requests=max_requests, budget=budget) for box in stretches))
+    return any(explored)
@@ -0,0 +1,275 @@
+import math
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Set, Tuple
+
+from geometry import (
+    EARTH_RADIUS_KM,
+    bounding_box,
+    decode_polylines,
+    haversine_distances,
+    route_bounding_box,
+    route_distances,
+)
+from settings import SEGMENT_TILE_CACHE_TTL
+
+from .segments import SegmentTable
+
+if TYPE_CHECKING:
+    import numpy as np
+
+    from tracks.corridor import TrackCorridor
+
+# Side of a grid cell, in degrees, about 5 km of latitude
+CELL_DEGREES = 0.05
+
+
+class SegmentIndex:
+    """In-memory grid index of every segment the server has explored.
+
+    Segments are kept in a columnar SegmentTable and their rows bucketed by the
+    grid cell of their start point, so a query only measures the segments of
+    the cells its area overlaps, filtering and measuring them column-wise. The
+    index also remembers which tiles of the explore grid it holds, for as long
+    as the tile cache keeps them, so callers can tell whether an area still
+    needs to be asked from Strava.
+
+    Queries return rows of `table` with their distances, closest first.
+    """
+
+    def __init__(self, cell_degrees: float = CELL_DEGREES, tile_ttl: float = SEGMENT_TILE_CACHE_TTL) -> None:
+        self.cell_degrees = cell_degrees
+        self.tile_ttl = tile_ttl
+        self._table: Optional[SegmentTable] = None
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._cell_of: Dict[int, Tuple[int, int]] = {}
+        # Explored tiles: whether Strava's answer for them was saturated, and
+        # when they must be explored again to pick up new segments
+        self._tiles: Dict[str, Tuple[bool, float]] = {}
+
+    @property
+    def table(self) -> SegmentTable:
+        # Created on first use, to keep numpy off the import path
+        if self._table is None:
+            self._table = SegmentTable()
+        return self._table
+
+    def __len__(self) -> int:
+        return len(self._table) if self._table is not None else 0
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees))
+
+    def add(self, segments: Iterable[dict]) -> None:
+        """Index segments, replacing those already indexed with the same id."""
+        segments = [segment for segment in segments if segment.get("start_latlng")]
+        if not segments:
+            return
+        rows = self.table.add(segments)
+        for segment, row in zip(segments, rows.tolist()):
+            cell = self._cell(*segment["start_latlng"])
+            previous = self._cell_of.get(row)
+            if previous is not None and previous != cell:
+                self._cells[previous].discard(row)
+            self._cell_of[row] = cell
+            self._cells.setdefault(cell, set()).add(row)
+
+    def add_tile(self, quadkey: str, segments: Iterable[dict], saturated: bool = False) -> None:
+        """Index the segments explored within a tile and remember the tile as covered.
+
+        Args:
+            quadkey: The quadkey of the tile
+            segments: The segments Strava explored within it
+            saturated: Whether Strava returned as many segments as it can, so
+                that smaller tiles inside it may hold more
+        """
+        self.add(segments)
+        self._tiles[quadkey] = (saturated, time.monotonic() + self.tile_ttl)
+
+    def _saturated(self, quadkey: str) -> Optional[bool]:
+        """Whether an explored tile was saturated, None if it was not explored within `tile_ttl`."""
+        explored = self._tiles.get(quadkey)
+        if explored is None:
+            return None
+        saturated, expires_at = explored
+        if expires_at <= time.monotonic():
+            del self._tiles[quadkey]
+            return None
+        return saturated
+
+    def covers(self, quadkey: str) -> bool:
+        """Whether a tile has been explored, or lies inside an explored tile that was not saturated."""
+        return self._saturated(quadkey) is not None or self.complete(quadkey)
+
+    def complete(self, quadkey: str) -> bool:
+        """Whether the index holds every segment of a tile: the tile, or a tile containing it, was explored without saturating."""
+        return any(self._saturated(quadkey[:length]) is False for length in range(1, len(quadkey) + 1))
+
+    def candidates(self, southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> "np.ndarray":
+        """Rows of the segments starting in the grid cells a bounding box overlaps, some of them outside it."""
+        import numpy as np
+
+        south, west = self._cell(southwest_latitude, southwest_longitude)
+        north, east = self._cell(northeast_latitude, northeast_longitude)
+        if southwest_longitude > northeast_longitude:
+            # The box crosses the antimeridian
+            columns = list(range(west, self._cell(0, 180.0 - 1e-9)[1] + 1)) + list(range(self._cell(0, -180.0)[1], east + 1))
+        else:
+            columns = range(west, east + 1)
+        cells = [self._cells.get((row, column), ()) for row in range(south, north + 1) for column in columns]
+        return np.fromiter((row for cell in cells for row in cell), dtype=np.int64)
+
+    def in_box(self, southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> List[dict]:
+        """Find the segments starting inside a bounding box, which may cross the antimeridian."""
+        rows = self.candidates(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+        if not len(rows):
+            return []
+        latitudes = self.table["start_latitude"][rows]
+        longitudes = self.table["start_longitude"][rows]
+        inside = (latitudes >= southwest_latitude) & (latitudes <= northeast_latitude)
+        if southwest_longitude <= northeast_longitude:
+            inside &= (longitudes >= southwest_longitude) & (longitudes <= northeast_longitude)
+        else:
+            inside &= (longitudes >= southwest_longitude) | (longitudes <= northeast_longitude)
+        return self.table.records(rows[inside])
+
+    def within(
+        self,
+        latitude: float,
+        longitude: float,
+        radius: float,
+        limit: Optional[int] = None,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_distance: Optional[float] = None,
+        max_distance: Optional[float] = None,
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Find the segments starting within `radius` kilometres of a point, closest first.
+
+        Args:
+            latitude: Latitude of the point
+            longitude: Longitude of the point
+            radius: Search radius, in kilometres
+            limit: Maximum number of segments returned, all of them when None
+            min_grade: Minimum average gradient, in percent
+            max_grade: Maximum average gradient, in percent
+            min_distance: Minimum segment length, in metres
+            max_distance: Maximum segment length, in metres
+
+        Returns:
+            rows: The rows of the segments in `table`
+            distances: The distance from the point to their start, in kilometres
+        """
+        import numpy as np
+
+        rows = self.candidates(*bounding_box(latitude, longitude, radius))
+        rows = rows[self.table.mask(rows, min_grade, max_grade, min_distance, max_distance)]
+        distances = haversine_distances(latitude, longitude, self.table["start_latitude"][rows], self.table["start_longitude"][rows])
+        order = np.argsort(distances, kind="stable")
+        order = order[distances[order] <= radius][:limit]
+        return rows[order], distances[order]
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        k: int,
+        max_radius: float = 50.0,
+        **filters: Optional[float],
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Find the `k` segments starting closest to a point, within `max_radius` kilometres.
+
+        The search radius starts at one grid cell and doubles until `k`
+        segments are found, so dense areas are answered from a few cells.
+        Accepts the filters of `within`.
+        """
+        radius = self.cell_degrees * math.pi / 180 * EARTH_RADIUS_KM
+        while True:
+            radius = min(radius, max_radius)
+            rows, distances = self.within(latitude, longitude, radius, limit=k, **filters)
+            if len(rows) >= k or radius >= max_radius:
+                return rows, distances
+            radius *= 2
+
+    def along(
+        self,
+        route_latitudes: List[float],
+        route_longitudes: List[float],
+        width: float,
+        limit: Optional[int] = None,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_distance: Optional[float] = None,
+        max_distance: Optional[float] = None,
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """Find the segments lying along a route, starting and ending within `width` kilometres of it.
+
+        Accepts the filters of `within`.
+
+        Returns:
+            rows: The rows of the segments in `table`
+            distances: The distance from the route to their start, in kilometres
+        """
+        import numpy as np
+
+        table = self.table
+        rows = self.candidates(*route_bounding_box(route_latitudes, route_longitudes, width))
+        rows = rows[table.mask(rows, min_grade, max_grade, min_distance, max_distance)]
+        start_distances = route_distances(table["start_latitude"][rows], table["start_longitude"][rows], route_latitudes, route_longitudes)
+        end_distances = route_distances(table["end_latitude"][rows], table["end_longitude"][rows], route_latitudes, route_longitudes)
+        inside = np.flatnonzero((start_distances <= width) & (end_distances <= width))
+        order = inside[np.argsort(start_distances[inside], kind="stable")][:limit]
+        return rows[order], start_distances[order]
+
+    def on_track(
+        self,
+        corridor: "TrackCorridor",
+        min_overlap: float,
+        limit: Optional[int] = None,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_distance: Optional[float] = None,
+        max_distance: Optional[float] = None,
+    ) -> Tuple["np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Find the segments a track rode, in the order it rode them.
+
+        A segment was ridden when the track passes its start before its end,
+        and at least `min_overlap` of the points of its polyline lie in the
+        track's corridor. Ends are checked first, so only the polylines of the
+        few segments both ends of which lie on the track are decoded, all of
+        them at once. Segments whose polyline is unknown are judged on their
+        ends alone. Accepts the filters of `within`.
+
+        Returns:
+            rows: The rows of the segments in `table`
+            distances: The distance along the track to their start, in kilometres
+            overlaps: The share of their points within the corridor, NaN when unknown
+        """
+        import numpy as np
+
+        table = self.table
+        rows = self.candidates(*corridor.bounds)
+        rows = rows[table.mask(rows, min_grade, max_grade, min_distance, max_distance)]
+        starts = corridor.first_visits(table["start_latitude"][rows], table["start_longitude"][rows])
+        ends = corridor.last_visits(table["end_latitude"][rows], table["end_longitude"][rows])
+        with np.errstate(invalid="ignore"):
+            passed = starts <= ends
+        rows, starts = rows[passed], starts[passed]
+
+        points, counts = decode_polylines([table.polyline(row) for row in rows.tolist()])
+        inside = corridor.contains(points[:, 0], points[:, 1])
+        owners = np.repeat(np.arange(len(rows)), counts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            overlaps = np.bincount(owners, weights=inside, minlength=len(rows)) / counts
+        ridden = np.flatnonzero((counts == 0) | (overlaps >= min_overlap))
+        order = ridden[np.argsort(starts[ridden], kind="stable")][:limit]
+        return rows[order], starts[order], overlaps[order]
+
+    def clear(self) -> None:
+        if self._table is not None:
+            self._table.clear()
+        self._cells.clear()
+        self._cell_of.clear()
+        self._tiles.clear()
+
+
+segment_index = SegmentIndex()
@@ -0,0 +1,293 @@
+from datetime import date, timedelta
+from html.parser import HTMLParser
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Positions used when a header cannot be found by name
+DEFAULT_COLUMN_POSITIONS = {
+    "Rank": 0,
+    "Name": 1,
+    "Date": 2,
+    "Speed": 3,
+    "HR": 4,
+    "Power": 5,
+}
+
+MONTHS = {
+    name: number
+    for number, name in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), start=1)
+}
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def parse_effort_date(text: str, today: Optional[date] = None) -> Optional[int]:
+    """Parse a leaderboard date such as "Mar 13, 2025".
+
+    Args:
+        text: The date as displayed by the leaderboard
+        today: The current date, used for "Today" and "Yesterday"
+
+    Returns:
+        The number of days since 1970-01-01, None if the date cannot be parsed
+    """
+    parts = text.replace(",", " ").split()
+    if len(parts) == 1 and parts[0].lower() in ("today", "yesterday"):
+        today = today or date.today()
+        day = today if parts[0].lower() == "today" else today - timedelta(days=1)
+        return day.toordinal() - EPOCH_ORDINAL
+    if len(parts) != 3:
+        return None
+    month = MONTHS.get(parts[0][:3].lower())
+    if month is None or not parts[1].isdigit() or not parts[2].isdigit():
+        return None
+    try:
+        return date(int(parts[2]), month, int(parts[1])).toordinal() - EPOCH_ORDINAL
+    except ValueError:
+        return None
+
+
+class LeaderboardRow:
+    """One effort of a segment leaderboard.
+
+    `date` is the date as displayed, `day` the same date as days since 1970-01-01.
+    """
+
+    __slots__ = (
+        "rank",
+        "athlete_name",
+        "athlete_id",
+        "date",
+        "day",
+        "effort_id",
+        "speed",
+        "heart_rate",
+        "power",
+        "vam",
+        "time",
+    )
+
+    def __init__(
+        self,
+        rank: Optional[int],
+        athlete_name: str,
+        athlete_id: str,
+        date: str,
+        effort_id: str,
+        speed: Optional[float],
+        heart_rate: Optional[float],
+        power: Optional[float],
+        vam: Optional[float],
+        time: str,
+        day: Optional[int] = None,
+    ) -> None:
+        self.rank = rank
+        self.athlete_name = athlete_name
+        self.athlete_id = athlete_id
+        self.date = date
+        self.day = day
+        self.effort_id = effort_id
+        self.speed = speed
+        self.heart_rate = heart_rate
+        self.power = power
+        self.vam = vam
+        self.time = time
+
+    def as_dict(self) -> Dict[str, object]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"LeaderboardRow(rank={self.rank}, athlete_name={self.athlete_name!r}, date={self.date!r}, time={self.time!r})"
+
+
+class Leaderboard:
+    """Parsed leaderboard page.
+
+    Attributes:
+        columns: The header names of the leaderboard table
+        rows: The efforts of the page, in rank order
+        pages: The number of pages of the leaderboard
+    """
+
+    __slots__ = ("columns", "rows", "pages")
+
+    def __init__(self, columns: List[str], rows: List[LeaderboardRow], pages: int = 1) -> None:
+        self.columns = columns
+        self.rows = rows
+        self.pages = pages
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    @property
+    def empty(self) -> bool:
+        return not self.rows
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        """Convert the rows to a pandas DataFrame, importing pandas on demand."""
+        import pandas as pd
+
+        data = [row.as_dict() for row in self.rows]
+        df = pd.DataFrame(data, columns=list(LeaderboardRow.__slots__))
+        df["day"] = pd.to_datetime(df["day"], unit="D")
+        if "VAM" not in self.columns:
+            df = df.drop(columns="vam")
+        return df
+
+
+def _to_number(text: str, suffix: str = "") -> Optional[float]:
+    if suffix and text.endswith(suffix):
+        text = text[: -len(suffix)]
+    try:
+        return float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def _last_path_part(href: Optional[str]) -> str:
+    return href.rsplit("/", 1)[-1] if href else ""
+
+
+class LeaderboardParser(HTMLParser):
+    """Single pass, event driven parser of Strava's leaderboard HTML.
+
+    Only the cells of the leaderboard table are collected: the text of every
+    cell, and the text and target of the first link it contains. Rows with a
+    CSS class, such as the highlighted row of the logged-in athlete, are
+    skipped. Data can be fed in chunks as it is received.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self.columns: List[str] = []
+        self.cells: List[List[Tuple[str, str, Optional[str]]]] = []
+        self.pages = 1
+        self._table_depth = 0
+        self._in_header = False
+        self._row: Optional[List[Tuple[str, str, Optional[str]]]] = None
+        self._text: Optional[List[str]] = None
+        self._link_text: Optional[List[str]] = None
+        self._link_href: Optional[str] = None
+        self._in_link = False
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag == "table":
+            self._table_depth += 1
+        elif tag == "a":
+            href = dict(attrs).get("href")
+            if href and "page=" in href:
+                self._read_page_number(href)
+            if self._text is not None and self._link_text is None:
+                self._in_link = True
+                self._link_href = href
+                self._link_text = []
+        elif not self._table_depth:
+            return
+        elif tag == "tr":
+            row_class = dict(attrs).get("class")
+            self._row = [] if not row_class else None
+        elif tag == "th":
+            self._in_header = True
+            self._text = []
+        elif tag == "td" and self._row is not None:
+            self._text = []
+            self._link_text = None
+            self._link_href = None
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag == "table":
+            self._table_depth = max(self._table_depth - 1, 0)
+        elif tag == "a":
+            self._in_link = False
+        elif tag == "th" and self._in_header:
+            self.columns.append("".join(self._text).strip())
+            self._in_header = False
+            self._text = None
+        elif tag == "td" and self._text is not None and self._row is not None:
+            link_text = "".join(self._link_text).strip() if self._link_text is not None else ""
+            self._row.append(("".join(self._text).strip(), link_text, self._link_href))
+            self._text = None
+            self._link_text = None
+        elif tag == "tr" and self._row is not None:
+            if self._row:
+                self.cells.append(self._row)
+            self._row = None
+
+    def handle_data(self, data: str) -> None:
+        if self._text is not None:
+            self._text.append(data)
+            if self._in_link:
+                self._link_text.append(data)
+
+    def _read_page_number(self, href: str) -> None:
+        for parameter in href.split("?", 1)[-1].split("&"):
+            name, _, value = parameter.partition("=")
+            if name == "page" and value.isdigit():
+                self.pages = max(self.pages, int(value))
+
+    def leaderboard(self) -> Leaderboard:
+        """Build the typed rows once every chunk has been fed."""
+        columns = self.columns
+        positions = {
+            name: columns.index(name) if name in columns else position
+            for name, position in DEFAULT_COLUMN_POSITIONS.items()
+        }
+        rank_at, name_at, date_at = positions["Rank"], positions["Name"], positions["Date"]
+        speed_at, hr_at, power_at = positions["Speed"], positions["HR"], positions["Power"]
+        vam_at = columns.index("VAM") if "VAM" in columns else None
+        time_at = len(columns) - 1
+
+        rows = []
+        for cells in self.cells:
+            if len(cells) < len(columns):
+                continue
+            rank = _to_number(cells[rank_at][0])
+            rows.append(LeaderboardRow(
+                rank=int(rank) if rank is not None else None,
+                athlete_name=cells[name_at][1],
+                athlete_id=_last_path_part(cells[name_at][2]),
+                date=cells[date_at][1],
+                day=parse_effort_date(cells[date_at][1]),
+                effort_id=_last_path_part(cells[date_at][2]),
+                speed=_to_number(cells[speed_at][0], " km/h"),
+                heart_rate=_to_number(cells[hr_at][0], " bpm"),
+                power=_to_number(cells[power_at][0], " W"),
+                vam=_to_number(cells[vam_at][0]) if vam_at is not None else None,
+                time=cells[time_at][0],
+            ))
+        return Leaderboard(columns, rows, self.pages)
+
+
+def parse_leaderboard(html: str) -> Leaderboard:
+    """Parse the HTML of a leaderboard page.
+
+    Args:
+        html: The HTML returned by the leaderboard endpoint
+
+    Returns:
+        The parsed leaderboard
+    """
+    parser = LeaderboardParser()
+    parser.feed(html)
+    parser.close()
+    return parser.leaderboard()
+
+
+def parse_leaderboard_bytes(content: bytes, encoding: str = "utf-8") -> Leaderboard:
+    """Decode and parse the HTML of a leaderboard page, as received.
+
+    Module-level so that it can run in a worker process, the decoding then
+    happening in the worker too.
+
+    Args:
+        content: The body returned by the leaderboard endpoint
+        encoding: The encoding of the body
+
+    Returns:
+        The parsed leaderboard
+    """
+    return parse_leaderboard(content.decode(encoding, errors="replace"))
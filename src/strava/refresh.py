@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from clients.errors import UpstreamError
+from clients.ratelimit import BACKGROUND, INTERACTIVE
+from metrics import metrics
+from settings import (
+    LEADERBOARD_FRESH_TTL,
+    LEADERBOARD_MAX_STALE,
+    LEADERBOARD_REFRESH_WORKERS,
+)
+
+from .attempts import count_climb_attempts
+from .crawler import crawl_leaderboard
+from .efforts import EffortStore, get_effort_store
+
+logger = logging.getLogger(__name__)
+
+
+class ClimbAttempts:
+    """Climb attempt counts of a segment and when its leaderboard was last crawled."""
+
+    __slots__ = ("attempts", "refreshed_at", "day")
+
+    def __init__(self, attempts: Dict[str, Any], refreshed_at: float, day: date) -> None:
+        self.attempts = attempts
+        self.refreshed_at = refreshed_at
+        # Counts depend on the current date, they are recounted on the next day
+        self.day = day
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.refreshed_at
+
+
+class ClimbAttemptsCache:
+    """Stale-while-revalidate cache of the climb attempt counts of segments.
+
+    Counts younger than `ttl` are answered from memory. Older ones are answered
+    at once too, and their leaderboard queued for a background worker to crawl
+    at background priority, so refreshes only use the request budget
+    interactive calls leave. Counts older than `max_stale`, or never counted,
+    are crawled before answering.
+
+    The effort store is the source of truth: counts are rebuilt from it, aged
+    by its last completed crawl, after a restart or at midnight.
+    """
+
+    def __init__(
+        self,
+        ttl: float = LEADERBOARD_FRESH_TTL,
+        max_stale: float = LEADERBOARD_MAX_STALE,
+        workers: int = LEADERBOARD_REFRESH_WORKERS,
+        store: Optional[EffortStore] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_stale = max(max_stale, ttl)
+        self.worker_count = workers
+        self._store = store
+        self._entries: Dict[int, ClimbAttempts] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[int] = set()
+        self._workers: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.fresh_hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+
+    @property
+    def store(self) -> EffortStore:
+        return self._store or get_effort_store()
+
+    def _load(self, segment_id: int) -> Optional[ClimbAttempts]:
+        """Count the stored efforts of a segment, None if its leaderboard was never crawled."""
+        crawled = [crawl.completed_at for crawl in self.store.crawls(segment_id) if crawl.complete]
+        if not crawled:
+            return None
+        return self._remember(segment_id, max(crawled))
+
+    def _remember(self, segment_id: int, refreshed_at: float) -> ClimbAttempts:
+        today = date.today()
+        entry = ClimbAttempts(count_climb_attempts(self.store.effort_days(segment_id), today), refreshed_at, today)
+        self._entries[segment_id] = entry
+        return entry
+
+    def _entry(self, segment_id: int) -> Optional[ClimbAttempts]:
+        entry = self._entries.get(segment_id)
+        if entry is None or entry.day != date.today():
+            entry = self._load(segment_id)
+        return entry
+
+    async def refresh(self, segment_id: int, priority: int = INTERACTIVE) -> ClimbAttempts:
+        """Crawl the leaderboard of a segment and recount its climb attempts.
+
+        Raises:
+            UpstreamError: The leaderboard could not be crawled and nothing is stored yet
+        """
+        store = self.store
+        error = None
+        try:
+            complete = await crawl_leaderboard(segment_id, store, priority)
+        except UpstreamError as e:
+            complete, error = False, e
+        if complete:
+            return self._remember(segment_id, time.time())
+        entry = self._entry(segment_id)
+        if entry is not None:
+            return entry
+        if len(store.effort_days(segment_id)):
+            # Part of the leaderboard is stored, count it but keep it stale
+            return self._remember(segment_id, 0.0)
+        raise error or UpstreamError("Strava", f"unable to fetch the leaderboard of segment {segment_id}")
+
+    async def get(self, segment_id: int) -> Dict[str, Any]:
+        """Get the climb attempt counts of a segment, refreshing them when they are stale.
+
+        Raises:
+            UpstreamError: The leaderboard could not be crawled and nothing is stored yet
+        """
+        entry = self._entry(segment_id)
+        if entry is None or entry.age > self.max_stale:
+            self.misses += 1
+            metrics.increment("cache_lookups_total", cache="climb_attempts", result="miss")
+            try:
+                return (await self.refresh(segment_id)).attempts
+            except UpstreamError:
+                if entry is None:
+                    raise
+                logger.warning(f"Unable to refresh the leaderboard of segment {segment_id}, answering counts {entry.age / 3600:.0f} h old")
+                return entry.attempts
+
+        if entry.age > self.ttl:
+            self.stale_hits += 1
+            metrics.increment("cache_lookups_total", cache="climb_attempts", result="stale")
+            self.schedule(segment_id)
+        else:
+            self.fresh_hits += 1
+            metrics.increment("cache_lookups_total", cache="climb_attempts", result="memory")
+        return entry.attempts
+
+    def _bind_loop(self) -> asyncio.Queue:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Asyncio primitives cannot be shared across event loops
+            self._queue = asyncio.Queue()
+            self._pending = set()
+            self._workers = [loop.create_task(self._work()) for _ in range(self.worker_count)]
+            self._loop = loop
+        return self._queue
+
+    def schedule(self, segment_id: int) -> bool:
+        """Queue the leaderboard of a segment for a background refresh, unless it already is.
+
+        Returns:
+            Whether the leaderboard was queued
+        """
+        queue = self._bind_loop()
+        if segment_id in self._pending:
+            return False
+        self._pending.add(segment_id)
+        queue.put_nowait(segment_id)
+        return True
+
+    def warm(self, segment_ids: Iterable[int]) -> int:
+        """Queue the leaderboards of segments for a background refresh unless their counts are fresh.
+
+        Returns:
+            The number of leaderboards queued
+        """
+        queued = 0
+        for segment_id in segment_ids:
+            entry = self._entry(segment_id)
+            if (entry is None or entry.age > self.ttl) and self.schedule(segment_id):
+                queued += 1
+        if queued:
+            logger.info(f"Warming the leaderboards of {queued} hot segments")
+        return queued
+
+    async def _work(self) -> None:
+        while True:
+            segment_id = await self._queue.get()
+            try:
+                await self.refresh(segment_id, BACKGROUND)
+                self.refreshes += 1
+            except Exception as e:
+                self.failed_refreshes += 1
+                logger.warning(f"Background refresh of the leaderboard of segment {segment_id} failed: {e}")
+            finally:
+                self._pending.discard(segment_id)
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait for the queued refreshes to finish."""
+        if self._queue is not None and self._loop is asyncio.get_running_loop():
+            await self._queue.join()
+
+    async def stop(self) -> None:
+        """Cancel the background workers, dropping the queued refreshes."""
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        self._queue = None
+        self._pending = set()
+        self._loop = None
+
+    def stats(self) -> Dict[str, int]:
+        """Hit, refresh and queue metrics of the cache."""
+        return {
+            "segments": len(self._entries),
+            "fresh_hits": self.fresh_hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+            "queued": len(self._pending),
+        }
+
+
+climb_attempts_cache = ClimbAttemptsCache()
@@ -1,76 +1,102 @@
-import aiohttp
-import pandas as pd
-from bs4 import BeautifulSoup
+import logging
+from typing import Optional
 
+import httpx
+
+from clients.errors import UpstreamError
+from clients.pool import get_http_pool
+from clients.ratelimit import INTERACTIVE, RequestScheduler, TokenBucket
+from clients.resilience import ResilientUpstream
+from clients.singleflight import SingleFlight
+from concurrency import get_cpu_executor
+from metrics import span
+from settings import (
+    LEADERBOARD_CONCURRENCY,
+    LEADERBOARD_PAGE_SIZE,
+    LEADERBOARD_REQUESTS_PER_SECOND,
+    STRAVA_WEB_BASE,
+)
+
+from .leaderboard import Leaderboard, parse_leaderboard_bytes
 from .utils import COOKIES, HEADERS, PARAMS
 
+logger = logging.getLogger(__name__)
+
+STRAVA_WEB = "strava_web"
+
+# Leaderboard filter matching each date range
+DATE_RANGE_FILTERS = {
+    "today": "today",
+    "this_week": "current_week",
+    "this_month": "current_month",
+    "this_year": "current_year",
+}
+
+get_http_pool().register(STRAVA_WEB, max_connections=4, headers=HEADERS, cookies=COOKIES)
+leaderboard_scheduler = RequestScheduler(
+    "Strava leaderboard",
+    TokenBucket(rate=LEADERBOARD_REQUESTS_PER_SECOND, capacity=LEADERBOARD_CONCURRENCY),
+)
+leaderboard_flights = SingleFlight("Strava leaderboard")
+leaderboard_resilience = ResilientUpstream(STRAVA_WEB)
+
+
+async def _fetch_leaderboard(url: str, params: dict, priority: int = INTERACTIVE) -> Leaderboard:
+    async def send() -> httpx.Response:
+        await leaderboard_scheduler.acquire(priority)
+        return await get_http_pool().get(STRAVA_WEB, url, params=params)
+
+    async def fetch() -> Leaderboard:
+        response = await leaderboard_resilience.get(send)
+        # Large pages are parsed in a worker, keeping the event loop free for other calls
+        with span("parse", parser="leaderboard"):
+            return await get_cpu_executor().run(parse_leaderboard_bytes, response.content, response.encoding or "utf-8")
+
+    # Concurrent requests of the same page share a single upstream request
+    return await leaderboard_flights.do((url, tuple(sorted(params.items()))), fetch)
 
-async def parse_strava_leaderboard(url) -> pd.DataFrame:
+
+async def parse_strava_leaderboard(url) -> Optional[Leaderboard]:
+    """Fetch and parse the first page of this year's leaderboard of a segment.
+
+    Args:
+        url: The URL of the segment page
+
+    Returns:
+        The parsed leaderboard, call `to_dataframe()` on it for a pandas DataFrame,
+        None if it could not be fetched
+    """
     try:
-        # First, get the initial page to get any necessary cookies
-        async with aiohttp.ClientSession() as session:
-            
-            # Modify URL for this year's data if requested
-            url = f"{url}/leaderboard?date_range=this_year&filter=current_year&partial=true"
-            
-            async with session.get(url, params=PARAMS, cookies=COOKIES, headers=HEADERS) as response:
-                response.raise_for_status()
-                
-                # Parse the HTML
-                text = await response.text()
-                soup = BeautifulSoup(text, 'html.parser')
-
-
-                # Get column names from headers
-                headers = soup.find_all('th')
-                column_names = [header.get_text(strip=True) for header in headers]
-                
-                # Extract leaderboard data
-                leaderboard_data = []
-                leaderboard_rows = soup.find_all('tr', class_='')
-                
-                for row in leaderboard_rows:
-                    cols = row.find_all('td')
-                    if len(cols) >= len(column_names):  # Ensure we have all columns
-                        athlete_link = cols[1].find('a')
-                        effort_link = cols[2].find('a')
-                        
-                        # Extract data with proper error handling
-                        entry = {
-                            'rank': cols[0].get_text(strip=True),
-                            'athlete_name': athlete_link.get_text(strip=True) if athlete_link else '',
-                            'athlete_id': athlete_link['href'].split('/')[-1] if athlete_link else '',
-                            'date': effort_link.get_text(strip=True) if effort_link else '',
-                            'effort_id': effort_link['href'].split('/')[-1] if effort_link else '',
-                            'speed': cols[3].get_text(strip=True).replace(' km/h', ''),
-                            'heart_rate': cols[4].get_text(strip=True).replace(' bpm', ''),
-                            'power': cols[5].get_text(strip=True).replace(' W', '').replace('-', '')
-                        }
-                        
-                        # Add VAM if it exists in the columns
-                        if 'VAM' in column_names:
-                            vam_index = column_names.index('VAM')
-                            entry['VAM'] = cols[vam_index].get_text(strip=True)
-                            
-                        # Add time (it's always the last column)
-                        time_index = len(column_names) - 1
-                        entry['time'] = cols[time_index].get_text(strip=True)
-                            
-                        leaderboard_data.append(entry)
-            
-        # Create DataFrame
-        df = pd.DataFrame(leaderboard_data)
-        
-        # Convert numeric columns
-        if not df.empty:
-            numeric_columns = ['rank', 'speed', 'heart_rate', 'power']
-            if 'VAM' in df.columns:
-                numeric_columns.append('VAM')
-            for col in numeric_columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-
-        return df
-        
-    except Exception as e:
-        print(f"Error occurred: {str(e)}")
+        return await _fetch_leaderboard(f"{url}/leaderboard", PARAMS)
+    except UpstreamError as e:
+        logger.warning(f"Unable to fetch the leaderboard of {url}: {e}")
         return None
+
+
+async def fetch_leaderboard_page(segment_id: int, date_range: str = "this_year", page: int = 1, priority: int = INTERACTIVE) -> Leaderboard:
+    """Fetch and parse one page of the leaderboard of a segment.
+
+    Args:
+        segment_id: The ID of the segment
+        date_range: One of today, this_week, this_month or this_year
+        page: The page number, starting at 1
+        priority: Priority of the request, background refreshes wait for interactive calls
+
+    Returns:
+        The parsed page
+
+    Raises:
+        UpstreamError: The page could not be fetched
+    """
+    params = {
+        **PARAMS,
+        "date_range": date_range,
+        "filter": DATE_RANGE_FILTERS[date_range],
+        "page": str(page),
+        "per_page": str(LEADERBOARD_PAGE_SIZE),
+    }
+    try:
+        return await _fetch_leaderboard(f"{STRAVA_WEB_BASE}/segments/{segment_id}/leaderboard", params, priority)
+    except UpstreamError as e:
+        logger.warning(f"Unable to fetch page {page} of the {date_range} leaderboard of segment {segment_id}: {e}")
+        raise
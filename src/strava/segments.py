@@ -0,0 +1,204 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Numeric columns of a segment table and their dtypes
+COLUMNS = (
+    ("id", "i8"),
+    ("distance", "f4"),
+    ("avg_grade", "f4"),
+    ("elevation_difference", "f4"),
+    ("climb_category", "i1"),
+    ("start_latitude", "f8"),
+    ("start_longitude", "f8"),
+    ("end_latitude", "f8"),
+    ("end_longitude", "f8"),
+    ("name_offset", "u4"),
+    ("name_length", "u4"),
+    ("points_offset", "u4"),
+    ("points_length", "u4"),
+)
+
+# Bytes of replaced names or polylines a buffer may hold, past half its size,
+# before it is compacted
+COMPACT_MIN_BYTES = 64 * 1024
+
+
+class SegmentTable:
+    """Columnar store of explored segments.
+
+    Each field is one NumPy column, names share a single UTF-8 buffer and the
+    encoded polylines a single ASCII one, so thousands of segments cost a few
+    dozen bytes each instead of a dict per segment. Segments are keyed by id: adding a segment already present
+    updates its row in place. Rows are turned back into dicts only when they
+    are shown.
+
+    Distances are in metres, gradients in percent and coordinates in degrees.
+    Missing end points repeat the start point.
+    """
+
+    def __init__(self, capacity: int = 64) -> None:
+        import numpy as np
+
+        self._columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMNS}
+        self._names = bytearray()
+        self._points = bytearray()
+        self._dead = {"name": 0, "points": 0}
+        self._rows: Dict[int, int] = {}
+        self._size = 0
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[dict]) -> "SegmentTable":
+        """Build a table from raw segments of Strava's explore endpoint."""
+        segments = list(segments)
+        table = cls(capacity=max(len(segments), 1))
+        table.add(segments)
+        return table
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, column: str) -> "np.ndarray":
+        """Get a column, such as table["avg_grade"]."""
+        return self._columns[column][:self._size]
+
+    @property
+    def ids(self) -> "np.ndarray":
+        return self["id"]
+
+    def row_of(self, segment_id: int) -> Optional[int]:
+        return self._rows.get(segment_id)
+
+    def _grow(self, size: int) -> None:
+        import numpy as np
+
+        capacity = len(self._columns["id"])
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        for name, column in self._columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def add(self, segments: Iterable[dict]) -> "np.ndarray":
+        """Add raw segments, updating those already present.
+
+        Returns:
+            The row of each segment
+        """
+        import numpy as np
+
+        rows = []
+        for segment in segments:
+            row = self._rows.get(segment["id"])
+            new = row is None
+            if new:
+                self._grow(self._size + 1)
+                row = self._rows[segment["id"]] = self._size
+                self._size += 1
+
+            start = segment.get("start_latlng") or (float("nan"), float("nan"))
+            end = segment.get("end_latlng") or start
+            name = (segment.get("name") or "").encode("utf-8")
+            columns = self._columns
+            columns["id"][row] = segment["id"]
+            columns["distance"][row] = segment.get("distance") or 0.0
+            columns["avg_grade"][row] = segment.get("avg_grade") or 0.0
+            columns["elevation_difference"][row] = segment.get("elev_difference") or 0.0
+            columns["climb_category"][row] = segment.get("climb_category") or 0
+            columns["start_latitude"][row], columns["start_longitude"][row] = start
+            columns["end_latitude"][row], columns["end_longitude"][row] = end
+            self._store(self._names, "name", row, name, new)
+            points = (segment.get("points") or "").encode("ascii")
+            if points or new:
+                # Sources without polylines keep the one a previous source gave
+                self._store(self._points, "points", row, points, new)
+            rows.append(row)
+        self._compact(self._names, "name")
+        self._compact(self._points, "points")
+        return np.asarray(rows, dtype=np.int64)
+
+    def _store(self, buffer: bytearray, field: str, row: int, value: bytes, new: bool) -> None:
+        """Point a row at its bytes, appending them unless the row already holds the same."""
+        offsets, lengths = self._columns[f"{field}_offset"], self._columns[f"{field}_length"]
+        if not new:
+            offset, length = int(offsets[row]), int(lengths[row])
+            if length == len(value) and buffer[offset:offset + length] == value:
+                return
+            self._dead[field] += length
+        offsets[row] = len(buffer)
+        lengths[row] = len(value)
+        buffer.extend(value)
+
+    def _compact(self, buffer: bytearray, field: str) -> None:
+        """Drop the bytes no row points at any more, once they take up most of a buffer."""
+        if self._dead[field] <= max(len(buffer) // 2, COMPACT_MIN_BYTES):
+            return
+        offsets, lengths = self[f"{field}_offset"], self[f"{field}_length"]
+        compacted = bytearray()
+        for row in range(self._size):
+            offset, length = int(offsets[row]), int(lengths[row])
+            offsets[row] = len(compacted)
+            compacted.extend(buffer[offset:offset + length])
+        buffer[:] = compacted
+        self._dead[field] = 0
+
+    def name(self, row: int) -> str:
+        offset = int(self._columns["name_offset"][row])
+        return self._names[offset:offset + int(self._columns["name_length"][row])].decode("utf-8")
+
+    def polyline(self, row: int) -> str:
+        """The encoded polyline of a segment, empty when its source had none."""
+        offset = int(self._columns["points_offset"][row])
+        return self._points[offset:offset + int(self._columns["points_length"][row])].decode("ascii")
+
+    def record(self, row: int) -> Dict[str, Any]:
+        """Turn a row back into a JSON-serialisable dict, for display."""
+        columns = self._columns
+        return {
+            "id": int(columns["id"][row]),
+            "name": self.name(row),
+            "distance": round(float(columns["distance"][row]), 1),
+            "avg_grade": round(float(columns["avg_grade"][row]), 1),
+            "elevation_difference": round(float(columns["elevation_difference"][row]), 1),
+            "climb_category": int(columns["climb_category"][row]),
+            "start_latlng": [float(columns["start_latitude"][row]), float(columns["start_longitude"][row])],
+            "end_latlng": [float(columns["end_latitude"][row]), float(columns["end_longitude"][row])],
+        }
+
+    def records(self, rows: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        """Turn rows, all of them by default, into dicts."""
+        return [self.record(int(row)) for row in (range(self._size) if rows is None else rows)]
+
+    def mask(
+        self,
+        rows: "np.ndarray",
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_distance: Optional[float] = None,
+        max_distance: Optional[float] = None,
+    ) -> "np.ndarray":
+        """Mask of the rows within a range of average gradients, in percent, and lengths, in metres."""
+        import numpy as np
+
+        keep = np.ones(len(rows), dtype=bool)
+        grades = self._columns["avg_grade"][rows]
+        distances = self._columns["distance"][rows]
+        if min_grade is not None:
+            keep &= grades >= min_grade
+        if max_grade is not None:
+            keep &= grades <= max_grade
+        if min_distance is not None:
+            keep &= distances >= min_distance
+        if max_distance is not None:
+            keep &= distances <= max_distance
+        return keep
+
+    def clear(self) -> None:
+        self._names.clear()
+        self._points.clear()
+        self._dead = {"name": 0, "points": 0}
+        self._rows.clear()
+        self._size = 0
@@ -0,0 +1,114 @@
+from math import atan, cos, degrees, floor, log, pi, radians, sinh, tan
+from typing import List, Tuple
+
+# Web Mercator cannot represent the poles
+MAX_LATITUDE = 85.05112878
+
+# Zoom levels a query may snap to, finest first. Zoom 14 tiles are about 2.4 km
+# wide at 0° latitude, zoom 10 tiles about 39 km.
+TILE_ZOOM_LEVELS = (14, 13, 12, 11, 10, 9, 8)
+
+
+def tile_for(latitude: float, longitude: float, zoom: int) -> Tuple[int, int]:
+    """Get the slippy-map tile containing a point.
+
+    Args:
+        latitude: Latitude of the point
+        longitude: Longitude of the point
+        zoom: Zoom level of the tile grid
+
+    Returns:
+        x: Column of the tile
+        y: Row of the tile, 0 being the northernmost
+    """
+    n = 1 << zoom
+    latitude = min(max(latitude, -MAX_LATITUDE), MAX_LATITUDE)
+    x = floor((longitude + 180.0) / 360.0 * n) % n
+    y = floor((1.0 - log(tan(radians(latitude)) + 1.0 / cos(radians(latitude))) / pi) / 2.0 * n)
+    return x, min(max(y, 0), n - 1)
+
+
+def tile_bounds(x: int, y: int, zoom: int) -> Tuple[float, float, float, float]:
+    """Get the bounding box of a tile.
+
+    Returns:
+        southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude
+    """
+    n = 1 << zoom
+
+    def latitude(row: int) -> float:
+        return degrees(atan(sinh(pi * (1 - 2 * row / n))))
+
+    return (latitude(y + 1), x / n * 360.0 - 180.0, latitude(y), (x + 1) / n * 360.0 - 180.0)
+
+
+def quadkey(x: int, y: int, zoom: int) -> str:
+    """Encode a tile as a quadkey, whose prefixes are the enclosing tiles."""
+    digits = []
+    for level in range(zoom, 0, -1):
+        mask = 1 << (level - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def quadkey_to_tile(key: str) -> Tuple[int, int, int]:
+    """Decode a quadkey.
+
+    Returns:
+        x: Column of the tile
+        y: Row of the tile
+        zoom: Zoom level of the tile
+    """
+    x = y = 0
+    zoom = len(key)
+    for level, digit in zip(range(zoom, 0, -1), key):
+        mask = 1 << (level - 1)
+        value = int(digit)
+        if value & 1:
+            x |= mask
+        if value & 2:
+            y |= mask
+    return x, y, zoom
+
+
+def tiles_covering(
+    southwest_latitude: float,
+    southwest_longitude: float,
+    northeast_latitude: float,
+    northeast_longitude: float,
+    zoom: int,
+) -> List[Tuple[int, int]]:
+    """List the tiles of a zoom level intersecting a bounding box.
+
+    A box whose southwest longitude is greater than its northeast longitude
+    crosses the antimeridian.
+    """
+    n = 1 << zoom
+    west, north = tile_for(northeast_latitude, southwest_longitude, zoom)
+    east, south = tile_for(southwest_latitude, northeast_longitude, zoom)
+    columns = (east - west) % n + 1
+    return [((west + dx) % n, y) for y in range(north, south + 1) for dx in range(columns)]
+
+
+def covering_quadkeys(
+    southwest_latitude: float,
+    southwest_longitude: float,
+    northeast_latitude: float,
+    northeast_longitude: float,
+    max_tiles: int,
+) -> List[str]:
+    """Snap a bounding box onto the tile grid.
+
+    Picks the finest zoom level at which the box is covered by at most
+    `max_tiles` tiles.
+
+    Returns:
+        The quadkeys of the covering tiles, none when the box needs more than
+        `max_tiles` tiles even at the coarsest level
+    """
+    bounds = (southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+    for zoom in TILE_ZOOM_LEVELS:
+        tiles = tiles_covering(*bounds, zoom)
+        if len(tiles) <= max_tiles:
+            return [quadkey(x, y, zoom) for x, y in tiles]
+    return []
@@ -1,19 +1,92 @@
+import asyncio
 import logging
-from math import cos, pi
-from typing import Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
-from nominatim.api import make_nominatim_request
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from cache.tiered import TieredCache
+from clients.errors import UpstreamError
+from clients.ratelimit import BACKGROUND, INTERACTIVE
+from geometry import bounding_box
+from nominatim.backends import get_geocoding_backend
+from nominatim.cache import (
+    coordinates_key,
+    geocode_cache,
+    normalise_address,
+    reverse_geocode_cache,
 )
+
 logger = logging.getLogger(__name__)
 
-NOMINATIM_API_BASE = "https://nominatim.openstreetmap.org"
+async def geocode(key: str, priority: int = INTERACTIVE) -> Optional[List[float]]:
+    """Resolve a normalised address through the cache, then the geocoding backend.
+
+    Args:
+        key: The address, normalised with `normalise_address`
+        priority: Priority of the Nominatim request on a miss of the cache and gazetteer
+
+    Returns:
+        The latitude and longitude, None if no such place is known
+
+    Raises:
+        UpstreamError: The geocoding backend could not be queried
+    """
+    hit, coordinates = geocode_cache.get(key)
+    if hit:
+        logger.debug(f"Geocode cache hit for address: {key}")
+        return coordinates
+
+    logger.debug(f"Fetching latitude and longitude for address: {key}")
+    data = await get_geocoding_backend().search(key, priority)
+    logger.debug(f"Received {len(data) if isinstance(data, list) else 0} geocoding candidates for address: {key}")
+
+    if data == []:
+        # The backend answered but knows no such place, remember it
+        geocode_cache.set(key, None)
+        return None
+
+    if not data or "lat" not in data[0] or "lon" not in data[0]:
+        raise UpstreamError("Nominatim", f"no latitude and longitude in the answer for address: {key}")
+
+    coordinates = [float(data[0]["lat"]), float(data[0]["lon"])]
+    logger.debug(f"Latitude: {coordinates[0]}, Longitude: {coordinates[1]}")
+    geocode_cache.set(key, coordinates)
+    return coordinates
+
+async def reverse_geocode(latitude: float, longitude: float, priority: int = INTERACTIVE) -> Optional[str]:
+    """Resolve coordinates to the name of the closest address, through the cache, then the geocoding backend.
+
+    Args:
+        latitude: Latitude of the location
+        longitude: Longitude of the location
+        priority: Priority of the Nominatim request on a miss of the cache and gazetteer
+
+    Returns:
+        The address, None if no place is known there
+
+    Raises:
+        UpstreamError: The geocoding backend could not be queried
+    """
+    key = coordinates_key(latitude, longitude)
+    hit, address = reverse_geocode_cache.get(key)
+    if hit:
+        logger.debug(f"Reverse geocode cache hit for coordinates: {key}")
+        return address
+
+    logger.debug(f"Fetching address for coordinates: {key}")
+    data = await get_geocoding_backend().reverse(latitude, longitude, priority)
+    logger.debug(f"Received reverse geocoding answer for coordinates: {key}")
+
+    if isinstance(data, dict) and "error" in data:
+        # The backend answered but knows no place there, remember it
+        reverse_geocode_cache.set(key, None)
+        return None
+
+    if not isinstance(data, dict) or "display_name" not in data:
+        raise UpstreamError("Nominatim", f"no address in the answer for coordinates: {key}")
+
+    reverse_geocode_cache.set(key, data["display_name"])
+    return data["display_name"]
 
 async def get_latitude_and_longitude(address: str) -> Tuple[float, float]:
     """Get the latitude and longitude of an address.
@@ -24,48 +97,138 @@ async def get_latitude_and_longitude(address: str) -> Tuple[float, float]:
     Returns:
         latitude: The latitude of the address
         longitude: The longitude of the address
-    """
-    logger.debug(f"Fetching latitude and longitude for address: {address}")
-    data = await make_nominatim_request(f"{NOMINATIM_API_BASE}/search?q={address}&format=json")
-    logger.debug(f"Received response from Nominatim API: {data}")
 
-    if not data or "lat" not in data[0] or "lon" not in data[0]:
-        logger.warning("No data or latitude and longitude found in Nominatim API response")
+    Raises:
+        ValueError: No such place is known
+        UpstreamError: The geocoding backend could not be queried
+    """
+    coordinates = await geocode(normalise_address(address))
+    if coordinates is None:
         raise ValueError(f"Unable to fetch latitude and longitude for address: {address}")
+    return tuple(coordinates)
+
+async def _resolve_batch(
+    keys: List[str],
+    cache: TieredCache,
+    resolve: Callable[[str], Awaitable[Any]],
+    on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]],
+) -> Dict[str, Dict[str, Any]]:
+    """Resolve the distinct keys of a batch, answering cached ones first.
+
+    Misses are all started at once and paced by the Nominatim scheduler at
+    BACKGROUND priority, so single lookups from other calls go first.
+
+    Returns:
+        The outcome of each distinct key: its status, `value` when found,
+        whether it was `cached` and the `error` when Nominatim failed
+    """
+    outcomes: Dict[str, Dict[str, Any]] = {}
+    misses = []
+    for key in dict.fromkeys(keys):
+        hit, value = cache.get(key)
+        if hit:
+            outcomes[key] = {"status": "ok" if value is not None else "not_found", "value": value, "cached": True}
+            if on_result is not None:
+                await on_result(len(outcomes), outcomes[key])
+        else:
+            misses.append(key)
+    logger.debug(f"Batch of {len(keys)} items: {len(outcomes)} cached, {len(misses)} to resolve")
+
+    async def outcome_of(key: str) -> Tuple[str, Dict[str, Any]]:
+        try:
+            value = await resolve(key)
+        except UpstreamError as e:
+            return key, {"status": "error", "error": str(e), "cached": False}
+        return key, {"status": "ok" if value is not None else "not_found", "value": value, "cached": False}
 
-    latitude = float(data[0]["lat"])
-    longitude = float(data[0]["lon"])
-    logger.debug(f"Latitude: {latitude}, Longitude: {longitude}")
-    return (latitude, longitude)
+    for future in asyncio.as_completed([outcome_of(key) for key in misses]):
+        key, outcome = await future
+        outcomes[key] = outcome
+        if on_result is not None:
+            await on_result(len(outcomes), outcome)
+    return outcomes
 
-def define_number_kilometers_per_degree_longitude(latitude: float) -> float:
-    """Define the number of kilometers per degree of longitude.
+async def get_latitudes_and_longitudes(
+    addresses: List[str],
+    on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+) -> List[Dict[str, Any]]:
+    """Geocode several addresses, answering cached ones first.
 
     Args:
-        latitude: Latitude of the location
+        addresses: The addresses to geocode, spelling variants are resolved once
+        on_result: Called with the number of distinct addresses resolved so far
+            and the outcome of the last one
 
     Returns:
-        kilometers_per_degree: The number of kilometers per degree of latitude
+        One result per address, in input order, holding the address, its status
+        ("ok", "not_found" or "error"), whether it was cached, and its latitude and
+        longitude when found or the error
     """
-    earth_circumference = 40075.017
-    return earth_circumference * cos(latitude * pi / 180) / 360
+    keys = [normalise_address(address) for address in addresses]
+    outcomes = await _resolve_batch(
+        keys, geocode_cache, lambda key: geocode(key, priority=BACKGROUND), on_result
+    )
+
+    results = []
+    for address, key in zip(addresses, keys):
+        outcome = outcomes[key]
+        result = {"address": address, "status": outcome["status"], "cached": outcome["cached"]}
+        if outcome["status"] == "ok":
+            result["latitude"], result["longitude"] = outcome["value"]
+        elif outcome["status"] == "error":
+            result["error"] = outcome["error"]
+        results.append(result)
+    return results
 
-def define_number_kilometers_per_degree_latitude() -> float:
-    """Define the number of kilometers per degree of latitude.
+async def get_addresses(
+    coordinates: List[Tuple[float, float]],
+    on_result: Optional[Callable[[int, Dict[str, Any]], Awaitable[None]]] = None,
+) -> List[Dict[str, Any]]:
+    """Reverse geocode several locations, answering cached ones first.
+
+    Args:
+        coordinates: The latitude and longitude of each location, locations
+            closer than about a metre are resolved once
+        on_result: Called with the number of distinct locations resolved so far
+            and the outcome of the last one
 
     Returns:
-        kilometers_per_degree: The number of kilometers per degree of latitude
+        One result per location, in input order, holding its latitude and
+        longitude, its status ("ok", "not_found" or "error"), whether it was
+        cached, and its address when found or the error
     """
-    return 110.574
+    keys = [coordinates_key(latitude, longitude) for latitude, longitude in coordinates]
+
+    async def resolve(key: str) -> Optional[str]:
+        latitude, longitude = (float(part) for part in key.split(","))
+        return await reverse_geocode(latitude, longitude, priority=BACKGROUND)
+
+    outcomes = await _resolve_batch(keys, reverse_geocode_cache, resolve, on_result)
+
+    results = []
+    for (latitude, longitude), key in zip(coordinates, keys):
+        outcome = outcomes[key]
+        result = {"latitude": latitude, "longitude": longitude, "status": outcome["status"], "cached": outcome["cached"]}
+        if outcome["status"] == "ok":
+            result["address"] = outcome["value"]
+        elif outcome["status"] == "error":
+            result["error"] = outcome["error"]
+        results.append(result)
+    return results
 
 def define_rectangular_area(latitude: float, longitude: float, distance: float = 10) -> Tuple[float, float, float, float]:
     """Define a rectangular area.
-    
+
+    The area is the smallest box containing every point within `distance` of
+    the center. It spans every longitude when it contains a pole, and its
+    southwest longitude is greater than its northeast one when it crosses the
+    antimeridian.
+
     Args:
         latitude: Latitude of the center of the area
         longitude: Longitude of the center of the area
-        distance: Distance in kilometers from the center to the corners of the rectangle
-    
+        distance: Distance in kilometers from the center to the sides of the rectangle
+
     Returns:
         southwest_latitude: Latitude of the southwest corner of the bounding box
         southwest_longitude: Longitude of the southwest corner of the bounding box
@@ -73,14 +236,7 @@ def define_rectangular_area(latitude: float, longitude: float, distance: float =
         northeast_longitude: Longitude of the northeast corner of the bounding box
     """
     logger.debug(f"Distance: {distance} kilometers")
-    kilometers_per_degree_latitude = define_number_kilometers_per_degree_latitude()
-    kilometers_per_degree_longitude = define_number_kilometers_per_degree_longitude(latitude)
-
-    southwest_latitude = latitude - (distance / kilometers_per_degree_latitude)
-    southwest_longitude = longitude - (distance / kilometers_per_degree_longitude)
-    northeast_latitude = latitude + (distance / kilometers_per_degree_latitude)
-    northeast_longitude = longitude + (distance / kilometers_per_degree_longitude)
-
+    southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude = bounding_box(latitude, longitude, distance)
     logger.debug(f"Southwest: {southwest_latitude}, {southwest_longitude}")
     logger.debug(f"Northeast: {northeast_latitude}, {northeast_longitude}")
     return (southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
@@ -91,5 +247,29 @@ def register_location_tools(mcp: FastMCP):
         return await get_latitude_and_longitude(address)
 
     @mcp.tool()
-    def define_rectangular_area_tool(latitude: float, longitude: float, distance: float = 10000) -> Tuple[float, float, float, float]:
-        return define_rectangular_area(latitude, longitude, distance) 
\ No newline at end of file
+    def define_rectangular_area_tool(latitude: float, longitude: float, distance: float = 10) -> Tuple[float, float, float, float]:
+        return define_rectangular_area(latitude, longitude, distance)
+
+    @mcp.tool()
+    async def get_latitudes_and_longitudes_tool(addresses: List[str], ctx: Context) -> List[Dict[str, Any]]:
+        """Geocode several addresses at once, such as the waypoints of a route.
+        Cached addresses are answered straight away, the others at Nominatim's
+        pace of one per second."""
+        total = len({normalise_address(address) for address in addresses})
+
+        async def report(done: int, outcome: Dict[str, Any]) -> None:
+            await ctx.report_progress(done, total)
+
+        return await get_latitudes_and_longitudes(addresses, on_result=report)
+
+    @mcp.tool()
+    async def get_addresses_tool(coordinates: List[Tuple[float, float]], ctx: Context) -> List[Dict[str, Any]]:
+        """Find the address of several (latitude, longitude) locations at once.
+        Cached locations are answered straight away, the others at Nominatim's
+        pace of one per second."""
+        total = len({coordinates_key(latitude, longitude) for latitude, longitude in coordinates})
+
+        async def report(done: int, outcome: Dict[str, Any]) -> None:
+            await ctx.report_progress(done, total)
+
+        return await get_addresses(coordinates, on_result=report)
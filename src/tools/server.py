@@ -0,0 +1,82 @@
+from typing import Any, Dict, Literal, Union
+
+from mcp.server.fastmcp import FastMCP
+
+from clients.pool import get_http_pool
+from concurrency import get_cpu_executor
+from metrics import metrics
+from nominatim.api import nominatim_flights, nominatim_resilience, nominatim_scheduler
+from nominatim.backends import get_geocoding_backend
+from strava.api import strava_flights, strava_resilience, strava_scheduler
+from strava.crawler import crawl_flights
+from strava.refresh import climb_attempts_cache
+from strava.scraper import (
+    leaderboard_flights,
+    leaderboard_resilience,
+    leaderboard_scheduler,
+)
+
+
+def get_upstream_stats() -> Dict[str, Any]:
+    """Get the connection and rate limiting metrics of the upstream services.
+
+    Returns:
+        connections: New and reused connections per upstream
+        schedulers: Queue depth, wait times and quota usage per upstream
+        coalescing: Calls coalesced into an identical call in flight
+        resilience: Retries, hedged requests and circuit breaker state per upstream
+        geocoding: Geocoding lookups answered by each backend
+        leaderboards: Fresh and stale hits and background refreshes of the climb attempt cache
+        parsing: Pages parsed in the worker pool and on the event loop
+    """
+    return {
+        "connections": get_http_pool().stats(),
+        "schedulers": {
+            scheduler.name: scheduler.stats()
+            for scheduler in (strava_scheduler, nominatim_scheduler, leaderboard_scheduler)
+        },
+        "coalescing": {
+            flights.name: flights.stats()
+            for flights in (strava_flights, nominatim_flights, leaderboard_flights, crawl_flights)
+        },
+        "resilience": {
+            resilience.name: resilience.stats()
+            for resilience in (strava_resilience, nominatim_resilience, leaderboard_resilience)
+        },
+        "geocoding": get_geocoding_backend().stats(),
+        "leaderboards": climb_attempts_cache.stats(),
+        "parsing": get_cpu_executor().stats(),
+    }
+
+def get_metrics() -> Dict[str, Any]:
+    """Get the latency histograms and counters recorded since the server started.
+
+    Returns:
+        counters: Upstream responses and bytes, cache lookups, errors and rejections
+        histograms: Latency of tool calls, upstream requests, parses, rate limit waits
+            and event loop lag
+        cache_hit_ratios: Share of the lookups of each cache answered without a fetch
+    """
+    snapshot = metrics.snapshot()
+    lookups: Dict[str, Dict[str, float]] = {}
+    for counter in snapshot["counters"].get("cache_lookups_total", []):
+        results = lookups.setdefault(counter["labels"]["cache"], {})
+        results[counter["labels"]["result"]] = counter["value"]
+    snapshot["cache_hit_ratios"] = {
+        cache: 1 - results.get("miss", 0) / sum(results.values())
+        for cache, results in lookups.items()
+    }
+    return snapshot
+
+def register_server_tools(mcp: FastMCP):
+    @mcp.tool()
+    def get_upstream_stats_tool() -> Dict[str, Any]:
+        return get_upstream_stats()
+
+    @mcp.tool()
+    def get_metrics_tool(format: Literal["json", "prometheus"] = "json") -> Union[Dict[str, Any], str]:
+        """Get the latency histograms, cache hit ratios, bytes transferred and rate limit
+        waits recorded since the server started, as JSON or Prometheus text."""
+        if format == "prometheus":
+            return metrics.to_prometheus()
+        return get_metrics()
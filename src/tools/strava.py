@@ -1,24 +1,138 @@
+import asyncio
+import json
 import logging
-from datetime import datetime
-from typing import Dict
+import math
+import os
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp import Context, FastMCP
 
+from clients.errors import UpstreamError
+from concurrency import get_cpu_executor
+from geometry import bounding_box, simplify_polyline
 from helpers import format_segment
-from strava.api import make_strava_request
-from strava.scraper import parse_strava_leaderboard
-
-# Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+from settings import (
+    LEADERBOARD_CONCURRENCY,
+    SEGMENT_PAGE_SIZE,
+    TRACK_DIR,
+    TRACK_MATCH_MIN_OVERLAP,
+    TRACK_MATCH_WIDTH,
+)
+from strava.details import enrich_segments
+from strava.explore import (
+    explore_route,
+    explore_segments,
+    explore_uncovered,
+    harvest_segments,
 )
+from strava.index import segment_index
+from strava.refresh import climb_attempts_cache
+from strava.segments import SegmentTable
+from tools.nominatim import get_latitude_and_longitude
+from tracks.corridor import TrackCorridor
+from tracks.parsers import Track, load_track, parse_track
+
 logger = logging.getLogger(__name__)
 
-STRAVA_API_BASE = "https://www.strava.com/api/v3"
-STRAVA_URL_BASE = "https://www.strava.com/"
+# Tolerance of the outline of a track Strava is explored along, in kilometres:
+# explore tiles are hundreds of metres wide, the track's own detail is lost on them
+TRACK_OUTLINE_TOLERANCE = 0.2
+
+def render_segments(
+    table: SegmentTable,
+    rows: Sequence[int],
+    offset: int = 0,
+    limit: Optional[int] = None,
+    output: str = "text",
+    proximities: Optional[Sequence[float]] = None,
+    proximity_label: str = "km away",
+    total: Optional[int] = None,
+    attempts: Optional[Dict[int, Dict[str, Any]]] = None,
+) -> Union[str, Dict[str, Any]]:
+    """Turn one page of segment rows into the answer of a tool.
+
+    Only the rows of the page are turned into records, so large searches cost
+    their page, not their size.
+
+    Args:
+        table: The table holding the segments
+        rows: The rows of every segment found, in the order they are shown
+        offset: Number of segments skipped before the page
+        limit: Number of segments on the page, SEGMENT_PAGE_SIZE when None
+        output: "text" for formatted text, "json" for a dict of records
+        proximities: The distance of each segment to the query, in kilometres
+        proximity_label: Text following the proximity of a formatted segment
+        total: Number of segments found, when `rows` does not hold all of them
+        attempts: Climb attempt counts, or error, of the segments of the page by id
+
+    Returns:
+        The formatted page, or a dict holding the page's records, its offset
+        and the total number of segments
+    """
+    limit = SEGMENT_PAGE_SIZE if limit is None else limit
+    total = len(rows) if total is None else total
+    offset = max(offset, 0)
+    end = min(offset + max(limit, 0), len(rows))
+    page = range(offset, end)
 
-async def get_nearby_segments(southwest_latitude: float, southwest_longitude: float, northeast_latitude: float, northeast_longitude: float) -> str:
+    if output == "json":
+        segments = []
+        for index in page:
+            record = table.record(int(rows[index]))
+            if proximities is not None:
+                record["proximity_km"] = round(float(proximities[index]), 2)
+            if attempts is not None and record["id"] in attempts:
+                record["climb_attempts"] = attempts[record["id"]]
+            segments.append(record)
+        return {"total": total, "offset": offset, "segments": segments}
+
+    if not total:
+        return "No segments found."
+    if offset >= total:
+        return f"No segments past offset {offset}, {total} segments found."
+
+    def format_row(index: int) -> str:
+        record = table.record(int(rows[index]))
+        text = format_segment(record)
+        if proximities is not None:
+            text += f" - {proximities[index]:.1f} {proximity_label}"
+        if attempts is not None and record["id"] in attempts:
+            text += f" - {_format_attempts(attempts[record['id']])}"
+        return text
+
+    formatted = (format_row(index) for index in page)
+    text = "\n---\n".join(formatted)
+    if offset or end < total:
+        text += f"\n---\nShowing segments {offset + 1} to {end} of {total}"
+        text += f", pass offset={end} for more." if end < total else "."
+    return text
+
+def _format_attempts(attempts: Dict[str, Any]) -> str:
+    if "error" in attempts:
+        return "Climb attempts unavailable"
+    return f"Climb attempts: {attempts['last_month_climbs_attempts']} last month, {attempts['beginning_of_the_year_climbs_attempts']} this year"
+
+async def get_nearby_segments(
+    southwest_latitude: float,
+    southwest_longitude: float,
+    northeast_latitude: float,
+    northeast_longitude: float,
+    exhaustive: bool = False,
+    offset: int = 0,
+    limit: Optional[int] = None,
+    output: str = "text",
+) -> Union[str, Dict[str, Any]]:
     """Get nearby segments for a location.
 
     Args:
@@ -26,28 +140,317 @@ async def get_nearby_segments(southwest_latitude: float, southwest_longitude: fl
         southwest_longitude: Longitude of the southwest corner of the bounding box
         northeast_latitude: Latitude of the northeast corner of the bounding box
         northeast_longitude: Longitude of the northeast corner of the bounding box
+        exhaustive: Split the box until every segment is found, within a request
+            budget, instead of keeping the 10 Strava returns per tile
+        offset: Number of segments to skip, to page through large areas
+        limit: Maximum number of segments, SEGMENT_PAGE_SIZE when None
+        output: "text" for formatted text, "json" for structured records
 
     Returns:
-        A formatted string containing segment details
+        A formatted string containing segment details, or with output="json" a
+        dict of the segment records, their offset and total
     """
     logger.debug(f"Fetching nearby segments for coordinates: southwest_latitude={southwest_latitude}, southwest_longitude={southwest_longitude}, northeast_latitude={northeast_latitude}, northeast_longitude={northeast_longitude}")
-    url = f"{STRAVA_API_BASE}/segments/explore?bounds={southwest_latitude},{southwest_longitude},{northeast_latitude},{northeast_longitude}&activity_type=riding"
-    data = await make_strava_request(url)
-    logger.debug(f"Received response from Strava API: {data}")
+    harvest = None
+    try:
+        if exhaustive:
+            harvest = await harvest_segments(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+            data = harvest.segments if harvest.segments or harvest.complete else None
+        else:
+            data = await explore_segments(southwest_latitude, southwest_longitude, northeast_latitude, northeast_longitude)
+    except UpstreamError as e:
+        logger.warning(f"Unable to fetch segments: {e}")
+        if output == "json":
+            return {"error": f"Unable to fetch segments: {e}"}
+        return f"Unable to fetch segments: {e}"
 
-    if not data or "segments" not in data:
+    if data is None:
         logger.warning("No data or segments found in Strava API response")
+        if output == "json":
+            return {"error": "Unable to fetch segments or no segments found."}
         return "Unable to fetch segments or no segments found."
 
-    if not data["segments"]:
-        logger.info("No segments found in the response")
-        return "No segments found."
+    table = SegmentTable.from_segments(data)
+    logger.debug(f"Found {len(table)} segments")
+    result = render_segments(table, range(len(table)), offset, limit, output)
+    if harvest is not None and not harvest.complete:
+        note = f"Search stopped after {harvest.requests} requests, more segments may exist in this area."
+        if isinstance(result, dict):
+            result["note"] = note
+        else:
+            result += f"\n---\n{note}"
+    return result
+
+def _length_filters(min_grade: Optional[float], max_grade: Optional[float], min_length: Optional[float], max_length: Optional[float]) -> Dict[str, Optional[float]]:
+    """Convert the filters of the segment tools to those of the index, which measures lengths in metres."""
+    return {
+        "min_grade": min_grade,
+        "max_grade": max_grade,
+        "min_distance": min_length * 1000 if min_length is not None else None,
+        "max_distance": max_length * 1000 if max_length is not None else None,
+    }
+
+async def find_segments_near(
+    latitude: float,
+    longitude: float,
+    radius: float = 5,
+    limit: int = 10,
+    min_grade: Optional[float] = None,
+    max_grade: Optional[float] = None,
+    min_length: Optional[float] = None,
+    max_length: Optional[float] = None,
+    offset: int = 0,
+    output: str = "text",
+) -> Union[str, Dict[str, Any]]:
+    """Find the segments starting closest to a location, such as a take-off.
+
+    Strava is only asked for the parts of the area the segment index has not
+    explored yet.
+
+    Args:
+        latitude: Latitude of the location
+        longitude: Longitude of the location
+        radius: Search radius, in kilometres
+        limit: Maximum number of segments
+        min_grade: Minimum average gradient, in percent
+        max_grade: Maximum average gradient, in percent
+        min_length: Minimum segment length, in kilometres
+        max_length: Maximum segment length, in kilometres
+        offset: Number of closest segments to skip, to page through the results
+        output: "text" for formatted text, "json" for structured records
+
+    Returns:
+        A formatted string containing segment details, closest first, or with
+        output="json" a dict of the segment records and their offset
+    """
+    rows, distances = await _segments_near(latitude, longitude, radius, _length_filters(min_grade, max_grade, min_length, max_length))
+    return render_segments(segment_index.table, rows, offset, limit, output, distances, "km away")
+
+async def _segments_near(latitude: float, longitude: float, radius: float, filters: Dict[str, Optional[float]]) -> Tuple[Sequence[int], Sequence[float]]:
+    """Explore the parts of an area the segment index has not covered yet, then
+    get the rows and distances of the indexed segments within it, closest first."""
+    logger.debug(f"Finding segments within {radius} km of {latitude}, {longitude}")
+    try:
+        await explore_uncovered(*bounding_box(latitude, longitude, radius))
+    except UpstreamError as e:
+        logger.warning(f"Unable to explore segments, answering from the index: {e}")
+    return segment_index.within(latitude, longitude, radius, **filters)
+
+async def find_segments_near_address(
+    address: str,
+    radius: float = 5,
+    limit: int = 10,
+    min_grade: Optional[float] = None,
+    max_grade: Optional[float] = None,
+    min_length: Optional[float] = None,
+    max_length: Optional[float] = None,
+    include_attempts: bool = False,
+    offset: int = 0,
+    output: str = "text",
+) -> Union[str, Dict[str, Any]]:
+    """Find the segments starting closest to an address, in one call.
+
+    Runs the geocoding, the exploration of the area and the ranking on the
+    server, instead of chaining the location and segment tools.
+
+    Args:
+        address: The address, village or summit to search around
+        radius: Search radius, in kilometres
+        limit: Maximum number of segments
+        min_grade: Minimum average gradient, in percent
+        max_grade: Maximum average gradient, in percent
+        min_length: Minimum segment length, in kilometres
+        max_length: Maximum segment length, in kilometres
+        include_attempts: Add this year's climb attempts of each segment of the
+            page, fetched concurrently
+        offset: Number of closest segments to skip, to page through the results
+        output: "text" for formatted text, "json" for structured records
+
+    Returns:
+        A formatted string containing segment details, closest first, or with
+        output="json" a dict of the location, the segment records and their offset
+    """
+    try:
+        latitude, longitude = await get_latitude_and_longitude(address)
+    except (ValueError, UpstreamError) as e:
+        logger.warning(str(e))
+        return {"error": str(e)} if output == "json" else str(e)
+
+    rows, distances = await _segments_near(latitude, longitude, radius, _length_filters(min_grade, max_grade, min_length, max_length))
+    table = segment_index.table
+    attempts = None
+    if include_attempts:
+        page = rows[max(offset, 0):max(offset, 0) + max(limit, 0)]
+        results = await get_number_of_climb_attempts_for_segments(table["id"][page].tolist())
+        attempts = {result["segment_id"]: {key: value for key, value in result.items() if key != "segment_id"} for result in results}
+
+    result = render_segments(table, rows, offset, limit, output, distances, "km away", attempts=attempts)
+    if isinstance(result, dict):
+        return {"location": {"address": address, "latitude": latitude, "longitude": longitude}, **result}
+    return f"Segments within {radius:g} km of {address} ({latitude:.5f}, {longitude:.5f}):\n{result}"
+
+async def find_segments_along_route(
+    route: List[Tuple[float, float]],
+    width: float = 1,
+    limit: int = 20,
+    min_grade: Optional[float] = None,
+    max_grade: Optional[float] = None,
+    min_length: Optional[float] = None,
+    max_length: Optional[float] = None,
+    offset: int = 0,
+    output: str = "text",
+) -> Union[str, Dict[str, Any]]:
+    """Find the segments lying along a route, such as a ridge.
+
+    Strava is only asked for the parts of the corridor the segment index has
+    not explored yet.
+
+    Args:
+        route: The (latitude, longitude) points of the route
+        width: Largest distance from the route to both ends of a segment, in kilometres
+        limit: Maximum number of segments
+        min_grade: Minimum average gradient, in percent
+        max_grade: Maximum average gradient, in percent
+        min_length: Minimum segment length, in kilometres
+        max_length: Maximum segment length, in kilometres
+        offset: Number of closest segments to skip, to page through the results
+        output: "text" for formatted text, "json" for structured records
 
-    segments = [format_segment(segment) for segment in data["segments"]]
-    logger.debug(f"Formatted {len(segments)} segments")
-    return "\n---\n".join(segments)
+    Returns:
+        A formatted string containing segment details, closest to the route
+        first, or with output="json" a dict of the segment records and their offset
+    """
+    if not route:
+        return render_segments(segment_index.table, [], offset, limit, output)
+    latitudes = [latitude for latitude, _ in route]
+    longitudes = [longitude for _, longitude in route]
+    logger.debug(f"Finding segments within {width} km of a route of {len(route)} points")
+    try:
+        await explore_route(latitudes, longitudes, width)
+    except UpstreamError as e:
+        logger.warning(f"Unable to explore segments, answering from the index: {e}")
+
+    rows, distances = segment_index.along(latitudes, longitudes, width, **_length_filters(min_grade, max_grade, min_length, max_length))
+    return render_segments(segment_index.table, rows, offset, limit, output, distances, "km from the route")
 
-async def get_number_of_climb_attempts_on_the_year(segment_id: int) -> Dict[str, int]:
+def _track_file(path: str) -> Optional[str]:
+    """Resolve the path of a track file within TRACK_DIR.
+
+    Returns:
+        The path, None when TRACK_DIR is not set or the path resolves outside of it
+    """
+    if not TRACK_DIR:
+        return None
+    root = os.path.realpath(TRACK_DIR)
+    try:
+        resolved = os.path.realpath(os.path.join(root, path))
+    except ValueError:
+        # Such as paths holding a null byte
+        return None
+    if os.path.commonpath([root, resolved]) != root:
+        return None
+    return resolved
+
+async def _read_track(file: Optional[str], content: Optional[str], format: Optional[str]) -> Track:
+    """Read and simplify a track off the event loop, streamed from its file when given one."""
+    executor = get_cpu_executor()
+    if file is not None:
+        return await executor.run_file(load_track, file, format)
+    return await executor.run(parse_track, content.encode("utf-8"), format)
+
+async def find_segments_on_track(
+    content: Optional[str] = None,
+    path: Optional[str] = None,
+    format: Optional[str] = None,
+    width: float = TRACK_MATCH_WIDTH,
+    min_overlap: float = TRACK_MATCH_MIN_OVERLAP,
+    limit: int = 20,
+    min_grade: Optional[float] = None,
+    max_grade: Optional[float] = None,
+    min_length: Optional[float] = None,
+    max_length: Optional[float] = None,
+    offset: int = 0,
+    output: str = "text",
+) -> Union[str, Dict[str, Any]]:
+    """Find the segments a GPX or IGC track rode or climbed, in the order it did.
+
+    The track is streamed and simplified as it is read, off the event loop.
+    Strava is only asked for the parts of its corridor the segment index has
+    not explored yet, along a coarser outline of it. Segments are then matched
+    against the grid cells the track passes through, so multi-hour tracks cost
+    their length rather than their length times the number of segments.
+
+    Args:
+        content: Content of the track file
+        path: Path of the track file relative to TRACK_DIR, only read when it is set.
+            Errors reading it are not detailed, so as not to tell clients about the
+            server's files
+        format: "gpx" or "igc", guessed from the extension or content when None
+        width: Largest distance from the track to a segment's points, in kilometres
+        min_overlap: Share of a segment's points that must lie along the track
+        limit: Maximum number of segments
+        min_grade: Minimum average gradient, in percent
+        max_grade: Maximum average gradient, in percent
+        min_length: Minimum segment length, in kilometres
+        max_length: Maximum segment length, in kilometres
+        offset: Number of segments to skip, to page through the results
+        output: "text" for formatted text, "json" for structured records
+
+    Returns:
+        A formatted string containing segment details, in the order the track
+        rode them, or with output="json" a dict of the track's summary, the
+        segment records and their offset
+    """
+    if (path is None) == (content is None):
+        message = "Pass either the content of a track file or its path."
+        return {"error": message} if output == "json" else message
+    file = None
+    if path is not None:
+        if not TRACK_DIR:
+            message = "Track files cannot be read by path on this server, pass their content."
+            return {"error": message} if output == "json" else message
+        file = _track_file(path)
+        if file is None:
+            logger.warning(f"Refused to read a track outside of {TRACK_DIR}: {path}")
+            message = "Unable to read the track file."
+            return {"error": message} if output == "json" else message
+    try:
+        track = await _read_track(file, content, format)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to read the track: {e}")
+        message = "Unable to read the track file." if file is not None else f"Unable to read the track: {e}"
+        return {"error": message} if output == "json" else message
+    if not len(track):
+        message = "The track holds no fixes."
+        return {"error": message} if output == "json" else message
+
+    logger.debug(f"Finding segments on a track of {track.fixes} fixes, {len(track)} once simplified")
+    outline = simplify_polyline(track.latitudes, track.longitudes, TRACK_OUTLINE_TOLERANCE)
+    try:
+        await explore_route(track.latitudes[outline], track.longitudes[outline], width + TRACK_OUTLINE_TOLERANCE)
+    except UpstreamError as e:
+        logger.warning(f"Unable to explore segments, answering from the index: {e}")
+
+    corridor = TrackCorridor(track.latitudes, track.longitudes, width)
+    rows, distances, overlaps = segment_index.on_track(corridor, min_overlap, **_length_filters(min_grade, max_grade, min_length, max_length))
+    result = render_segments(segment_index.table, rows, offset, limit, output, distances, "km into the track")
+    summary = track.summary()
+    if isinstance(result, dict):
+        for index, record in enumerate(result["segments"], start=result["offset"]):
+            record["overlap"] = None if math.isnan(overlaps[index]) else round(float(overlaps[index]), 2)
+        return {"track": summary, **result}
+    name = f"{summary['name']}, " if summary["name"] else ""
+    return f"Segments ridden along the track ({name}{summary['fixes']} fixes, {summary['length_km']:.1f} km):\n{result}"
+
+async def fetch_climb_attempts(segment_id: int) -> Dict[str, Any]:
+    """Count the climb attempts of a segment, from the cache while its leaderboard is refreshed.
+
+    Raises:
+        UpstreamError: The leaderboard could not be crawled and nothing is stored yet
+    """
+    return await climb_attempts_cache.get(segment_id)
+
+async def get_number_of_climb_attempts_on_the_year(segment_id: int) -> Dict[str, Any]:
     """Get the number of climb attempts on the year for a given segment.
 
     Args:
@@ -56,36 +459,178 @@ async def get_number_of_climb_attempts_on_the_year(segment_id: int) -> Dict[str,
     Returns:
         last_month_climbs_attempts: The number of climb attempts last month
         beginning_of_the_year_climbs_attempts: The number of climb attempts beginning of the year
+        monthly_climbs_attempts: The number of climb attempts of each month of the year so far
+        error: Why the leaderboard could not be read, the counts are then 0
     """
-    last_month_climbs_attempts = 0
-    beginning_of_the_year_climbs_attempts = 0
+    try:
+        attempts = await fetch_climb_attempts(segment_id)
+    except UpstreamError as e:
+        logger.warning(str(e))
+        return {
+            'last_month_climbs_attempts': 0,
+            'beginning_of_the_year_climbs_attempts': 0,
+            'monthly_climbs_attempts': {},
+            'error': str(e),
+        }
+
+    logger.debug(f"Climb attempts of segment {segment_id}: {attempts['last_month_climbs_attempts']} last month, {attempts['beginning_of_the_year_climbs_attempts']} since the beginning of the year")
+    return attempts
 
-    result = await parse_strava_leaderboard(f"{STRAVA_URL_BASE}/segments/{segment_id}")
+async def get_number_of_climb_attempts_for_segments(
+    segment_ids: List[int],
+    on_result: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+) -> List[Dict[str, Any]]:
+    """Get the number of climb attempts on the year for several segments concurrently.
 
-    # Get this year's leaderboard 
-    if not result.empty:
-        print("\nFetching this year's leaderboard...")   
-        print("\nThis Year's Leaderboard Data:")
-        print(result)
+    Args:
+        segment_ids: The IDs of the segments
+        on_result: Called with the result of each segment as soon as it is known
 
-        now = datetime.now()
-        
-        last_month_climbs_attempts = len(result[result['date'].str.contains(now.strftime('%b'))])
-        beginning_of_the_year_climbs_attempts = len(result[result['date'].str.contains(now.strftime('%Y'))])
+    Returns:
+        One result per distinct segment, in input order, holding the segment_id and
+        either its climb attempt counts or an error
+    """
+    semaphore = asyncio.Semaphore(LEADERBOARD_CONCURRENCY)
 
-        print(f"Number of climbs attempts last month: {last_month_climbs_attempts}")
-        print(f"Number of climbs attempts beginning of the year: {beginning_of_the_year_climbs_attempts}")
+    async def attempts_of(segment_id: int) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return {'segment_id': segment_id, **await fetch_climb_attempts(segment_id)}
+            except (UpstreamError, ValueError) as e:
+                # Programming errors are not the segment's, they fail the call
+                return {'segment_id': segment_id, 'error': str(e)}
 
-    return {
-        'last_month_climbs_attempts': last_month_climbs_attempts,
-        'beginning_of_the_year_climbs_attempts': beginning_of_the_year_climbs_attempts
-    }
+    unique_ids = list(dict.fromkeys(segment_ids))
+    results = {}
+    for future in asyncio.as_completed([attempts_of(segment_id) for segment_id in unique_ids]):
+        result = await future
+        results[result['segment_id']] = result
+        if on_result is not None:
+            await on_result(result)
+    return [results[segment_id] for segment_id in unique_ids]
 
 def register_segment_tools(mcp: FastMCP):
     @mcp.tool()
-    async def get_nearby_segments_tool(southwest_lat: float, southwest_lon: float, northeast_lat: float, northeast_lon: float) -> str:
-        return await get_nearby_segments(southwest_lat, southwest_lon, northeast_lat, northeast_lon)
+    async def get_nearby_segments_tool(
+        southwest_lat: float,
+        southwest_lon: float,
+        northeast_lat: float,
+        northeast_lon: float,
+        exhaustive: bool = False,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        output: Literal["text", "json"] = "text",
+    ) -> Union[str, Dict[str, Any]]:
+        """Get the segments of a bounding box. Strava returns at most 10 segments per
+        area; set `exhaustive` to split the box until every segment is found. Results
+        come in pages, use `offset` for the next one and output="json" for records."""
+        return await get_nearby_segments(southwest_lat, southwest_lon, northeast_lat, northeast_lon, exhaustive, offset, limit, output)
+
+    @mcp.tool()
+    async def find_segments_near_tool(
+        latitude: float,
+        longitude: float,
+        radius: float = 5,
+        limit: int = 10,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_length: Optional[float] = None,
+        max_length: Optional[float] = None,
+        offset: int = 0,
+        output: Literal["text", "json"] = "text",
+    ) -> Union[str, Dict[str, Any]]:
+        """Find the segments starting within `radius` km of a location, closest first,
+        optionally filtered by average gradient (%) and length (km). Use `offset` for
+        the next page and output="json" for records."""
+        return await find_segments_near(latitude, longitude, radius, limit, min_grade, max_grade, min_length, max_length, offset, output)
+
+    @mcp.tool()
+    async def find_segments_near_address_tool(
+        address: str,
+        radius: float = 5,
+        limit: int = 10,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_length: Optional[float] = None,
+        max_length: Optional[float] = None,
+        include_attempts: bool = False,
+        offset: int = 0,
+        output: Literal["text", "json"] = "text",
+    ) -> Union[str, Dict[str, Any]]:
+        """Find the segments starting within `radius` km of an address, closest first, in
+        one call: the address is geocoded and the area searched on the server. Filter by
+        average gradient (%) and length (km), and set `include_attempts` to add this
+        year's climb attempts of each segment. Use `offset` for the next page."""
+        return await find_segments_near_address(address, radius, limit, min_grade, max_grade, min_length, max_length, include_attempts, offset, output)
+
+    @mcp.tool()
+    async def find_segments_along_route_tool(
+        route: List[Tuple[float, float]],
+        width: float = 1,
+        limit: int = 20,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_length: Optional[float] = None,
+        max_length: Optional[float] = None,
+        offset: int = 0,
+        output: Literal["text", "json"] = "text",
+    ) -> Union[str, Dict[str, Any]]:
+        """Find the segments lying within `width` km of a route given as (latitude, longitude)
+        points, optionally filtered by average gradient (%) and length (km). Use `offset`
+        for the next page and output="json" for records."""
+        return await find_segments_along_route(route, width, limit, min_grade, max_grade, min_length, max_length, offset, output)
 
     @mcp.tool()
-    async def get_number_of_climb_attempts_on_the_year_tool(segment_id: int) -> Dict[str, int]:
-        return await get_number_of_climb_attempts_on_the_year(segment_id) 
\ No newline at end of file
+    async def find_segments_on_track_tool(
+        content: Optional[str] = None,
+        path: Optional[str] = None,
+        format: Optional[Literal["gpx", "igc"]] = None,
+        width: float = TRACK_MATCH_WIDTH,
+        min_overlap: float = TRACK_MATCH_MIN_OVERLAP,
+        limit: int = 20,
+        min_grade: Optional[float] = None,
+        max_grade: Optional[float] = None,
+        min_length: Optional[float] = None,
+        max_length: Optional[float] = None,
+        offset: int = 0,
+        output: Literal["text", "json"] = "text",
+    ) -> Union[str, Dict[str, Any]]:
+        """Find the segments a GPX hike or IGC flight track rode or climbed, in order. Pass the
+        `content` of a track file, or its `path` in the server's track directory. A segment matches when
+        `min_overlap` of its points lie within `width` km of the track. Use `offset` for the
+        next page and output="json" for records."""
+        return await find_segments_on_track(content, path, format, width, min_overlap, limit, min_grade, max_grade, min_length, max_length, offset, output)
+
+    @mcp.tool()
+    async def get_number_of_climb_attempts_on_the_year_tool(segment_id: int) -> Dict[str, Any]:
+        return await get_number_of_climb_attempts_on_the_year(segment_id)
+
+    @mcp.tool()
+    async def get_number_of_climb_attempts_for_segments_tool(segment_ids: List[int], ctx: Context) -> List[Dict[str, Any]]:
+        """Get this year's climb attempts of several segments at once. Each segment's
+        result is also sent as a log message as soon as it is known."""
+        done = 0
+
+        async def report(result: Dict[str, Any]) -> None:
+            nonlocal done
+            done += 1
+            await ctx.info(json.dumps(result))
+            await ctx.report_progress(done, len(set(segment_ids)))
+
+        return await get_number_of_climb_attempts_for_segments(segment_ids, on_result=report)
+
+    @mcp.tool()
+    async def get_segment_details_tool(segment_ids: List[int], ctx: Context, include_points: bool = False) -> List[Dict[str, Any]]:
+        """Get the details of segments: elevation gain, highest and lowest points, maximum
+        gradient, climb category and number of points of their polyline, with the
+        points themselves when `include_points` is set. Each segment's result is also
+        sent as a log message as soon as it is known."""
+        done = 0
+
+        async def report(result: Dict[str, Any]) -> None:
+            nonlocal done
+            done += 1
+            await ctx.info(json.dumps({key: value for key, value in result.items() if key != "points"}))
+            await ctx.report_progress(done, len(set(segment_ids)))
+
+        return await enrich_segments(segment_ids, on_result=report, include_points=include_points)
@@ -0,0 +1,118 @@
+from typing import TYPE_CHECKING, Tuple
+
+from geometry import EARTH_RADIUS_KM, route_bounding_box
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Side of the cells relative to the width of the corridor. A point within the
+# width of the track is at most this far from a sample of it, so it always
+# lies in a sample's cell or one of its neighbours
+CELL_WIDTHS = 1.25
+
+
+class TrackCorridor:
+    """The grid cells a track passes through, and how far along it each is visited.
+
+    The track is projected onto a plane tangent at its first point and sampled
+    every half `width`. The square cells holding a sample, and their eight
+    neighbours, make up the corridor: every point within `width` of the track
+    lies in it, and none more than about four widths away. Each cell remembers
+    the first and last distance along the track it is visited at, so the
+    order a track passes points in can be told.
+
+    Building the corridor is a sort of samples as many as the track is long,
+    and looking points up a binary search among its cells, so matching many
+    points against a long track never measures every point against every leg.
+    """
+
+    def __init__(self, latitudes: "np.ndarray", longitudes: "np.ndarray", width: float) -> None:
+        """Rasterise a track.
+
+        Args:
+            latitudes: Latitudes of the track's points, at least one
+            longitudes: Longitudes of the track's points
+            width: Distance from the track points must be within, in kilometres
+        """
+        import numpy as np
+
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        self.width = width
+        self.cell = CELL_WIDTHS * width
+        self.origin = (float(latitudes[0]), float(longitudes[0]))
+        # Wide enough for every cell of the corridor
+        self.bounds = route_bounding_box(latitudes, longitudes, 4 * width)
+
+        x, y = self._project(latitudes, longitudes)
+        dx, dy = np.diff(x), np.diff(y)
+        legs = np.hypot(dx, dy)
+        along = np.concatenate(([0.0], np.cumsum(legs)))
+        self.length = float(along[-1])
+
+        steps = np.maximum(np.ceil(legs / (width / 2)), 1).astype(np.int64)
+        leg = np.repeat(np.arange(len(legs)), steps)
+        fractions = (np.arange(len(leg)) - np.repeat(np.cumsum(steps) - steps, steps)) / steps[leg]
+        sample_x = np.append(x[:-1][leg] + fractions * dx[leg], x[-1])
+        sample_y = np.append(y[:-1][leg] + fractions * dy[leg], y[-1])
+        sample_along = np.append(along[:-1][leg] + fractions * legs[leg], along[-1])
+
+        columns, rows = self._cells(sample_x, sample_y)
+        offsets = np.arange(-1, 2)
+        keys = self._key(
+            (columns[:, None, None] + offsets[None, :, None]),
+            (rows[:, None, None] + offsets[None, None, :]),
+        ).ravel()
+        visits = np.repeat(sample_along, 9)
+        order = np.argsort(keys, kind="stable")
+        keys, visits = keys[order], visits[order]
+        self._keys, starts = np.unique(keys, return_index=True)
+        self._first = np.minimum.reduceat(visits, starts)
+        self._last = np.maximum.reduceat(visits, starts)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _project(self, latitudes: "np.ndarray", longitudes: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        import numpy as np
+
+        origin_latitude, origin_longitude = self.origin
+        dlon = (np.asarray(longitudes, dtype=float) - origin_longitude + 180.0) % 360.0 - 180.0
+        x = np.radians(dlon) * np.cos(np.radians(origin_latitude)) * EARTH_RADIUS_KM
+        y = np.radians(np.asarray(latitudes, dtype=float) - origin_latitude) * EARTH_RADIUS_KM
+        return x, y
+
+    def _cells(self, x: "np.ndarray", y: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        import numpy as np
+
+        return np.floor(x / self.cell).astype(np.int64), np.floor(y / self.cell).astype(np.int64)
+
+    @staticmethod
+    def _key(columns: "np.ndarray", rows: "np.ndarray") -> "np.ndarray":
+        return rows * (1 << 32) + columns
+
+    def _lookup(self, latitudes: "np.ndarray", longitudes: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+        """The index of the cell of each point, and whether the cell is in the corridor."""
+        import numpy as np
+
+        keys = self._key(*self._cells(*self._project(latitudes, longitudes)))
+        index = np.minimum(np.searchsorted(self._keys, keys), len(self._keys) - 1)
+        return index, self._keys[index] == keys
+
+    def contains(self, latitudes: "np.ndarray", longitudes: "np.ndarray") -> "np.ndarray":
+        """Mask of the points in the corridor."""
+        return self._lookup(latitudes, longitudes)[1]
+
+    def first_visits(self, latitudes: "np.ndarray", longitudes: "np.ndarray") -> "np.ndarray":
+        """Distance along the track it first passes each point at, in kilometres, NaN for points outside the corridor."""
+        import numpy as np
+
+        index, inside = self._lookup(latitudes, longitudes)
+        return np.where(inside, self._first[index], np.nan)
+
+    def last_visits(self, latitudes: "np.ndarray", longitudes: "np.ndarray") -> "np.ndarray":
+        """Distance along the track it last passes each point at, in kilometres, NaN for points outside the corridor."""
+        import numpy as np
+
+        index, inside = self._lookup(latitudes, longitudes)
+        return np.where(inside, self._last[index], np.nan)
@@ -0,0 +1,252 @@
+import io
+import math
+from array import array
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Optional
+from xml.etree import ElementTree
+
+from geometry import EARTH_RADIUS_KM, haversine_distances, simplify_polyline
+from settings import TRACK_MIN_SPACING, TRACK_SIMPLIFY_TOLERANCE
+
+if TYPE_CHECKING:
+    import numpy as np
+
+TRACK_FORMATS = ("gpx", "igc")
+
+# Fixes simplified at once while a track is read, which bounds the memory a
+# track holds before simplification and the worst case of Douglas-Peucker
+CHUNK_FIXES = 4096
+
+KM_PER_DEGREE = math.pi / 180 * EARTH_RADIUS_KM
+
+
+class Track:
+    """A track read from a GPX or IGC file, simplified.
+
+    Attributes:
+        name: The name the file gives the track, if any
+        latitudes: Latitudes of the points kept, float64 degrees
+        longitudes: Longitudes of the points kept, float64 degrees
+        elevations: Elevations of the points kept, float32 metres, NaN where the file has none
+        fixes: Number of fixes the file holds
+    """
+
+    __slots__ = ("name", "latitudes", "longitudes", "elevations", "fixes")
+
+    def __init__(self, name: Optional[str], latitudes: "np.ndarray", longitudes: "np.ndarray", elevations: "np.ndarray", fixes: int) -> None:
+        self.name = name
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.elevations = elevations
+        self.fixes = fixes
+
+    def __len__(self) -> int:
+        return len(self.latitudes)
+
+    @property
+    def length(self) -> float:
+        """Length of the track, in kilometres."""
+        if len(self) < 2:
+            return 0.0
+        return float(haversine_distances(self.latitudes[:-1], self.longitudes[:-1], self.latitudes[1:], self.longitudes[1:]).sum())
+
+    def summary(self) -> Dict[str, Any]:
+        import numpy as np
+
+        known = self.elevations[~np.isnan(self.elevations)]
+        return {
+            "name": self.name,
+            "fixes": self.fixes,
+            "points": len(self),
+            "length_km": round(self.length, 2),
+            "min_elevation": round(float(known.min()), 1) if len(known) else None,
+            "max_elevation": round(float(known.max()), 1) if len(known) else None,
+        }
+
+
+class _TrackBuilder:
+    """Simplify fixes as they are read.
+
+    Fixes closer than `min_spacing` to the last one kept are dropped at once,
+    such as those logged while standing at a take-off. The others are buffered
+    and simplified a chunk at a time, the last point of a chunk starting the
+    next one, so only a chunk of raw fixes is ever held.
+    """
+
+    def __init__(self, min_spacing: float, tolerance: float) -> None:
+        self.min_spacing = min_spacing
+        self.tolerance = tolerance
+        self.fixes = 0
+        self._chunk = (array("d"), array("d"), array("f"))
+        self._kept = (array("d"), array("d"), array("f"))
+        self._skipped: Optional[tuple] = None
+        self._km_per_longitude = 0.0
+
+    def add(self, latitude: float, longitude: float, elevation: float) -> None:
+        self.fixes += 1
+        latitudes, longitudes, elevations = self._chunk
+        if latitudes:
+            dy = (latitude - latitudes[-1]) * KM_PER_DEGREE
+            dx = (longitude - longitudes[-1]) * self._km_per_longitude
+            if dx * dx + dy * dy < self.min_spacing ** 2:
+                self._skipped = (latitude, longitude, elevation)
+                return
+        else:
+            self._km_per_longitude = KM_PER_DEGREE * math.cos(math.radians(latitude))
+        self._skipped = None
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        elevations.append(elevation)
+        if len(latitudes) >= CHUNK_FIXES:
+            self._flush(last=False)
+
+    def _flush(self, last: bool) -> None:
+        import numpy as np
+
+        latitudes, longitudes, elevations = self._chunk
+        kept = simplify_polyline(np.frombuffer(latitudes, dtype=np.float64), np.frombuffer(longitudes, dtype=np.float64), self.tolerance)
+        if not last:
+            kept = kept[:-1]
+        for source, target, dtype in zip(self._chunk, self._kept, (np.float64, np.float64, np.float32)):
+            target.frombytes(np.frombuffer(source, dtype=dtype)[kept].tobytes())
+            del source[:-1]
+
+    def build(self, name: Optional[str]) -> Track:
+        import numpy as np
+
+        if self._skipped is not None:
+            # The track ends where it ends, however close to the previous fix
+            for column, value in zip(self._chunk, self._skipped):
+                column.append(value)
+        if self._chunk[0]:
+            self._flush(last=True)
+        latitudes, longitudes, elevations = self._kept
+        return Track(
+            name,
+            np.frombuffer(latitudes, dtype=np.float64),
+            np.frombuffer(longitudes, dtype=np.float64),
+            np.frombuffer(elevations, dtype=np.float32),
+            self.fixes,
+        )
+
+
+def _local_name(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def read_gpx(file: BinaryIO, min_spacing: float = TRACK_MIN_SPACING, tolerance: float = TRACK_SIMPLIFY_TOLERANCE) -> Track:
+    """Read the track and route points of a GPX file, in file order.
+
+    The file is parsed incrementally and each point removed from the tree once
+    read, so memory does not grow with the size of the file.
+
+    Raises:
+        ValueError: The file is not valid GPX
+    """
+    builder = _TrackBuilder(min_spacing, tolerance)
+    name = None
+    parents = []
+    try:
+        for event, element in ElementTree.iterparse(file, events=("start", "end")):
+            if event == "start":
+                parents.append(element)
+                continue
+            parents.pop()
+            tag = _local_name(element.tag)
+            if tag in ("trkpt", "rtept"):
+                elevation = element.findtext("{*}ele")
+                builder.add(float(element.attrib["lat"]), float(element.attrib["lon"]), float(elevation) if elevation else math.nan)
+                parents[-1].remove(element)
+            elif tag == "name" and name is None and parents and _local_name(parents[-1].tag) in ("trk", "rte"):
+                name = (element.text or "").strip() or None
+    except ElementTree.ParseError as e:
+        raise ValueError(f"Malformed GPX: {e}") from e
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Malformed GPX point: {e}") from e
+    return builder.build(name)
+
+
+def read_igc(file: BinaryIO, min_spacing: float = TRACK_MIN_SPACING, tolerance: float = TRACK_SIMPLIFY_TOLERANCE) -> Track:
+    """Read the fixes of an IGC flight log, one B record at a time.
+
+    B records hold the time, the position in degrees and thousandths of
+    minutes, a validity flag, then the pressure and GNSS altitudes in metres.
+    The GNSS altitude is used, the pressure one when the former is missing.
+
+    Raises:
+        ValueError: A B record is malformed
+    """
+    builder = _TrackBuilder(min_spacing, tolerance)
+    for number, line in enumerate(file, start=1):
+        if not line.startswith(b"B"):
+            continue
+        try:
+            latitude = int(line[7:9]) + int(line[9:14]) / 60000
+            longitude = int(line[15:18]) + int(line[18:23]) / 60000
+            pressure_altitude, gnss_altitude = int(line[25:30]), int(line[30:35])
+        except ValueError as e:
+            raise ValueError(f"Malformed IGC B record on line {number}") from e
+        if line[14:15] == b"S":
+            latitude = -latitude
+        if line[23:24] == b"W":
+            longitude = -longitude
+        builder.add(latitude, longitude, float(gnss_altitude or pressure_altitude))
+    return builder.build(None)
+
+
+def detect_format(head: bytes, path: Optional[str] = None) -> str:
+    """Tell a GPX file from an IGC one, by extension then by content.
+
+    Raises:
+        ValueError: The format is neither
+    """
+    extension = (path or "").rpartition(".")[2].lower()
+    if extension in TRACK_FORMATS:
+        return extension
+    head = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if head.startswith(b"<"):
+        return "gpx"
+    if head.startswith(b"A") or head.startswith(b"B"):
+        return "igc"
+    raise ValueError("Unknown track format, expected GPX or IGC")
+
+
+def read_track(file: BinaryIO, format: str, min_spacing: float = TRACK_MIN_SPACING, tolerance: float = TRACK_SIMPLIFY_TOLERANCE) -> Track:
+    """Read and simplify a track.
+
+    Args:
+        file: The file, opened in binary mode
+        format: "gpx" or "igc"
+        min_spacing: Distance under which a fix following the last one kept is dropped, in kilometres
+        tolerance: Largest distance from a dropped fix to the simplified track, in kilometres
+
+    Raises:
+        ValueError: The format is unknown or the file malformed
+    """
+    if format == "gpx":
+        return read_gpx(file, min_spacing, tolerance)
+    if format == "igc":
+        return read_igc(file, min_spacing, tolerance)
+    raise ValueError(f"Unknown track format {format!r}, expected one of {', '.join(TRACK_FORMATS)}")
+
+
+def load_track(path: str, format: Optional[str] = None, min_spacing: float = TRACK_MIN_SPACING, tolerance: float = TRACK_SIMPLIFY_TOLERANCE) -> Track:
+    """Read and simplify a track file, streamed from the disk.
+
+    Raises:
+        OSError: The file cannot be read
+        ValueError: The format is unknown or the file malformed
+    """
+    with open(path, "rb") as file:
+        if format is None:
+            format = detect_format(file.read(64), path)
+            file.seek(0)
+        return read_track(file, format, min_spacing, tolerance)
+
+
+def parse_track(content: bytes, format: Optional[str] = None, min_spacing: float = TRACK_MIN_SPACING, tolerance: float = TRACK_SIMPLIFY_TOLERANCE) -> Track:
+    """Read and simplify a track passed as content rather than as a file.
+
+    Raises:
+        ValueError: The format is unknown or the content malformed
+    """
+    return read_track(io.BytesIO(content), format or detect_format(content[:64]), min_spacing, tolerance)
@@ -0,0 +1,56 @@
+from datetime import date
+
+import numpy as np
+
+from src.strava.attempts import (
+    count_between,
+    count_climb_attempts,
+    monthly_histogram,
+    to_day,
+)
+from src.strava.leaderboard import parse_effort_date
+
+
+def test_parse_effort_date():
+    # Given
+    today = date(2025, 3, 14)
+
+    # When
+    parsed = [parse_effort_date(text, today) for text in ("Mar 13, 2025", "March 1, 2024", "Today", "Yesterday", "-")]
+
+    # Then
+    assert parsed == [to_day(date(2025, 3, 13)), to_day(date(2024, 3, 1)), to_day(today), to_day(date(2025, 3, 13)), None]
+
+def test_monthly_histogram_ignores_other_years():
+    # Given
+    days = np.array([to_day(date(2025, 1, 5)), to_day(date(2025, 3, 1)), to_day(date(2025, 3, 31)), to_day(date(2024, 3, 10))])
+
+    # When
+    histogram = monthly_histogram(days, 2025)
+
+    # Then
+    assert histogram.tolist() == [1, 0, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0]
+
+def test_count_climb_attempts_counts_this_month_of_this_year_only():
+    # Given
+    days = np.array([to_day(date(2025, 3, 2)), to_day(date(2025, 2, 27)), to_day(date(2024, 3, 2))], dtype=np.int32)
+
+    # When
+    attempts = count_climb_attempts(days, today=date(2025, 3, 14))
+
+    # Then
+    assert attempts == {
+        'last_month_climbs_attempts': 1,
+        'beginning_of_the_year_climbs_attempts': 2,
+        'monthly_climbs_attempts': {'Jan': 0, 'Feb': 1, 'Mar': 1},
+    }
+
+def test_count_between_custom_window():
+    # Given
+    days = np.array([to_day(date(2025, 3, day)) for day in range(1, 15)])
+
+    # When
+    count = count_between(days, date(2025, 3, 8), date(2025, 3, 15))
+
+    # Then
+    assert count == 7
@@ -0,0 +1,145 @@
+import asyncio
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from src.concurrency import CpuExecutor, ToolCallLimiter
+from src.strava.leaderboard import parse_leaderboard, parse_leaderboard_bytes
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class Session:
+    pass
+
+
+async def run_calls(limiter, sessions, calls_per_session):
+    running = {"all": 0, "peak": 0}
+    peaks = {}
+
+    async def call(session):
+        async with limiter.limit(session):
+            running["all"] += 1
+            running[id(session)] = running.get(id(session), 0) + 1
+            running["peak"] = max(running["peak"], running["all"])
+            peaks[id(session)] = max(peaks.get(id(session), 0), running[id(session)])
+            await asyncio.sleep(0.01)
+            running["all"] -= 1
+            running[id(session)] -= 1
+
+    await asyncio.gather(*(call(session) for session in sessions for _ in range(calls_per_session)))
+    return running["peak"], peaks
+
+
+@pytest.mark.asyncio
+async def test_one_session_cannot_take_every_worker():
+    # Given
+    limiter = ToolCallLimiter(workers=4, per_session=2)
+    session = Session()
+
+    # When
+    peak, peaks = await run_calls(limiter, [session], 6)
+
+    # Then
+    assert peak == 2
+    assert peaks[id(session)] == 2
+
+@pytest.mark.asyncio
+async def test_sessions_share_the_workers():
+    # Given
+    limiter = ToolCallLimiter(workers=3, per_session=2)
+    sessions = [Session(), Session(), Session()]
+
+    # When
+    peak, peaks = await run_calls(limiter, sessions, 4)
+
+    # Then
+    assert peak == 3
+    assert all(session_peak <= 2 for session_peak in peaks.values())
+
+def parse_in_thread(data):
+    return data.decode(), threading.current_thread().name
+
+@pytest.mark.asyncio
+async def test_small_inputs_run_inline_and_large_ones_in_the_pool():
+    # Given
+    executor = CpuExecutor("thread", workers=1, min_bytes=8)
+
+    # When
+    small = await executor.run(parse_in_thread, b"tiny")
+    large = await executor.run(parse_in_thread, b"a large page")
+    executor.shutdown()
+
+    # Then
+    assert small == ("tiny", threading.current_thread().name)
+    assert large[0] == "a large page" and large[1].startswith("parse")
+    assert executor.stats() == {"executor": "thread", "workers": 1, "offloaded": 1, "inline": 1}
+
+@pytest.mark.asyncio
+async def test_leaderboards_parsed_in_a_worker_process_match_inline_parsing():
+    # Given
+    content = (FIXTURES / "leaderboard_652851.html").read_bytes()
+    executor = CpuExecutor("process", workers=1, min_bytes=0)
+
+    # When
+    try:
+        leaderboard = await executor.run(parse_leaderboard_bytes, content, "utf-8")
+    finally:
+        executor.shutdown()
+
+    # Then
+    expected = parse_leaderboard(content.decode())
+    assert leaderboard.columns == expected.columns
+    assert [row.as_dict() for row in leaderboard] == [row.as_dict() for row in expected]
+
+@pytest.mark.asyncio
+async def test_the_event_loop_serves_other_calls_while_a_worker_parses():
+    # Given
+    executor = CpuExecutor("thread", workers=1, min_bytes=0)
+    ticks = []
+
+    async def tick():
+        for _ in range(5):
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0.01)
+
+    # When
+    started = time.perf_counter()
+    await asyncio.gather(executor.run(lambda data: time.sleep(0.1), b"page"), tick())
+    executor.shutdown()
+
+    # Then
+    assert ticks[-1] - started < 0.09
+
+def kill_worker(data, marker=None):
+    """Kill the worker process, only the first time when given a marker file."""
+    if marker is None or not os.path.exists(marker):
+        if marker is not None:
+            Path(marker).touch()
+        os._exit(1)
+    return data.decode()
+
+@pytest.mark.asyncio
+async def test_a_call_whose_worker_dies_is_retried_once_in_a_new_pool(tmp_path):
+    # Given
+    executor = CpuExecutor("process", workers=1, min_bytes=0)
+
+    # When
+    try:
+        retried = await executor.run(kill_worker, b"page", str(tmp_path / "died"))
+        with pytest.raises(ValueError):
+            await executor.run(kill_worker, b"page")
+        after = await executor.run(kill_worker, b"next page", str(tmp_path / "died"))
+    finally:
+        executor.shutdown()
+
+    # Then the input that keeps killing workers is never run on the event loop
+    assert retried == "page"
+    assert after == "next page"
+
+def test_unknown_executors_are_rejected():
+    with pytest.raises(ValueError):
+        CpuExecutor("fiber")
@@ -0,0 +1,104 @@
+from pathlib import Path
+
+import pytest
+
+from src.nominatim.backends import ChainedBackend, GazetteerBackend, GeocodingBackend
+from src.nominatim.gazetteer import Gazetteer, build_gazetteer
+
+FIXTURE = Path(__file__).parent / "fixtures" / "geonames_alps.txt"
+
+
+@pytest.fixture
+def gazetteer_path(tmp_path):
+    path = str(tmp_path / "gazetteer.idx")
+    build_gazetteer([str(FIXTURE)], path)
+    return path
+
+@pytest.fixture
+def gazetteer(gazetteer_path):
+    gazetteer = Gazetteer(gazetteer_path)
+    yield gazetteer
+    gazetteer.close()
+
+
+def test_build_keeps_the_requested_feature_classes(gazetteer):
+    # Then
+    assert len(gazetteer) == 9
+    assert gazetteer.lookup("Refuge du Goûter") == []
+
+def test_lookup_finds_exact_names_most_populated_first(gazetteer):
+    # When
+    places = gazetteer.lookup("  col de la FORCLAZ ")
+
+    # Then
+    assert [place.label for place in places] == ["Col de la Forclaz, FR", "Col de la Forclaz, CH"]
+    assert (places[0].latitude, places[0].longitude) == (45.81361, 6.24472)
+    assert places[0].feature == "T.PASS"
+
+def test_lookup_matches_ascii_spellings(gazetteer):
+    # When
+    places = gazetteer.lookup("zurich")
+
+    # Then
+    assert [place.label for place in places] == ["Zürich, CH"]
+
+def test_prefix_ranks_by_population(gazetteer):
+    # When
+    places = gazetteer.prefix("col", limit=2)
+
+    # Then
+    assert len(places) == 2
+    assert all(place.label.startswith("Col ") for place in places)
+
+def test_fuzzy_absorbs_typos(gazetteer):
+    # When
+    matches = gazetteer.fuzzy("col du galiber", limit=1)
+
+    # Then
+    place, similarity = matches[0]
+    assert place.label == "Col du Galibier, FR"
+    assert 0.5 < similarity < 1
+
+def test_nearest_finds_places_within_the_radius(gazetteer):
+    # When
+    near = gazetteer.nearest(45.0642, 6.4079, radius=0.5)
+    far = gazetteer.nearest(44.0, 6.4, radius=0.5)
+
+    # Then
+    assert near.label == "Col du Galibier, FR"
+    assert far is None
+
+@pytest.mark.asyncio
+async def test_chained_backend_falls_back_on_a_local_miss(gazetteer_path):
+    # Given
+    class FakeRemote(GeocodingBackend):
+        name = "remote"
+
+        async def search(self, query, priority=0):
+            self.answered += 1
+            return [{"lat": "45.0", "lon": "6.0", "display_name": query}]
+
+        async def reverse(self, latitude, longitude, priority=0):
+            return {"error": "Unable to geocode"}
+
+    backend = ChainedBackend([GazetteerBackend(gazetteer_path, min_similarity=0.8), FakeRemote()])
+
+    # When
+    local = await backend.search("chamonix-mont-blanc, fr")
+    remote = await backend.search("col du galibier, valloire")
+    backend.close()
+
+    # Then
+    assert local[0]["display_name"] == "Chamonix-Mont-Blanc, FR"
+    assert remote[0]["display_name"] == "col du galibier, valloire"
+    assert backend.stats() == {"gazetteer": 1, "remote": 1}
+
+def test_backends_must_implement_every_lookup():
+    # Given
+    class SearchOnly(GeocodingBackend):
+        async def search(self, query, priority=0):
+            return []
+
+    # Then
+    with pytest.raises(TypeError):
+        SearchOnly()
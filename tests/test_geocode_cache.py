@@ -0,0 +1,79 @@
+import time
+
+from src.cache.lru import TTLCache
+from src.cache.sqlite import SqliteStore
+from src.cache.tiered import TieredCache
+from src.nominatim.cache import normalise_address
+
+
+def test_normalise_address_merges_spelling_variants():
+    # Given
+    addresses = [
+        "Col du Galibier, Valloire",
+        "  col du  GALIBIER ,valloire. ",
+        "Col du Galibier,Valloire",
+    ]
+
+    # When
+    keys = {normalise_address(address) for address in addresses}
+
+    # Then
+    assert keys == {"col du galibier, valloire"}
+
+def test_ttl_cache_evicts_least_recently_used():
+    # Given
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+
+    # When
+    cache.set("c", 3)
+
+    # Then
+    assert cache.get("a") == (True, 1)
+    assert cache.get("b") == (False, None)
+    assert cache.get("c") == (True, 3)
+
+def test_ttl_cache_expires_entries():
+    # Given
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1, ttl=0.01)
+
+    # When
+    time.sleep(0.02)
+
+    # Then
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+def test_tiered_cache_survives_restart(tmp_path):
+    # Given
+    path = str(tmp_path / "cache.sqlite3")
+    store = SqliteStore(path)
+    cache = TieredCache("geocode", maxsize=10, ttl=60, store=lambda: store)
+    cache.set("col du galibier", [45.064, 6.407])
+    store.close()
+
+    # When
+    reopened = SqliteStore(path)
+    actual_hit, actual_value = TieredCache("geocode", maxsize=10, ttl=60, store=lambda: reopened).get("col du galibier")
+
+    # Then
+    assert actual_hit
+    assert actual_value == [45.064, 6.407]
+
+def test_tiered_cache_keeps_negative_entries(tmp_path):
+    # Given
+    store = SqliteStore(str(tmp_path / "cache.sqlite3"))
+    cache = TieredCache("geocode", maxsize=10, ttl=60, negative_ttl=0.01, store=lambda: store)
+
+    # When
+    cache.set("nowhere", None)
+    hit_before_expiry = cache.get("nowhere")
+    time.sleep(0.02)
+    hit_after_expiry = cache.get("nowhere")
+
+    # Then
+    assert hit_before_expiry == (True, None)
+    assert hit_after_expiry == (False, None)
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from src.geometry import (
+    bounding_box,
+    bounding_boxes,
+    corridor_polygon,
+    decode_polyline,
+    decode_polylines,
+    haversine,
+    haversine_distances,
+    points_in_polygon,
+    route_bounding_box,
+    route_distances,
+    simplify_polyline,
+    vincenty_distances,
+    within_corridor,
+)
+
+
+def test_bounding_boxes_match_the_scalar_path():
+    # Given
+    latitudes = np.array([45.064, 89.95, -17.0, 0.0])
+    longitudes = np.array([6.407, 12.0, 179.99, -45.0])
+
+    # When
+    boxes = bounding_boxes(latitudes, longitudes, 10)
+
+    # Then
+    for box, latitude, longitude in zip(boxes, latitudes, longitudes):
+        assert box == pytest.approx(bounding_box(latitude, longitude, 10))
+
+def test_bounding_box_contains_the_circle():
+    # Given
+    latitude, longitude = 60.0, 10.0
+    southwest_lat, southwest_lon, northeast_lat, northeast_lon = bounding_box(latitude, longitude, 50)
+    bearings = np.radians(np.arange(0, 360, 1))
+    angle = 50 / 6371.0088
+    phi, lam = np.radians(latitude), np.radians(longitude)
+
+    # When
+    circle_lat = np.degrees(np.arcsin(np.sin(phi) * np.cos(angle) + np.cos(phi) * np.sin(angle) * np.cos(bearings)))
+    circle_lon = np.degrees(lam + np.arctan2(np.sin(bearings) * np.sin(angle) * np.cos(phi), np.cos(angle) - np.sin(phi) * np.sin(np.radians(circle_lat))))
+
+    # Then
+    assert np.all((circle_lat >= southwest_lat - 1e-9) & (circle_lat <= northeast_lat + 1e-9))
+    assert np.all((circle_lon >= southwest_lon - 1e-9) & (circle_lon <= northeast_lon + 1e-9))
+    assert circle_lon.max() == pytest.approx(northeast_lon, abs=0.01)
+
+def test_haversine_and_vincenty_distances():
+    # Given
+    flinders_peak = (-37.95103342, 144.42486789)
+    buninyong = (-37.65282114, 143.92649554)
+
+    # When
+    spherical = haversine_distances(*flinders_peak, np.array([buninyong[0]]), np.array([buninyong[1]]))
+    ellipsoidal = vincenty_distances(*flinders_peak, np.array([buninyong[0]]), np.array([buninyong[1]]))
+
+    # Then
+    assert ellipsoidal[0] == pytest.approx(54.972271, abs=1e-6)
+    assert spherical[0] == pytest.approx(haversine(*flinders_peak, *buninyong))
+    assert spherical[0] == pytest.approx(54.972271, rel=0.005)
+
+def test_vincenty_handles_coincident_and_antipodal_points():
+    # When
+    distances = vincenty_distances(0.0, 0.0, np.array([0.0, 0.5]), np.array([0.0, 179.7]))
+
+    # Then
+    assert distances[0] == 0.0
+    assert distances[1] == pytest.approx(19970, rel=0.01)
+
+def test_route_distances_measure_to_the_closest_leg():
+    # Given
+    route_lat = np.array([45.0, 45.0, 45.1])
+    route_lon = np.array([6.0, 6.1, 6.1])
+    points_lat = np.array([45.01, 45.05, 45.0])
+    points_lon = np.array([6.05, 6.11, 5.9])
+
+    # When
+    distances = route_distances(points_lat, points_lon, route_lat, route_lon)
+
+    # Then
+    assert distances[0] == pytest.approx(1.112, abs=0.005)
+    assert distances[1] == pytest.approx(0.786, abs=0.005)
+    assert distances[2] == pytest.approx(haversine(45.0, 5.9, 45.0, 6.0), rel=0.001)
+    assert within_corridor(points_lat, points_lon, route_lat, route_lon, 1.0).tolist() == [False, True, False]
+
+def test_corridor_polygon_buffers_the_route():
+    # Given
+    route_lat = np.array([45.0, 45.0, 45.1])
+    route_lon = np.array([6.0, 6.1, 6.1])
+
+    # When
+    polygon = corridor_polygon(route_lat, route_lon, 1.0)
+    inside = points_in_polygon(np.array([45.005, 45.05, 45.05]), np.array([6.05, 6.105, 6.2]), polygon)
+
+    # Then
+    assert polygon.shape == (6, 2)
+    assert inside.tolist() == [True, True, False]
+
+def test_route_bounding_box_widens_the_route():
+    # When
+    box = route_bounding_box(np.array([45.0, 45.1]), np.array([6.0, 6.1]), 1.0)
+
+    # Then
+    assert box[0] < 45.0 and box[2] > 45.1
+    assert box[1] < 6.0 and box[3] > 6.1
+
+def test_decode_polyline():
+    # When
+    points = decode_polyline("_p~iF~ps|U_ulLnnqC_mqNvxq`@")
+
+    # Then
+    assert points.dtype == np.float32
+    assert points == pytest.approx(np.array([[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]))
+    assert decode_polyline("").shape == (0, 2)
+    with pytest.raises(ValueError):
+        decode_polyline("_p~iF~ps|U_")
+
+def test_decode_polylines_restarts_each_polyline_from_zero():
+    # When
+    points, counts = decode_polylines(["_p~iF~ps|U_ulLnnqC_mqNvxq`@", "", "_p~iF~ps|U"])
+
+    # Then
+    assert counts.tolist() == [3, 0, 1]
+    assert points == pytest.approx(np.array([[38.5, -120.2], [40.7, -120.95], [43.252, -126.453], [38.5, -120.2]]))
+    with pytest.raises(ValueError):
+        decode_polylines(["_p~iF~ps|U_", "ulLnnqC"])
+
+def test_simplify_polyline_keeps_corners_and_turnarounds():
+    # Given a straight line north, then halfway back along it
+    latitudes = np.concatenate([np.linspace(45.0, 45.1, 101), np.linspace(45.1, 45.05, 51)[1:]])
+    longitudes = np.full(151, 6.0)
+
+    # When
+    kept = simplify_polyline(latitudes, longitudes, tolerance=0.01)
+
+    # Then
+    assert kept.tolist() == [0, 100, 150]
@@ -0,0 +1,23 @@
+import asyncio
+
+from src.clients.pool import HttpPool
+
+
+def test_clients_of_a_previous_event_loop_are_closed():
+    # Given
+    pool = HttpPool()
+    pool.register("upstream", http2=False)
+
+    async def open_client():
+        client = pool.client("upstream")
+        await asyncio.sleep(0)
+        return client
+
+    # When
+    first = asyncio.run(open_client())
+    second = asyncio.run(open_client())
+
+    # Then
+    assert first is not second
+    assert first.is_closed
+    assert not second.is_closed
@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+from src.strava import crawler
+from src.strava.efforts import EffortStore
+from src.strava.leaderboard import Leaderboard, parse_leaderboard
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def leaderboard_pages(pages):
+    """Split the fixture leaderboard into `pages` pages of distinct efforts."""
+    rows = parse_leaderboard((FIXTURES / "leaderboard_652851.html").read_text()).rows
+    size = len(rows) // pages
+    return {
+        page: Leaderboard(["Rank", "Name", "Date", "Speed", "HR", "Power", "VAM", "Time"], rows[(page - 1) * size:page * size], pages)
+        for page in range(1, pages + 1)
+    }
+
+@pytest.mark.asyncio
+async def test_crawl_leaderboard_stores_every_page(monkeypatch, tmp_path):
+    # Given
+    store = EffortStore(str(tmp_path / "efforts.sqlite3"))
+    pages = leaderboard_pages(3)
+
+    async def fake_fetch_leaderboard_page(segment_id, date_range, page, priority):
+        return pages[page]
+
+    monkeypatch.setattr(crawler, "fetch_leaderboard_page", fake_fetch_leaderboard_page)
+
+    # When
+    complete = await crawler.crawl_leaderboard(652851, store)
+
+    # Then
+    assert complete
+    assert len(store.effort_days(652851)) == sum(len(page) for page in pages.values())
+    assert store.crawl(652851, "this_year").complete
+
+@pytest.mark.asyncio
+async def test_crawl_leaderboard_resumes_interrupted_crawl(monkeypatch, tmp_path):
+    # Given
+    store = EffortStore(str(tmp_path / "efforts.sqlite3"))
+    pages = leaderboard_pages(3)
+    fetched = []
+
+    async def failing_fetch_leaderboard_page(segment_id, date_range, page, priority):
+        fetched.append(page)
+        if page == 3:
+            raise crawler.UpstreamError("strava_web", "unreachable")
+        return pages[page]
+
+    async def fake_fetch_leaderboard_page(segment_id, date_range, page, priority):
+        fetched.append(page)
+        return pages[page]
+
+    monkeypatch.setattr(crawler, "fetch_leaderboard_page", failing_fetch_leaderboard_page)
+    interrupted = await crawler.crawl_leaderboard(652851, store)
+    fetched.clear()
+
+    # When
+    monkeypatch.setattr(crawler, "fetch_leaderboard_page", fake_fetch_leaderboard_page)
+    resumed = await crawler.crawl_leaderboard(652851, store)
+
+    # Then
+    assert not interrupted
+    assert resumed
+    assert fetched == [3]
+
+def test_choose_date_range_after_a_full_crawl(tmp_path):
+    # Given
+    store = EffortStore(str(tmp_path / "efforts.sqlite3"))
+    store.start_crawl(652851, "this_year", 1)
+    store.finish_crawl(652851, "this_year")
+    now = datetime.now()
+
+    # When
+    same_day = crawler.choose_date_range(store, 652851, now)
+    next_year = crawler.choose_date_range(store, 652851, now.replace(year=now.year + 1))
+    next_month = crawler.choose_date_range(store, 652851, now.replace(day=1) + timedelta(days=32))
+
+    # Then
+    assert same_day == "today"
+    assert next_year == "this_year"
+    assert next_month == "this_year"
+
+def test_choose_date_range_without_crawl(tmp_path):
+    # Given
+    store = EffortStore(str(tmp_path / "efforts.sqlite3"))
+
+    # When
+    date_range = crawler.choose_date_range(store, 652851)
+
+    # Then
+    assert date_range == "this_year"
@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from src.strava.leaderboard import parse_leaderboard
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+def test_parse_leaderboard_reads_typed_rows():
+    # Given
+    html = (FIXTURES / "leaderboard_7037936.html").read_text()
+
+    # When
+    leaderboard = parse_leaderboard(html)
+
+    # Then
+    assert leaderboard.columns == ["Rank", "Name", "Date", "Speed", "HR", "Power", "VAM", "Time"]
+    assert len(leaderboard) == 24
+    assert leaderboard.pages == 4
+    first = leaderboard.rows[0]
+    assert first.rank == 1
+    assert first.athlete_name == "Marie C."
+    assert first.athlete_id == "87466946"
+    assert first.date == "Mar 13, 2025"
+    assert first.effort_id == "3300936000"
+    assert first.speed == 18.4
+    assert first.heart_rate is None
+    assert first.power is None
+    assert first.vam == 1475.0
+    assert first.time == "19:51"
+
+def test_parse_leaderboard_skips_highlighted_rows():
+    # Given
+    html = (FIXTURES / "leaderboard_7037936.html").read_text()
+
+    # When
+    leaderboard = parse_leaderboard(html)
+
+    # Then
+    ranks = [row.rank for row in leaderboard]
+    assert 9 not in ranks
+    assert len(set(row.effort_id for row in leaderboard)) == len(leaderboard)
+
+def test_parse_leaderboard_without_vam_column():
+    # Given
+    html = (FIXTURES / "leaderboard_12349239.html").read_text()
+
+    # When
+    leaderboard = parse_leaderboard(html)
+
+    # Then
+    assert "VAM" not in leaderboard.columns
+    assert leaderboard.pages == 1
+    assert all(row.vam is None for row in leaderboard)
+    assert leaderboard.rows[0].time == "9:01"
+
+def test_leaderboard_converts_to_dataframe():
+    # Given
+    leaderboard = parse_leaderboard((FIXTURES / "leaderboard_12349239.html").read_text())
+
+    # When
+    df = leaderboard.to_dataframe()
+
+    # Then
+    assert len(df) == 24
+    assert "vam" not in df.columns
+    assert df["speed"].dtype == float
@@ -0,0 +1,105 @@
+from pathlib import Path
+
+import pytest
+
+from src.clients.ratelimit import BACKGROUND, INTERACTIVE
+from src.strava import refresh
+from src.strava.efforts import EffortStore
+from src.strava.leaderboard import parse_leaderboard
+from src.strava.refresh import ClimbAttemptsCache
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+@pytest.fixture
+def crawls(monkeypatch):
+    """Fake leaderboard crawl storing the fixture leaderboard, recording the priority of each crawl."""
+    rows = parse_leaderboard((FIXTURES / "leaderboard_652851.html").read_text()).rows
+    priorities = []
+
+    async def fake_crawl_leaderboard(segment_id, store, priority):
+        priorities.append(priority)
+        if segment_id == 404:
+            return False
+        store.start_crawl(segment_id, "this_year", 1)
+        store.store_page(segment_id, "this_year", 1, rows)
+        store.finish_crawl(segment_id, "this_year")
+        return True
+
+    monkeypatch.setattr(refresh, "crawl_leaderboard", fake_crawl_leaderboard)
+    return priorities
+
+@pytest.fixture
+def store(tmp_path):
+    store = EffortStore(str(tmp_path / "efforts.sqlite3"))
+    yield store
+    store.close()
+
+@pytest.mark.asyncio
+async def test_fresh_counts_are_answered_without_crawling(crawls, store):
+    # Given
+    cache = ClimbAttemptsCache(ttl=3600, max_stale=7200, store=store)
+    first = await cache.get(652851)
+
+    # When
+    second = await cache.get(652851)
+
+    # Then
+    assert crawls == [INTERACTIVE]
+    assert second is first
+    assert cache.stats()["fresh_hits"] == 1
+
+@pytest.mark.asyncio
+async def test_stale_counts_are_answered_then_refreshed_in_the_background(crawls, store):
+    # Given
+    cache = ClimbAttemptsCache(ttl=0, max_stale=3600, store=store)
+    await cache.get(652851)
+
+    # When
+    stale = await cache.get(652851)
+    await cache.join()
+
+    # Then
+    assert stale["beginning_of_the_year_climbs_attempts"] >= 0
+    assert crawls == [INTERACTIVE, BACKGROUND]
+    assert cache.stats()["stale_hits"] == 1
+    assert cache.stats()["refreshes"] == 1
+    await cache.stop()
+
+@pytest.mark.asyncio
+async def test_counts_are_rebuilt_from_the_store(crawls, store):
+    # Given
+    await ClimbAttemptsCache(store=store).get(652851)
+    cache = ClimbAttemptsCache(store=store)
+
+    # When
+    attempts = await cache.get(652851)
+
+    # Then
+    assert crawls == [INTERACTIVE]
+    assert "monthly_climbs_attempts" in attempts
+
+@pytest.mark.asyncio
+async def test_uncrawlable_leaderboard_raises(crawls, store):
+    # Given
+    cache = ClimbAttemptsCache(store=store)
+
+    # When / Then
+    with pytest.raises(refresh.UpstreamError):
+        await cache.get(404)
+
+@pytest.mark.asyncio
+async def test_warm_queues_only_hot_segments_that_are_not_fresh(crawls, store):
+    # Given
+    cache = ClimbAttemptsCache(ttl=3600, store=store)
+    await cache.get(652851)
+
+    # When
+    queued = cache.warm([652851, 12349239, 12349239])
+    await cache.join()
+
+    # Then
+    assert queued == 1
+    assert crawls == [INTERACTIVE, BACKGROUND]
+    assert cache.stats()["segments"] == 2
+    await cache.stop()
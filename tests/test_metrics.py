@@ -0,0 +1,91 @@
+import asyncio
+import json
+import logging
+import time
+
+import pytest
+
+from src import metrics as metrics_module
+from src.metrics import Histogram, Metrics, metrics, monitor_event_loop_lag, span
+
+
+def test_histogram_quantiles_follow_the_buckets():
+    # Given
+    histogram = Histogram()
+
+    # When
+    for value in [0.002] * 90 + [0.2] * 9 + [42.0]:
+        histogram.observe(value)
+
+    # Then
+    summary = histogram.as_dict()
+    assert summary["count"] == 100
+    assert summary["p50"] == 0.0025
+    assert summary["p90"] == 0.0025
+    assert summary["p99"] == 0.25
+    assert summary["max"] == 42.0
+
+def test_counters_are_kept_per_label():
+    # Given
+    registry = Metrics()
+
+    # When
+    registry.increment("upstream_bytes_total", 100, upstream="strava_api")
+    registry.increment("upstream_bytes_total", 50, upstream="strava_api")
+    registry.increment("upstream_bytes_total", 7, upstream="nominatim")
+
+    # Then
+    assert registry.counter("upstream_bytes_total", upstream="strava_api") == 150
+    assert [counter["value"] for counter in registry.snapshot()["counters"]["upstream_bytes_total"]] == [7, 150]
+
+def test_prometheus_exposition():
+    # Given
+    registry = Metrics()
+    registry.increment("cache_lookups_total", cache="geocode", result="miss")
+    registry.observe("tool_seconds", 0.003, tool="find_segments_near_tool")
+
+    # When
+    text = registry.to_prometheus()
+
+    # Then
+    assert '# TYPE cache_lookups_total counter\ncache_lookups_total{cache="geocode",result="miss"} 1\n' in text
+    assert 'tool_seconds_bucket{tool="find_segments_near_tool",le="0.0025"} 0\n' in text
+    assert 'tool_seconds_bucket{tool="find_segments_near_tool",le="0.005"} 1\n' in text
+    assert 'tool_seconds_count{tool="find_segments_near_tool"} 1\n' in text
+
+def test_spans_are_timed_nested_and_traced(monkeypatch, caplog):
+    # Given
+    metrics.reset()
+    monkeypatch.setattr(metrics_module, "TRACE_SPANS", True)
+    caplog.set_level(logging.INFO, logger="hike_and_fly.trace")
+
+    # When
+    with span("tool", tool="get_nearby_segments_tool"):
+        with pytest.raises(ValueError):
+            with span("parse", parser="leaderboard"):
+                raise ValueError("bad page")
+
+    # Then
+    parse, tool = (json.loads(record.message) for record in caplog.records)
+    assert parse["parent_id"] == tool["span_id"]
+    assert parse["trace_id"] == tool["trace_id"]
+    assert parse["error"] == "ValueError"
+    assert metrics.histogram("tool_seconds", tool="get_nearby_segments_tool").count == 1
+    assert metrics.counter("parse_errors_total", parser="leaderboard", error="ValueError") == 1
+
+@pytest.mark.asyncio
+async def test_event_loop_lag_is_sampled():
+    # Given
+    metrics.reset()
+    monitor = asyncio.create_task(monitor_event_loop_lag(0.01))
+    await asyncio.sleep(0.03)
+
+    # When
+    time.sleep(0.05)
+    await asyncio.sleep(0.02)
+    monitor.cancel()
+
+    # Then
+    lag = metrics.histogram("event_loop_lag_seconds")
+    assert lag.count >= 2
+    assert lag.max >= 0.03
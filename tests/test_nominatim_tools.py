@@ -1,14 +1,23 @@
-from src.tools.nominatim import define_rectangular_area
+import pytest
+
+from src.cache.tiered import TieredCache
+from src.nominatim.backends import GazetteerBackend
+from src.tools import nominatim
+from src.tools.nominatim import (
+    define_rectangular_area,
+    get_addresses,
+    get_latitudes_and_longitudes,
+)
 
 
 def test_define_rectangle_area_one_kilometer():
     # Given
     latitude = 48.844510
     longitude = 1.630324
-    expected_southwest_lat = 48.83546628267043
-    expected_southwest_lon = 1.6166739651707096
-    expected_northeast_lat = 48.85355371732957
-    expected_northeast_lon = 1.6439740348292906
+    expected_southwest_lat = 48.835516796362754
+    expected_southwest_lon = 1.6166586926554203
+    expected_northeast_lat = 48.853503203637246
+    expected_northeast_lon = 1.643989307344583
 
     distance = 1
 
@@ -28,10 +37,10 @@ def test_define_rectangle_area_ten_kilometers():
 
     distance = 10
 
-    expected_southwest_lat = 48.63042982670429
-    expected_southwest_lon = 1.4510485115912939
-    expected_northeast_lat = 48.81130417329571
-    expected_northeast_lon = 1.723377488408706
+    expected_southwest_lat = 48.630934963627546
+    expected_southwest_lon = 1.4508960903222032
+    expected_northeast_lat = 48.81079903637245
+    expected_northeast_lon = 1.7235299096778078
 
     # When
     actual_southwest_lat, actual_southwest_lon, actual_northeast_lat, actual_northeast_lon = define_rectangular_area(latitude, longitude, distance)
@@ -49,10 +58,10 @@ def test_define_rectangle_area_five_kilometers():
 
     distance = 5
 
-    expected_southwest_lat = 42.863155913352145
-    expected_southwest_lon = 0.08394521221753556
-    expected_northeast_lat = 42.95359308664786
-    expected_northeast_lon = 0.20659158778246442
+    expected_southwest_lat = 42.86340848181377
+    expected_southwest_lon = 0.08387659487283372
+    expected_northeast_lat = 42.95334051818623
+    expected_northeast_lon = 0.20666020512717864
 
     # When
     actual_southwest_lat, actual_southwest_lon, actual_northeast_lat, actual_northeast_lon = define_rectangular_area(latitude, longitude, distance)
@@ -68,10 +77,10 @@ def test_define_rectangle_area_n_kilometers():
     latitude = 48.720867
     longitude = 1.587213
 
-    expected_southwest_lat = 48.63042982670429
-    expected_southwest_lon = 1.4510485115912939
-    expected_northeast_lat = 48.81130417329571
-    expected_northeast_lon = 1.723377488408706
+    expected_southwest_lat = 48.630934963627546
+    expected_southwest_lon = 1.4508960903222032
+    expected_northeast_lat = 48.81079903637245
+    expected_northeast_lon = 1.7235299096778078
 
     # When
     actual_southwest_lat, actual_southwest_lon, actual_northeast_lat, actual_northeast_lon = define_rectangular_area(latitude, longitude,)
@@ -81,3 +90,97 @@ def test_define_rectangle_area_n_kilometers():
     assert actual_southwest_lon == expected_southwest_lon
     assert actual_northeast_lat == expected_northeast_lat
     assert actual_northeast_lon == expected_northeast_lon
+
+def test_define_rectangle_area_spans_every_longitude_around_a_pole():
+    # When
+    actual = define_rectangular_area(89.95, 12.0, 10)
+
+    # Then
+    assert actual[1:] == (-180.0, 90.0, 180.0)
+    assert 89.86 < actual[0] < 89.87
+
+def test_define_rectangle_area_crosses_the_antimeridian():
+    # When
+    southwest_lat, southwest_lon, northeast_lat, northeast_lon = define_rectangular_area(-17.0, 179.99, 10)
+
+    # Then
+    assert southwest_lon > northeast_lon
+    assert 179.89 < southwest_lon < 179.9
+    assert -179.92 < northeast_lon < -179.91
+
+@pytest.mark.asyncio
+async def test_get_latitudes_and_longitudes_resolves_each_address_once(monkeypatch):
+    # Given
+    cache = TieredCache("geocode", maxsize=10, ttl=60, store=None)
+    cache.set("col du galibier", [45.064, 6.407])
+    requested = []
+
+    class FakeBackend:
+        async def search(self, query, priority):
+            requested.append(query)
+            if query == "nowhere":
+                return []
+            if query == "offline":
+                return None
+            return [{"lat": "45.9", "lon": "6.8"}]
+
+    monkeypatch.setattr(nominatim, "geocode_cache", cache)
+    monkeypatch.setattr(nominatim, "get_geocoding_backend", FakeBackend)
+
+    # When
+    results = await get_latitudes_and_longitudes(["Col du Galibier", "Chamonix", "nowhere", "offline", "  chamonix "])
+
+    # Then
+    assert sorted(requested) == ["chamonix", "nowhere", "offline"]
+    assert [result["status"] for result in results] == ["ok", "ok", "not_found", "error", "ok"]
+    assert results[0] == {"address": "Col du Galibier", "status": "ok", "cached": True, "latitude": 45.064, "longitude": 6.407}
+    assert results[4]["address"] == "  chamonix "
+    assert (results[4]["latitude"], results[4]["cached"]) == (45.9, False)
+    assert results[3]["error"] == "Nominatim: no latitude and longitude in the answer for address: offline"
+
+@pytest.mark.asyncio
+async def test_get_addresses_reverse_geocodes_in_input_order(monkeypatch):
+    # Given
+    cache = TieredCache("reverse_geocode", maxsize=10, ttl=60, store=None)
+    requested = []
+
+    class FakeBackend:
+        async def reverse(self, latitude, longitude, priority):
+            requested.append((latitude, longitude))
+            if latitude == 0:
+                return {"error": "Unable to geocode"}
+            return {"display_name": "Col du Galibier, Valloire"}
+
+    monkeypatch.setattr(nominatim, "reverse_geocode_cache", cache)
+    monkeypatch.setattr(nominatim, "get_geocoding_backend", FakeBackend)
+
+    # When
+    results = await get_addresses([(45.064, 6.407), (0.0, 0.0), (45.0640001, 6.4070001)])
+
+    # Then
+    assert sorted(requested) == [(0.0, 0.0), (45.064, 6.407)]
+    assert [result["status"] for result in results] == ["ok", "not_found", "ok"]
+    assert results[2]["address"] == "Col du Galibier, Valloire"
+    assert cache.get("0.00000,0.00000") == (True, None)
+
+
+@pytest.mark.asyncio
+async def test_a_missing_gazetteer_index_is_an_error_not_a_negative_answer(monkeypatch, tmp_path):
+    # Given
+    geocodes = TieredCache("geocode", maxsize=10, ttl=60, store=None)
+    reverse_geocodes = TieredCache("reverse_geocode", maxsize=10, ttl=60, store=None)
+    backend = GazetteerBackend(str(tmp_path / "missing.idx"))
+    monkeypatch.setattr(nominatim, "geocode_cache", geocodes)
+    monkeypatch.setattr(nominatim, "reverse_geocode_cache", reverse_geocodes)
+    monkeypatch.setattr(nominatim, "get_geocoding_backend", lambda: backend)
+
+    # When
+    results = await get_latitudes_and_longitudes(["Chamonix"])
+    addresses = await get_addresses([(45.064, 6.407)])
+
+    # Then
+    assert results[0]["status"] == "error"
+    assert "no index at" in results[0]["error"]
+    assert addresses[0]["status"] == "error"
+    assert geocodes.get("chamonix") == (False, None)
+    assert reverse_geocodes.get("45.06400,6.40700") == (False, None)
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from src.clients.errors import RateLimitedError
+from src.clients.ratelimit import (
+    BACKGROUND,
+    INTERACTIVE,
+    RequestScheduler,
+    StravaQuota,
+    TokenBucket,
+)
+
+
+def test_strava_quota_reads_read_rate_limit_headers():
+    # Given
+    quota = StravaQuota(short_limit=100, daily_limit=1000)
+    headers = {
+        "X-RateLimit-Limit": "200,2000",
+        "X-RateLimit-Usage": "20,150",
+        "X-ReadRateLimit-Limit": "100,1000",
+        "X-ReadRateLimit-Usage": "100,120",
+    }
+
+    # When
+    quota.observe(headers)
+
+    # Then
+    assert quota.as_dict() == {"15min": {"limit": 100, "usage": 100}, "daily": {"limit": 1000, "usage": 120}}
+    assert 0 < quota.delay() <= 900
+
+def test_token_bucket_smooths_requests():
+    # Given
+    bucket = TokenBucket(rate=10, capacity=1)
+
+    # When
+    bucket.consume()
+
+    # Then
+    assert 0 < bucket.delay() <= 0.1
+
+@pytest.mark.asyncio
+async def test_scheduler_serves_interactive_requests_first():
+    # Given
+    scheduler = RequestScheduler("test", TokenBucket(rate=50, capacity=1))
+    await scheduler.acquire()
+    order = []
+
+    async def request(name, priority):
+        await scheduler.acquire(priority)
+        order.append(name)
+
+    # When
+    background = asyncio.create_task(request("background", BACKGROUND))
+    await asyncio.sleep(0)
+    interactive = asyncio.create_task(request("interactive", INTERACTIVE))
+    await asyncio.gather(background, interactive)
+
+    # Then
+    assert order == ["interactive", "background"]
+    assert scheduler.stats()["requests"] == 3
+    assert scheduler.stats()["max_queue_depth"] == 2
+
+@pytest.mark.asyncio
+async def test_scheduler_rejects_interactive_requests_when_quota_is_exhausted():
+    # Given
+    quota = StravaQuota(short_limit=1, daily_limit=10)
+    scheduler = RequestScheduler("test", TokenBucket(rate=100, capacity=10), quota=quota)
+    await scheduler.acquire()
+
+    # When / Then
+    with pytest.raises(RateLimitedError):
+        await scheduler.acquire(INTERACTIVE, max_wait=1)
+    assert scheduler.stats()["rejected"] == 1
@@ -0,0 +1,134 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.clients.errors import (
+    CircuitOpenError,
+    RateLimitedError,
+    UpstreamResponseError,
+    UpstreamTimeoutError,
+    UpstreamUnavailableError,
+)
+from src.clients.resilience import CLOSED, OPEN, CircuitBreaker, ResilientUpstream
+
+URL = "https://upstream.test/resource"
+
+
+def response(status, headers=None):
+    return httpx.Response(status, headers=headers, json={"status": status}, request=httpx.Request("GET", URL))
+
+
+def sender(*outcomes):
+    """Send each outcome in turn, raising the exceptions, and count the calls."""
+    calls = []
+
+    async def send():
+        outcome = outcomes[len(calls)]
+        calls.append(outcome)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return send, calls
+
+
+@pytest.mark.asyncio
+async def test_transient_failures_are_retried():
+    # Given
+    upstream = ResilientUpstream("test", retries=2, backoff=0, hedge=False)
+    send, calls = sender(response(503), httpx.ConnectTimeout("slow"), response(200))
+
+    # When
+    result = await upstream.get(send)
+
+    # Then
+    assert result.status_code == 200
+    assert len(calls) == 3
+    assert upstream.stats()["retried"] == 2
+    assert upstream.breaker.state == CLOSED and upstream.breaker.failures == 0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("outcome, error", [
+    (response(502), UpstreamUnavailableError),
+    (httpx.ReadTimeout("slow"), UpstreamTimeoutError),
+    (httpx.ConnectError("refused"), UpstreamUnavailableError),
+    (response(429), RateLimitedError),
+])
+async def test_persistent_failures_become_typed_errors(outcome, error):
+    # Given
+    upstream = ResilientUpstream("test", retries=1, backoff=0, hedge=False)
+    send, calls = sender(outcome, outcome)
+
+    # When
+    with pytest.raises(error):
+        await upstream.get(send)
+
+    # Then
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_client_errors_and_long_retry_after_are_not_retried():
+    # Given
+    upstream = ResilientUpstream("test", retries=3, backoff=0, max_backoff=5, hedge=False)
+    rejected, rejected_calls = sender(response(404))
+    throttled, throttled_calls = sender(response(429, {"Retry-After": "60"}))
+
+    # When
+    with pytest.raises(UpstreamResponseError) as rejection:
+        await upstream.get(rejected)
+    with pytest.raises(RateLimitedError) as throttling:
+        await upstream.get(throttled)
+
+    # Then
+    assert rejection.value.status == 404
+    assert throttling.value.retry_after == 60
+    assert len(rejected_calls) == len(throttled_calls) == 1
+
+@pytest.mark.asyncio
+async def test_circuit_opens_fails_fast_and_closes_after_a_successful_probe(monkeypatch):
+    # Given
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    upstream = ResilientUpstream("test", retries=0, hedge=False, breaker=breaker)
+    send, calls = sender(response(500), response(500), response(200))
+    for _ in range(2):
+        with pytest.raises(UpstreamUnavailableError):
+            await upstream.get(send)
+
+    # When
+    with pytest.raises(CircuitOpenError):
+        await upstream.get(send)
+    opened_state = breaker.state
+    breaker.opened_at -= 30
+    probe = await upstream.get(send)
+
+    # Then
+    assert opened_state == OPEN
+    assert len(calls) == 3
+    assert probe.status_code == 200
+    assert breaker.stats() == {"state": CLOSED, "failures": 0, "trips": 1, "rejected": 1}
+
+@pytest.mark.asyncio
+async def test_slow_requests_are_hedged_and_the_first_answer_wins(monkeypatch):
+    # Given
+    upstream = ResilientUpstream("test", retries=0, hedge=True)
+    monkeypatch.setattr(upstream, "hedge_delay", lambda: 0.01)
+    cancelled = []
+
+    async def send():
+        attempt = upstream.hedged
+        try:
+            await asyncio.sleep(1.0 if attempt == 0 else 0.0)
+        except asyncio.CancelledError:
+            cancelled.append(attempt)
+            raise
+        return response(200 + attempt)
+
+    # When
+    result = await upstream.get(send)
+    await asyncio.sleep(0)
+
+    # Then
+    assert result.status_code == 201
+    assert upstream.hedged == 1
+    assert cancelled == [0]
@@ -0,0 +1,129 @@
+import asyncio
+
+import pytest
+
+from src.cache.lru import TTLCache
+from src.strava import api, details
+from src.strava.details import SegmentDetailStore, enrich_segments, get_segment_detail
+
+DETAIL = {
+    "id": 652851,
+    "name": "Alpe d'Huez",
+    "activity_type": "Ride",
+    "distance": 12024.9,
+    "average_grade": 8.8,
+    "maximum_grade": 13.2,
+    "elevation_high": 1850.2,
+    "elevation_low": 744.8,
+    "total_elevation_gain": 1105.4,
+    "climb_category": 1,
+    "start_latlng": [45.0529, 6.0321],
+    "end_latlng": [45.0922, 6.0699],
+    "map": {"polyline": "_p~iF~ps|U_ulLnnqC_mqNvxq`@"},
+    "athlete_segment_stats": {"pr_elapsed_time": 3600},
+}
+
+
+@pytest.fixture
+def strava(monkeypatch, tmp_path):
+    """Fake detailed segment endpoint recording the requested URLs, over an empty store."""
+    requested_urls = []
+
+    async def fake_make_strava_request(url, priority):
+        requested_urls.append(url)
+        segment_id = int(url.rsplit("/", 1)[1])
+        return {**DETAIL, "id": segment_id} if segment_id != 404 else None
+
+    store = SegmentDetailStore(str(tmp_path / "details.sqlite3"))
+    monkeypatch.setattr(details, "make_strava_request", fake_make_strava_request)
+    monkeypatch.setattr(details, "get_detail_store", lambda: store)
+    monkeypatch.setattr(details, "detail_cache", TTLCache(16, 60))
+    yield requested_urls
+    store.close()
+
+@pytest.mark.asyncio
+async def test_segment_detail_is_fetched_once(strava):
+    # When
+    detail = await get_segment_detail(652851)
+    again = await get_segment_detail(652851)
+
+    # Then
+    assert len(strava) == 1
+    assert again is detail
+    assert detail.as_dict()["total_elevation_gain"] == 1105.4
+    assert "athlete_segment_stats" not in detail.as_dict()
+    assert detail.points.ravel().tolist() == pytest.approx([38.5, -120.2, 40.7, -120.95, 43.252, -126.453])
+
+@pytest.mark.asyncio
+async def test_segment_detail_is_read_back_from_the_store(strava, monkeypatch):
+    # Given
+    detail = await get_segment_detail(652851)
+    monkeypatch.setattr(details, "detail_cache", TTLCache(16, 60))
+
+    # When
+    stored = await get_segment_detail(652851)
+
+    # Then
+    assert len(strava) == 1
+    assert stored.digest == detail.digest
+    assert stored.as_dict(include_points=True) == detail.as_dict(include_points=True)
+
+def test_store_shares_identical_details(tmp_path):
+    # Given
+    store = SegmentDetailStore(str(tmp_path / "details.sqlite3"))
+
+    # When
+    first = store.put(1, b'{"id":1}')
+    second = store.put(1, b'{"id":1}')
+
+    # Then
+    assert first == second
+    assert store._connection.execute("SELECT COUNT(*) FROM blobs").fetchone() == (1,)
+    store.close()
+
+@pytest.mark.asyncio
+async def test_enrich_segments_keeps_input_order_and_reports_errors(strava):
+    # Given
+    streamed = []
+
+    async def on_result(result):
+        streamed.append(result["segment_id"])
+
+    # When
+    results = await enrich_segments([3, 404, 1, 3], on_result=on_result)
+
+    # Then
+    assert [result["segment_id"] for result in results] == [3, 404, 1]
+    assert "error" in results[1]
+    assert results[0]["point_count"] == 3
+    assert sorted(streamed) == [1, 3, 404]
+
+@pytest.mark.asyncio
+async def test_enrich_segments_fails_fast_once_the_quota_is_exhausted(monkeypatch, tmp_path):
+    # Given the classes of the module the requests are made from
+    quota = api.StravaQuota(short_limit=100, daily_limit=1000)
+    quota.exhaust()
+    store = SegmentDetailStore(str(tmp_path / "details.sqlite3"))
+    monkeypatch.setattr(api, "strava_scheduler", api.RequestScheduler("Strava", api.TokenBucket(rate=100, capacity=10), quota=quota))
+    monkeypatch.setattr(details, "get_detail_store", lambda: store)
+    monkeypatch.setattr(details, "detail_cache", TTLCache(16, 60))
+
+    # When
+    results = await asyncio.wait_for(enrich_segments([1, 2]), timeout=5)
+    store.close()
+
+    # Then
+    assert [result["segment_id"] for result in results] == [1, 2]
+    assert all("rate limit reached" in result["error"] for result in results)
+
+@pytest.mark.asyncio
+async def test_enrich_segments_does_not_hide_programming_errors(strava, monkeypatch):
+    # Given
+    async def broken_get_segment_detail(segment_id, priority):
+        raise KeyError("map")
+
+    monkeypatch.setattr(details, "get_segment_detail", broken_get_segment_detail)
+
+    # When / Then
+    with pytest.raises(KeyError):
+        await enrich_segments([1])
@@ -0,0 +1,272 @@
+import time
+
+import pytest
+
+from src.cache.tiered import TieredCache
+from src.strava import explore, segments
+from src.strava.index import SegmentIndex
+from src.strava.segments import SegmentTable
+from src.strava.tiles import covering_quadkeys
+from src.tools.strava import render_segments
+
+SEGMENTS = [
+    {"id": 1, "name": "Take-off climb", "start_latlng": [45.0, 6.0], "end_latlng": [45.01, 6.0], "avg_grade": 9.5, "distance": 1200.0},
+    {"id": 2, "name": "Valley road", "start_latlng": [45.02, 6.0], "end_latlng": [45.03, 6.01], "avg_grade": 2.0, "distance": 3000.0},
+    {"id": 3, "name": "Ridge", "start_latlng": [45.0, 6.05], "end_latlng": [45.0, 6.09], "avg_grade": 6.0, "distance": 3500.0},
+    {"id": 4, "name": "Far away", "start_latlng": [46.0, 7.0], "end_latlng": [46.01, 7.0], "avg_grade": 8.0, "distance": 2000.0},
+    {"id": 5, "name": "Fiji", "start_latlng": [-17.0, -179.99], "end_latlng": [-17.0, -179.98], "avg_grade": 5.0, "distance": 900.0},
+]
+
+
+@pytest.fixture
+def index():
+    index = SegmentIndex()
+    index.add(SEGMENTS)
+    return index
+
+
+def test_within_returns_closest_first(index):
+    # When
+    rows, distances = index.within(45.0, 6.0, radius=5)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [1, 2, 3]
+    assert distances[1] == pytest.approx(2.224, abs=0.01)
+
+def test_within_filters_gradient_and_length(index):
+    # When
+    rows, distances = index.within(45.0, 6.0, radius=5, min_grade=5, max_distance=2000)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [1]
+
+def test_nearest_widens_the_search_until_k_segments(index):
+    # When
+    rows, distances = index.nearest(45.0, 6.01, k=3, max_radius=200)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [1, 2, 3]
+
+def test_nearest_crosses_the_antimeridian(index):
+    # When
+    rows, distances = index.nearest(-17.0, 179.99, k=1, max_radius=10)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [5]
+
+def test_along_keeps_segments_lying_along_the_route(index):
+    # When
+    rows, distances = index.along([45.0, 45.0], [6.04, 6.1], width=0.5)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [3]
+
+def test_readding_a_segment_moves_it(index):
+    # When
+    index.add([{**SEGMENTS[0], "start_latlng": [46.0, 7.01]}])
+
+    # Then
+    rows, _ = index.within(45.0, 6.0, radius=1)
+    assert len(rows) == 0
+    assert len(index) == 5
+    assert index.table.record(index.table.row_of(1))["start_latlng"] == [46.0, 7.01]
+
+def test_explored_tiles_expire_with_the_tile_cache():
+    # Given
+    index = SegmentIndex(tile_ttl=0.01)
+    index.add_tile("120", SEGMENTS[:1])
+
+    # When
+    fresh = (index.covers("120"), index.complete("1203"))
+    time.sleep(0.02)
+
+    # Then the area is explored again, its segments kept meanwhile
+    assert fresh == (True, True)
+    assert (index.covers("120"), index.complete("1203")) == (False, False)
+    assert len(index) == 1
+
+def test_segment_table_round_trips_segments():
+    # Given
+    table = SegmentTable.from_segments(SEGMENTS)
+
+    # When
+    table.add([{**SEGMENTS[2], "name": "Crête", "avg_grade": 7.0}])
+
+    # Then
+    assert len(table) == 5
+    assert table["avg_grade"].tolist() == [9.5, 2.0, 7.0, 8.0, 5.0]
+    assert table.record(2) == {
+        "id": 3,
+        "name": "Crête",
+        "distance": 3500.0,
+        "avg_grade": 7.0,
+        "elevation_difference": 0.0,
+        "climb_category": 0,
+        "start_latlng": [45.0, 6.05],
+        "end_latlng": [45.0, 6.09],
+    }
+
+def test_readding_unchanged_segments_does_not_grow_the_buffers(monkeypatch):
+    # Given
+    monkeypatch.setattr(segments, "COMPACT_MIN_BYTES", 64)
+    segment = {**SEGMENTS[0], "points": "_p~iF~ps|U_ulLnnqC"}
+    table = SegmentTable.from_segments([segment])
+    sizes = (len(table._names), len(table._points))
+
+    # When
+    for _ in range(1000):
+        table.add([segment])
+    unchanged = (len(table._names), len(table._points))
+    for number in range(1000):
+        table.add([{**segment, "name": f"Take-off climb {number}"}])
+
+    # Then renamed segments leave a bounded number of old names behind
+    assert len(table) == 1
+    assert unchanged == sizes
+    assert len(table._names) <= 2 * 64 + len("Take-off climb 999")
+    assert len(table._points) == sizes[1]
+    assert table.name(0) == "Take-off climb 999"
+    assert table.polyline(0) == segment["points"]
+
+def test_render_segments_pages_text_and_json():
+    # Given
+    table = SegmentTable.from_segments(SEGMENTS)
+
+    # When
+    text = render_segments(table, range(5), offset=1, limit=2)
+    page = render_segments(table, range(5), offset=4, limit=2, output="json", proximities=[0.0, 1.0, 2.0, 3.0, 4.0])
+
+    # Then
+    assert text.split("\n---\n")[0].startswith("Id: 2 - Name: Valley road")
+    assert text.endswith("Showing segments 2 to 3 of 5, pass offset=3 for more.")
+    assert page["total"] == 5 and page["offset"] == 4
+    assert [(segment["id"], segment["proximity_km"]) for segment in page["segments"]] == [(5, 4.0)]
+
+@pytest.mark.asyncio
+async def test_explore_uncovered_skips_covered_areas(monkeypatch):
+    # Given
+    box = (45.052859, 5.992628, 45.101033, 6.085844)
+    requested_urls = []
+
+    async def fake_make_strava_request(url):
+        requested_urls.append(url)
+        return {"segments": [{"id": 652851, "name": "Alpe d'Huez", "start_latlng": [45.0736, 6.0394]}]}
+
+    monkeypatch.setattr(explore, "make_strava_request", fake_make_strava_request)
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=64, ttl=60, store=None))
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+
+    # When
+    await explore.explore_uncovered(*box)
+    await explore.explore_uncovered(45.06, 6.0, 45.09, 6.08)
+
+    # Then
+    assert len(requested_urls) == len(covering_quadkeys(*box, max_tiles=9))
+    assert len(explore.segment_index) == 1
+
+@pytest.mark.asyncio
+async def test_explore_route_explores_stretches_of_a_long_route(monkeypatch):
+    # Given
+    explored = []
+
+    async def fake_explore_uncovered(*box, max_requests, budget):
+        explored.append(box)
+        return True
+
+    monkeypatch.setattr(explore, "explore_uncovered", fake_explore_uncovered)
+
+    # When
+    await explore.explore_route([45.0, 45.0, 45.5], [6.0, 6.5, 6.5], width=1)
+
+    # Then
+    assert len(explored) > 3
+    assert min(box[0] for box in explored) < 45.0 < 45.5 < max(box[2] for box in explored)
+
+@pytest.mark.asyncio
+async def test_explore_route_crosses_the_antimeridian_the_short_way(monkeypatch):
+    # Given
+    explored = []
+
+    async def fake_explore_uncovered(*box, max_requests, budget):
+        explored.append(box)
+        return True
+
+    monkeypatch.setattr(explore, "explore_uncovered", fake_explore_uncovered)
+
+    # When a 22 km route crosses the antimeridian
+    await explore.explore_route([0.0, 0.0], [179.9, -179.9], width=1)
+
+    # Then it is explored in a few boxes around it, not around the globe
+    assert 1 <= len(explored) <= 3
+    assert all(west > east and west > 179.8 and east < -179.8 or min(abs(west), abs(east)) > 179.8 for _, west, _, east in explored)
+
+@pytest.mark.asyncio
+async def test_explore_route_stretches_share_the_request_budget(monkeypatch):
+    # Given
+    requested_urls = []
+    monkeypatch.setattr(explore, "make_strava_request", dense_strava(requested_urls))
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=4096, ttl=60, store=None))
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+    monkeypatch.setattr(explore, "HARVEST_MAX_REQUESTS", 5)
+
+    # When a route of more stretches than requests is explored
+    explored = await explore.explore_route([45.0, 45.0, 45.5], [6.0, 6.5, 6.5], width=1)
+
+    # Then
+    assert explored
+    assert len(requested_urls) == 5
+
+
+def dense_strava(requested_urls):
+    """Fake explore endpoint over a grid of segments every 0.005°, returning at most 10 per box."""
+    async def fake_make_strava_request(url):
+        requested_urls.append(url)
+        bounds = url.split("bounds=")[1].split("&")[0]
+        south, west, north, east = (float(value) for value in bounds.split(","))
+        segments = [
+            {"id": row * 1000 + column, "name": f"{row}/{column}", "start_latlng": [row * 0.005, column * 0.005]}
+            for row in range(int(south / 0.005) + 1, int(north / 0.005) + 1)
+            for column in range(int(west / 0.005) + 1, int(east / 0.005) + 1)
+            if south <= row * 0.005 <= north and west <= column * 0.005 <= east
+        ]
+        return {"segments": segments[:10]}
+    return fake_make_strava_request
+
+@pytest.mark.asyncio
+async def test_harvest_splits_saturated_tiles(monkeypatch):
+    # Given
+    box = (45.0, 6.0, 45.012, 6.012)
+    requested_urls = []
+    monkeypatch.setattr(explore, "make_strava_request", dense_strava(requested_urls))
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=4096, ttl=60, store=None))
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+
+    # When
+    harvest = await explore.harvest_segments(*box, max_requests=500, max_zoom=18)
+    request_count = len(requested_urls)
+    again = await explore.harvest_segments(*box, max_requests=500, max_zoom=18)
+
+    # Then
+    assert harvest.complete
+    assert len(harvest.segments) == 9
+    assert len({segment["id"] for segment in harvest.segments}) == len(harvest.segments)
+    assert request_count > len(covering_quadkeys(*box, max_tiles=9))
+    assert (again.requests, len(again.segments)) == (0, 9)
+    assert len(requested_urls) == request_count
+
+@pytest.mark.asyncio
+async def test_harvest_stops_at_the_request_budget(monkeypatch):
+    # Given
+    box = (45.0, 6.0, 45.05, 6.05)
+    requested_urls = []
+    monkeypatch.setattr(explore, "make_strava_request", dense_strava(requested_urls))
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=4096, ttl=60, store=None))
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+
+    # When
+    harvest = await explore.harvest_segments(*box, max_requests=12, max_zoom=18)
+
+    # Then
+    assert not harvest.complete
+    assert harvest.requests == len(requested_urls) == 12
+    assert len(harvest.segments) > 10
@@ -0,0 +1,140 @@
+import pytest
+
+from src.cache.tiered import TieredCache
+from src.strava import explore
+from src.strava.index import SegmentIndex
+from src.strava.tiles import (
+    covering_quadkeys,
+    quadkey,
+    quadkey_to_tile,
+    tile_bounds,
+    tile_for,
+)
+
+
+def test_quadkey_round_trip():
+    # Given
+    x, y = tile_for(45.092, 6.069, 12)
+
+    # When
+    actual = quadkey_to_tile(quadkey(x, y, 12))
+
+    # Then
+    assert actual == (x, y, 12)
+
+def test_tile_bounds_contain_the_point():
+    # Given
+    latitude = 45.092
+    longitude = 6.069
+
+    # When
+    southwest_lat, southwest_lon, northeast_lat, northeast_lon = tile_bounds(*tile_for(latitude, longitude, 14), 14)
+
+    # Then
+    assert southwest_lat <= latitude <= northeast_lat
+    assert southwest_lon <= longitude <= northeast_lon
+
+def test_overlapping_boxes_share_tiles():
+    # Given
+    box = (45.052859, 5.992628, 45.101033, 6.085844)
+    shifted_box = (45.055, 5.995, 45.103, 6.088)
+
+    # When
+    quadkeys = covering_quadkeys(*box, max_tiles=9)
+    shifted_quadkeys = covering_quadkeys(*shifted_box, max_tiles=9)
+
+    # Then
+    assert len(quadkeys) <= 9
+    assert set(quadkeys) == set(shifted_quadkeys)
+
+def test_box_crossing_antimeridian_wraps_columns():
+    # When
+    quadkeys = covering_quadkeys(-1, 179.9, 1, -179.9, max_tiles=9)
+
+    # Then
+    columns = {quadkey_to_tile(key)[0] for key in quadkeys}
+    zoom = len(quadkeys[0])
+    assert columns == {0, (1 << zoom) - 1}
+
+@pytest.mark.asyncio
+async def test_boxes_too_large_for_the_tile_grid_are_explored_in_one_request(monkeypatch):
+    # Given
+    box = (42.0, -2.0, 48.0, 8.0)
+    requested_urls = []
+
+    async def fake_make_strava_request(url):
+        requested_urls.append(url)
+        return {"segments": [{"id": 652851, "name": "Alpe d'Huez", "start_latlng": [45.0736, 6.0394]}]}
+
+    monkeypatch.setattr(explore, "make_strava_request", fake_make_strava_request)
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+
+    # When
+    quadkeys = covering_quadkeys(*box, max_tiles=9)
+    segments = await explore.explore_segments(*box)
+    harvest = await explore.harvest_segments(*box)
+
+    # Then
+    assert quadkeys == []
+    assert [segment["id"] for segment in segments] == [652851]
+    assert (len(harvest.segments), harvest.requests, harvest.complete) == (1, 1, True)
+    assert len(requested_urls) == 2
+    assert "bounds=42.0,-2.0,48.0,8.0" in requested_urls[0]
+
+@pytest.mark.asyncio
+async def test_explore_segments_fetches_only_missing_tiles(monkeypatch):
+    # Given
+    box = (45.052859, 5.992628, 45.101033, 6.085844)
+    requested_urls = []
+
+    async def fake_make_strava_request(url):
+        requested_urls.append(url)
+        return {"segments": [
+            {"id": 652851, "name": "Alpe d'Huez", "start_latlng": [45.0736, 6.0394]},
+            {"id": 1, "name": "Elsewhere", "start_latlng": [46.0, 7.0]},
+        ]}
+
+    monkeypatch.setattr(explore, "make_strava_request", fake_make_strava_request)
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=64, ttl=60, store=None))
+
+    # When
+    first = await explore.explore_segments(*box)
+    first_request_count = len(requested_urls)
+    second = await explore.explore_segments(*box)
+
+    # Then
+    assert [segment["id"] for segment in first] == [652851]
+    assert second == first
+    assert first_request_count == len(covering_quadkeys(*box, max_tiles=9))
+    assert len(requested_urls) == first_request_count
+
+@pytest.mark.asyncio
+async def test_explore_segments_keeps_the_tiles_fetched_and_reports_outages(monkeypatch):
+    # Given
+    box = (45.052859, 5.992628, 45.101033, 6.085844)
+    requested_urls = []
+
+    async def flaky_make_strava_request(url):
+        requested_urls.append(url)
+        if len(requested_urls) == 1:
+            raise explore.UpstreamError("strava_api", "failed with status 503")
+        return {"segments": [{"id": 652851, "name": "Alpe d'Huez", "start_latlng": [45.0736, 6.0394]}]}
+
+    async def failing_make_strava_request(url):
+        raise explore.UpstreamError("strava_api", "failed with status 503")
+
+    monkeypatch.setattr(explore, "segment_index", SegmentIndex())
+
+    # When
+    monkeypatch.setattr(explore, "make_strava_request", flaky_make_strava_request)
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=64, ttl=60, store=None))
+    partial = await explore.explore_segments(*box)
+
+    monkeypatch.setattr(explore, "make_strava_request", failing_make_strava_request)
+    monkeypatch.setattr(explore, "segment_tile_cache", TieredCache("test", maxsize=64, ttl=60, store=None))
+    with pytest.raises(explore.UpstreamError) as outage:
+        await explore.explore_segments(*box)
+
+    # Then
+    assert [segment["id"] for segment in partial] == [652851]
+    assert str(outage.value) == "strava_api: failed with status 503"
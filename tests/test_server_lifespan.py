@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from src import server
+
+
+class FakePool:
+    def __init__(self, events):
+        self.events = events
+
+    async def start(self):
+        self.events.append("start")
+
+    async def aclose(self):
+        self.events.append("close")
+
+
+class FakeClimbAttemptsCache:
+    def __init__(self, events):
+        self.events = events
+
+    def warm(self, segment_ids):
+        pass
+
+    async def stop(self):
+        # Long enough for another session to open meanwhile
+        await asyncio.sleep(0.05)
+        self.events.append("stop")
+
+
+@pytest.mark.asyncio
+async def test_a_session_opening_during_the_teardown_waits_and_reopens_the_resources(monkeypatch):
+    # Given
+    events = []
+    pool = FakePool(events)
+    monkeypatch.setattr(server, "get_http_pool", lambda: pool)
+    monkeypatch.setattr(server, "climb_attempts_cache", FakeClimbAttemptsCache(events))
+    monkeypatch.setattr(server, "EVENT_LOOP_LAG_INTERVAL", 0)
+    monkeypatch.setattr(server, "METRICS_DUMP_PATH", "")
+    monkeypatch.setattr(server, "_lifespan_lock", asyncio.Lock())
+    for closer in ("close_cache_store", "close_geocoding_backend", "close_effort_store", "close_detail_store", "close_cpu_executor"):
+        monkeypatch.setattr(server, closer, lambda: None)
+
+    mcp = server.create_server()
+
+    async def session():
+        async with server.app_lifespan(mcp):
+            events.append("serve")
+
+    # When
+    first = asyncio.create_task(session())
+    await asyncio.sleep(0.01)
+    await session()
+    await first
+
+    # Then
+    assert events == ["start", "serve", "stop", "close", "start", "serve", "stop", "close"]
+    assert server._open_sessions == 0
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from src.clients.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_call():
+    # Given
+    flights = SingleFlight("test")
+    upstream_calls = []
+
+    async def fetch():
+        upstream_calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"lat": "45.0"}
+
+    # When
+    results = await asyncio.gather(*(flights.do("galibier", fetch) for _ in range(5)))
+
+    # Then
+    assert len(upstream_calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats() == {"calls": 5, "coalesced": 4, "in_flight": 0}
+
+@pytest.mark.asyncio
+async def test_exceptions_are_shared_and_not_cached():
+    # Given
+    flights = SingleFlight("test")
+
+    async def failing():
+        await asyncio.sleep(0)
+        raise ValueError("upstream down")
+
+    async def succeeding():
+        return 1
+
+    # When
+    results = await asyncio.gather(flights.do("key", failing), flights.do("key", failing), return_exceptions=True)
+    retried = await flights.do("key", succeeding)
+
+    # Then
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_others():
+    # Given
+    flights = SingleFlight("test")
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    first = asyncio.create_task(flights.do("key", fetch))
+    second = asyncio.create_task(flights.do("key", fetch))
+    await asyncio.sleep(0)
+
+    # When
+    first.cancel()
+
+    # Then
+    assert await second == "done"
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / "src"
+
+# Only needed by some tools, they must be imported on first use
+HEAVY_MODULES = ("numpy", "pandas", "bs4", "aiohttp")
+
+
+def test_server_import_leaves_heavy_dependencies_unloaded():
+    # Given
+    script = f"import sys, server; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+
+    # When
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=SRC, capture_output=True, text=True, check=True
+    )
+
+    # Then
+    assert result.stdout.split() == []
+
+def test_parse_workers_importing_the_server_as_their_main_build_no_server():
+    # Given the way spawned workers run the main module of their parent
+    script = (
+        "import gc, runpy; from mcp.server.fastmcp import FastMCP; runpy.run_path('server.py', run_name='__mp_main__'); "
+        "print(sum(isinstance(o, FastMCP) for o in gc.get_objects()))"
+    )
+
+    # When
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=SRC, capture_output=True, text=True, check=True
+    )
+
+    # Then
+    assert result.stdout.split() == ["0"]
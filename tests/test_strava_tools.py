@@ -1,7 +1,13 @@
+import asyncio
+
 import pytest
 
+from src.strava.index import SegmentIndex
+from src.tools import strava
 from src.tools.strava import (
+    find_segments_near_address,
     get_nearby_segments,
+    get_number_of_climb_attempts_for_segments,
     get_number_of_climb_attempts_on_the_year,
 )
 
@@ -51,3 +57,97 @@ async def test_get_nearby_segments_returns_segments():
 
     # Then
     assert actual_result == expected_result
+
+@pytest.mark.asyncio
+async def test_get_number_of_climb_attempts_for_segments_streams_results(monkeypatch):
+    # Given
+    delays = {7037936: 0.05, 12349239: 0.0}
+
+    async def fake_fetch_climb_attempts(segment_id):
+        if segment_id not in delays:
+            raise strava.UpstreamError("Strava", f"unable to fetch the leaderboard of segment {segment_id}")
+        await asyncio.sleep(delays[segment_id])
+        return {'last_month_climbs_attempts': 1, 'beginning_of_the_year_climbs_attempts': 2}
+
+    monkeypatch.setattr(strava, "fetch_climb_attempts", fake_fetch_climb_attempts)
+    streamed = []
+
+    async def on_result(result):
+        streamed.append(result["segment_id"])
+
+    # When
+    results = await get_number_of_climb_attempts_for_segments([7037936, 12349239, 1, 7037936], on_result=on_result)
+
+    # Then
+    assert [result["segment_id"] for result in results] == [7037936, 12349239, 1]
+    assert streamed.index(12349239) < streamed.index(7037936)
+    assert results[0]["beginning_of_the_year_climbs_attempts"] == 2
+    assert results[2]["error"] == "Strava: unable to fetch the leaderboard of segment 1"
+
+@pytest.mark.asyncio
+async def test_get_number_of_climb_attempts_for_segments_does_not_hide_programming_errors(monkeypatch):
+    # Given
+    async def broken_fetch_climb_attempts(segment_id):
+        raise TypeError("unsupported operand")
+
+    monkeypatch.setattr(strava, "fetch_climb_attempts", broken_fetch_climb_attempts)
+
+    # When / Then
+    with pytest.raises(TypeError):
+        await get_number_of_climb_attempts_for_segments([1])
+
+@pytest.mark.asyncio
+async def test_find_segments_near_address_geocodes_searches_and_counts_attempts(monkeypatch):
+    # Given
+    index = SegmentIndex()
+    index.add([
+        {"id": 652851, "name": "Alpe d'Huez", "distance": 12024.9, "avg_grade": 8.8, "start_latlng": [45.0553, 6.0309], "end_latlng": [45.0909, 6.0678]},
+        {"id": 24847998, "name": "La Garde -> Huez Village", "distance": 6259.4, "avg_grade": 7.7, "start_latlng": [45.0610, 6.0350], "end_latlng": [45.0890, 6.0640]},
+        {"id": 1, "name": "Far away", "distance": 1000.0, "avg_grade": 5.0, "start_latlng": [46.0, 7.0], "end_latlng": [46.01, 7.0]},
+    ])
+    explored = []
+
+    async def fake_get_latitude_and_longitude(address):
+        return 45.0553, 6.0309
+
+    async def fake_explore_uncovered(*box):
+        explored.append(box)
+
+    async def fake_fetch_climb_attempts(segment_id):
+        if segment_id == 24847998:
+            raise strava.UpstreamError("Strava", f"unable to fetch the leaderboard of segment {segment_id}")
+        return {'last_month_climbs_attempts': 3, 'beginning_of_the_year_climbs_attempts': 40}
+
+    monkeypatch.setattr(strava, "get_latitude_and_longitude", fake_get_latitude_and_longitude)
+    monkeypatch.setattr(strava, "explore_uncovered", fake_explore_uncovered)
+    monkeypatch.setattr(strava, "fetch_climb_attempts", fake_fetch_climb_attempts)
+    monkeypatch.setattr(strava, "segment_index", index)
+
+    # When
+    text = await find_segments_near_address("Bourg-d'Oisans", radius=5, include_attempts=True)
+    page = await find_segments_near_address("Bourg-d'Oisans", radius=5, min_grade=8, output="json")
+
+    # Then
+    assert len(explored) == 2
+    lines = text.split("\n---\n")
+    assert lines[0].startswith("Segments within 5 km of Bourg-d'Oisans (45.05530, 6.03090):\nId: 652851")
+    assert lines[0].endswith("Climb attempts: 3 last month, 40 this year")
+    assert lines[1].endswith("Climb attempts unavailable")
+    assert len(lines) == 2
+    assert page["location"] == {"address": "Bourg-d'Oisans", "latitude": 45.0553, "longitude": 6.0309}
+    assert [segment["id"] for segment in page["segments"]] == [652851]
+    assert "climb_attempts" not in page["segments"][0]
+
+@pytest.mark.asyncio
+async def test_find_segments_near_address_reports_unknown_addresses(monkeypatch):
+    # Given
+    async def fake_get_latitude_and_longitude(address):
+        raise ValueError(f"Unable to fetch latitude and longitude for address: {address}")
+
+    monkeypatch.setattr(strava, "get_latitude_and_longitude", fake_get_latitude_and_longitude)
+
+    # When
+    result = await find_segments_near_address("Nowhere", output="json")
+
+    # Then
+    assert result == {"error": "Unable to fetch latitude and longitude for address: Nowhere"}
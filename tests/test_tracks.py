@@ -0,0 +1,204 @@
+import io
+import math
+
+import numpy as np
+import pytest
+
+from src.strava.index import SegmentIndex
+from src.tools import strava
+from src.tools.strava import find_segments_on_track
+from src.tracks import parsers
+from src.tracks.corridor import TrackCorridor
+from src.tracks.parsers import detect_format, parse_track, read_gpx, read_igc
+
+# North along 6.0 from 45.0 to 45.1, then east along 45.1 to 6.1, a fix every 55 m
+TRACK = [(45.0 + i * 0.0005, 6.0) for i in range(200)] + [(45.1, 6.0 + i * 0.0005) for i in range(201)]
+
+IGC = b"""AXCT7f3d2a9e
+HFDTEDATE:150725,01
+B0954334506123N00612345EA0123401300
+B0954344506123N00612345EA0123401302
+B0954354506789S00601234WV0130100000
+LCONFLIGHTEND
+"""
+
+
+def gpx(points, name="Morning hike", elevation=True):
+    fixes = "".join(
+        f'<trkpt lat="{latitude}" lon="{longitude}">' + (f"<ele>{1000 + index}</ele>" if elevation else "") + "</trkpt>"
+        for index, (latitude, longitude) in enumerate(points)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<gpx version="1.1" creator="test" xmlns="http://www.topografix.com/GPX/1/1">'
+        f"<metadata><name>Export</name></metadata><trk><name>{name}</name><trkseg>{fixes}</trkseg></trk></gpx>"
+    )
+
+
+def encode_polyline(points):
+    """Encode (latitude, longitude) points, the inverse of geometry.decode_polyline."""
+    encoded, previous = [], (0, 0)
+    for point in points:
+        values = [round(coordinate * 1e5) for coordinate in point]
+        for value, last in zip(values, previous):
+            delta = value - last
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                encoded.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            encoded.append(chr(delta + 63))
+        previous = values
+    return "".join(encoded)
+
+
+def segment(segment_id, points, with_polyline=True):
+    return {
+        "id": segment_id,
+        "name": f"Segment {segment_id}",
+        "distance": 1000.0,
+        "avg_grade": 5.0,
+        "start_latlng": list(points[0]),
+        "end_latlng": list(points[-1]),
+        "points": encode_polyline(points) if with_polyline else None,
+    }
+
+
+SEGMENTS = [
+    # Ridden north along the track
+    segment(1, [(45.01 + i * 0.005, 6.0) for i in range(9)]),
+    # The same road, ridden the other way
+    segment(2, [(45.05 - i * 0.005, 6.0) for i in range(9)]),
+    # Starts and ends on the track, but leaves it in between
+    segment(3, [(45.06, 6.0), (45.065, 6.01), (45.07, 6.012), (45.075, 6.01), (45.08, 6.0)]),
+    # On the eastward leg, its polyline unknown
+    segment(4, [(45.1, 6.02), (45.1, 6.06)], with_polyline=False),
+    segment(5, [(46.0, 7.0), (46.01, 7.0)]),
+]
+
+
+def test_gpx_is_read_and_simplified():
+    # When
+    track = read_gpx(io.BytesIO(gpx(TRACK).encode()), min_spacing=0.005, tolerance=0.01)
+
+    # Then
+    assert track.name == "Morning hike"
+    assert track.fixes == len(TRACK)
+    assert list(zip(track.latitudes.tolist(), track.longitudes.tolist())) == pytest.approx([(45.0, 6.0), (45.1, 6.0), (45.1, 6.1)])
+    assert track.elevations.dtype == np.float32
+    assert track.elevations.tolist() == [1000, 1200, 1400]
+    assert track.length == pytest.approx(11.12 + 7.86, abs=0.05)
+
+def test_long_tracks_are_simplified_a_chunk_at_a_time(monkeypatch):
+    # Given
+    monkeypatch.setattr(parsers, "CHUNK_FIXES", 50)
+    content = gpx(TRACK, elevation=False).encode()
+
+    # When
+    track = read_gpx(io.BytesIO(content), min_spacing=0.005, tolerance=0.01)
+
+    # Then chunk ends are kept, the corner and both ends too
+    assert track.fixes == len(TRACK)
+    assert 3 < len(track) <= len(TRACK) // 49 + 4
+    assert (track.latitudes[0], track.longitudes[0]) == (45.0, 6.0)
+    assert (track.latitudes[-1], track.longitudes[-1]) == (45.1, 6.1)
+    assert (45.1, 6.0) in zip(track.latitudes.tolist(), track.longitudes.tolist())
+    assert track.summary()["min_elevation"] is None
+
+def test_igc_b_records_are_decoded():
+    # When
+    track = read_igc(io.BytesIO(IGC), min_spacing=0.005, tolerance=0.0)
+
+    # Then the repeated fix is dropped, the last one kept anyway
+    assert track.fixes == 3
+    assert track.latitudes.tolist() == pytest.approx([45 + 6.123 / 60, -(45 + 6.789 / 60)])
+    assert track.longitudes.tolist() == pytest.approx([6 + 12.345 / 60, -(6 + 1.234 / 60)])
+    assert track.elevations.tolist() == [1300, 1301]
+
+def test_formats_are_told_apart_and_malformed_files_rejected():
+    # Then
+    assert detect_format(b"", "flight.IGC") == "igc"
+    assert detect_format(b"\xef\xbb\xbf  <?xml version") == "gpx"
+    assert detect_format(IGC[:64]) == "igc"
+    with pytest.raises(ValueError):
+        detect_format(b"lat,lon\n45.0,6.0")
+    with pytest.raises(ValueError):
+        parse_track(b"<gpx><trk><trkseg><trkpt lat='45.0'/></trkseg></trk></gpx>")
+    with pytest.raises(ValueError):
+        parse_track(b"<gpx><trk>")
+    with pytest.raises(ValueError):
+        parse_track(b"AXCT\nB0954334506")
+
+def test_corridor_holds_the_points_along_the_track_and_when_they_are_passed():
+    # Given
+    latitudes, longitudes = np.array([45.0, 45.1, 45.1]), np.array([6.0, 6.0, 6.1])
+
+    # When
+    corridor = TrackCorridor(latitudes, longitudes, width=0.05)
+
+    # Then
+    assert corridor.contains(np.array([45.05, 45.05, 45.05, 45.1]), np.array([6.0, 6.0006, 6.003, 6.05])).tolist() == [True, True, False, True]
+    assert corridor.first_visits(np.array([45.05, 45.2]), np.array([6.0, 6.0])) == pytest.approx([5.56, math.nan], abs=0.2, nan_ok=True)
+    assert corridor.last_visits(np.array([45.1]), np.array([6.1])) == pytest.approx([corridor.length], abs=0.1)
+
+def test_segments_are_matched_when_the_track_rode_them_in_order():
+    # Given
+    index = SegmentIndex()
+    index.add(SEGMENTS)
+    corridor = TrackCorridor(np.array([45.0, 45.1, 45.1]), np.array([6.0, 6.0, 6.1]), width=0.05)
+
+    # When
+    rows, distances, overlaps = index.on_track(corridor, min_overlap=0.8)
+
+    # Then
+    assert index.table.ids[rows].tolist() == [1, 4]
+    assert distances == pytest.approx([1.11, 12.69], abs=0.2)
+    assert overlaps[0] == 1.0 and math.isnan(overlaps[1])
+
+@pytest.mark.asyncio
+async def test_find_segments_on_track_reads_explores_and_matches(monkeypatch, tmp_path):
+    # Given
+    index = SegmentIndex()
+    index.add(SEGMENTS)
+    explored = []
+
+    async def fake_explore_route(latitudes, longitudes, width):
+        explored.append(len(latitudes))
+        return True
+
+    monkeypatch.setattr(strava, "explore_route", fake_explore_route)
+    monkeypatch.setattr(strava, "segment_index", index)
+    monkeypatch.setattr(strava, "TRACK_DIR", str(tmp_path))
+    (tmp_path / "hike.gpx").write_text(gpx(TRACK))
+
+    # When
+    text = await find_segments_on_track(path="hike.gpx")
+    page = await find_segments_on_track(content=gpx(TRACK), output="json")
+    missing = await find_segments_on_track()
+
+    # Then
+    assert explored == [3, 3]
+    assert text.startswith("Segments ridden along the track (Morning hike, 401 fixes, 19.0 km):\nId: 1")
+    assert "km into the track" in text
+    assert page["track"]["points"] == 3 and page["track"]["max_elevation"] == 1400
+    assert [(record["id"], record["overlap"]) for record in page["segments"]] == [(1, 1.0), (4, None)]
+    assert missing == "Pass either the content of a track file or its path."
+
+@pytest.mark.asyncio
+async def test_track_files_are_only_read_within_the_track_directory(monkeypatch, tmp_path):
+    # Given
+    tracks = tmp_path / "tracks"
+    tracks.mkdir()
+    secret = tmp_path / "secret.gpx"
+    secret.write_text(gpx(TRACK))
+    (tracks / "link.gpx").symlink_to(secret)
+    (tracks / "broken.gpx").write_text("<gpx><trk>")
+
+    # When
+    monkeypatch.setattr(strava, "TRACK_DIR", "")
+    disabled = await find_segments_on_track(path=str(secret))
+    monkeypatch.setattr(strava, "TRACK_DIR", str(tracks))
+    refused = [await find_segments_on_track(path=path) for path in (str(secret), "../secret.gpx", "link.gpx", "missing.gpx", "broken.gpx")]
+
+    # Then nothing tells whether a file exists or what it holds
+    assert disabled == "Track files cannot be read by path on this server, pass their content."
+    assert refused == ["Unable to read the track file."] * 5